@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+import resource
+
+benchmarkFolderEnv = os.environ.setdefault("BENCHMARKFOLDER", tempfile.mkdtemp(prefix="cvaBenchmark"))
+if not os.path.isdir(benchmarkFolderEnv):
+    os.makedirs(benchmarkFolderEnv)
+benchmarkSettings = {}
+for settingName, settingType, defaultValue in [("BENCHMARKSAMPLES", int, "20"), ("BENCHMARKVARIANTS", int, "200"), ("BENCHMARKINDELFRACTION", float, "0.1"), ("BENCHMARKMEANDEPTH", float, "1000"), ("BENCHMARKDEPTHDISPERSION", float, "2"), ("BENCHMARKSEED", int, "0")]:
+    settingValue = os.environ.setdefault(settingName, defaultValue)
+    try:
+        benchmarkSettings[settingName] = settingType(settingValue)
+    except ValueError:
+        raise ValueError("%s must be a %s value. Got %s" %(settingName, settingType.__name__, settingValue))
+benchmarkMemoryEnv = os.environ.setdefault("BENCHMARKMEMORY", "true").lower()
+if benchmarkMemoryEnv not in ["true", "false"]:
+    raise ValueError("BENCHMARKMEMORY must be either true or false. Got %s" %benchmarkMemoryEnv)
+benchmarkMemoryEnv = benchmarkMemoryEnv == "true"
+for folderName in ["filteredVCF", "syntheticVEP"]:
+    if not os.path.isdir(os.path.join(benchmarkFolderEnv, folderName)):
+        os.mkdir(os.path.join(benchmarkFolderEnv, folderName))
+os.environ["WORKINGFOLDER"] = benchmarkFolderEnv
+os.environ.setdefault("VEPCACHE", "false")
+os.environ.setdefault("RESUME", "false")
+
+import cvaSupport
+import main
+
+vepStandInPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vepStandIn.py")
+cvaSupport.vepRunner.vepPath = vepStandInPath
+
+
+def runStage(stageName:str, function, recordCount:int, sampleCount:int, traceMemory:bool=benchmarkMemoryEnv, required:bool=False):
+    startTime = time.perf_counter()
+    try:
+        result = function()
+    except Exception as error:
+        if required:
+            raise
+        print("WARNING: Benchmark stage %s failed: %s" %(stageName, repr(error)), file=sys.stderr)
+        return None, {"stage": stageName, "seconds": time.perf_counter() - startTime, "samplesPerSecond": None, "recordsPerSecond": None, "peakTracedBytes": None, "error": repr(error)}
+    elapsed = time.perf_counter() - startTime
+    peakBytes = None
+    if traceMemory:
+        tracemalloc.start()
+        try:
+            function()
+            peakBytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    stageReport = {
+        "stage": stageName,
+        "seconds": elapsed,
+        "samplesPerSecond": sampleCount / elapsed if elapsed else None,
+        "recordsPerSecond": recordCount / elapsed if elapsed else None,
+        "peakTracedBytes": peakBytes,
+        "error": None
+    }
+    return result, stageReport
+
+
+def runBenchmark(settings:dict=benchmarkSettings, benchmarkFolder:str=benchmarkFolderEnv):
+    stageReports = []
+    cohort = cvaSupport.syntheticCohort.SyntheticCohort(settings["BENCHMARKSAMPLES"], settings["BENCHMARKVARIANTS"], settings["BENCHMARKINDELFRACTION"], settings["BENCHMARKMEANDEPTH"], settings["BENCHMARKDEPTHDISPERSION"], settings["BENCHMARKSEED"])
+    sampleCount = cohort.samples
+    recordCount = cohort.samples * cohort.variantsPerSample
+    samplePaths, stageReport = runStage("generate synthetic cohort", lambda: cohort.writeCohort(main.inputFolderEnv, os.path.join(benchmarkFolder, "syntheticVEP")), recordCount, sampleCount, False, required=True)
+    stageReports.append(stageReport)
+    vcfPaths = [vcfPath for vcfPath, vepPath in samplePaths]
+    vepPaths = [vepPath for vcfPath, vepPath in samplePaths]
+    vcfTables, stageReport = runStage("vcfHandler.processVCF", lambda: [{variantRecord.vepIdentifier: variantRecord for variantRecord in cvaSupport.vcfHandler.processVCF(vcfPath)} for vcfPath in vcfPaths], recordCount, sampleCount, required=True)
+    stageReports.append(stageReport)
+    for vcfTable in vcfTables:
+        cvaSupport.vcfHandler.computeBiasStatistics(vcfTable.values())
+    stageReports.append(runStage("main.runVEP (stand-in)", lambda: [main.runVEP(vcfPath) for vcfPath in vcfPaths], recordCount, sampleCount, False)[1])
+    vepTables, stageReport = runStage("vepHandler.processVEPTable", lambda: [cvaSupport.vepHandler.processVEPTable(vepPath) for vepPath in vepPaths], recordCount, sampleCount, required=True)
+    stageReports.append(stageReport)
+    mergedResultLists, stageReport = runStage("mergeVCFandVEPTables", lambda: [cvaSupport.mutationDataMerge.mergeVCFandVEPTables(vcfTable, vepTable) for vcfTable, vepTable in zip(vcfTables, vepTables)], recordCount, sampleCount, required=True)
+    stageReports.append(stageReport)
+    siteAnnotationTrack = main.getSiteAnnotationTrack()
+    stageReports.append(runStage("applySiteWarnings", lambda: [cvaSupport.problematicSites.applySiteWarnings(mergedResults, annotationTrack=siteAnnotationTrack) for mergedResults in mergedResultLists], recordCount, sampleCount)[1])
+    matcher = main.getVariantsOfConcernMatcher()
+    strainObservationsList, stageReport = runStage("applyVariantsOfConcern", lambda: [cvaSupport.variantsOfConcernHandler.applyVariantsOfConcern(mergedResults, matcher=matcher) for mergedResults in mergedResultLists], recordCount, sampleCount, required=True)
+    stageReports.append(stageReport)
+    sampleIDs = [cohort.sampleName(sampleNumber) for sampleNumber in range(sampleCount)]
+    mutationRecordTable = dict(zip(sampleIDs, mergedResultLists))
+    strainObservationsTable = dict(zip(sampleIDs, strainObservationsList))
+    for betaFitMethod in cvaSupport.betaFitting.fitMethods:
+        stageReports.append(runStage("main.writeBetaTable (%s)" %betaFitMethod, lambda: main.writeBetaTable(mutationRecordTable, betaFitMethod, 1), recordCount, sampleCount)[1])
+    stageReports.append(runStage("main.writeVariantTables", lambda: main.writeVariantTables(mutationRecordTable), recordCount, sampleCount)[1])
+    stageReports.append(runStage("main.writeStrainObservationTables", lambda: main.writeStrainObservationTables(strainObservationsTable), recordCount, sampleCount)[1])
+    stageReports.append(runStage("main.writeVarShare", lambda: main.writeVarShare(mutationRecordTable), recordCount, sampleCount)[1])
+    for exportFormat in cvaSupport.cohortExport.exportFormats:
+        if exportFormat == "parquet" and cvaSupport.cohortExport.pyarrow is None:
+            continue
+        stageReports.append(runStage("main.writeCohortExport (%s)" %exportFormat, lambda: main.writeCohortExport(mutationRecordTable, exportFormat), recordCount, sampleCount)[1])
+    report = {
+        "settings": settings,
+        "samples": sampleCount,
+        "records": recordCount,
+        "maxResidentKilobytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stages": stageReports
+    }
+    reportPath = os.path.join(benchmarkFolder, "benchmarkReport.json")
+    reportFile = open(reportPath, 'w')
+    json.dump(report, reportFile, indent=4)
+    reportFile.close()
+    return report, reportPath
+
+
+def printReport(report:dict):
+    print("%s synthetic samples, %s variant records" %(report["samples"], report["records"]))
+    print("%-40s %10s %12s %14s %14s" %("Stage", "Seconds", "Samples/s", "Records/s", "Peak MiB"))
+    for stageReport in report["stages"]:
+        if stageReport["error"]:
+            print("%-40s %10.3f %12s %14s %14s  FAILED: %s" %(stageReport["stage"], stageReport["seconds"], "-", "-", "-", stageReport["error"]))
+            continue
+        if stageReport["peakTracedBytes"] is None:
+            peakMemory = "-"
+        else:
+            peakMemory = "%.2f" %(stageReport["peakTracedBytes"] / 1048576)
+        print("%-40s %10.3f %12.1f %14.0f %14s" %(stageReport["stage"], stageReport["seconds"], stageReport["samplesPerSecond"] or 0, stageReport["recordsPerSecond"] or 0, peakMemory))
+    print("Maximum resident set size: %.1f MiB" %(report["maxResidentKilobytes"] / 1024))
+
+
+if __name__ == "__main__":
+    report, reportPath = runBenchmark()
+    printReport(report)
+    print("Report written to %s" %reportPath, file=sys.stderr)
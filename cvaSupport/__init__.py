@@ -1,12 +1,23 @@
-__all__ = ["fileHandling", "referenceGenomeHandler", "viralVariantHandler", "vcfHandler", "vepHandler", "vepRunner", "mutationDataMerge", "problematicSites", "variantsOfConcernHandler"]
+__all__ = ["fileHandling", "referenceGenomeHandler", "viralVariantHandler", "biasStatistics", "vcfHandler", "vcfIngestion", "vepHandler", "vepCache", "vepRunner", "nativeAnnotator", "mutationDataMerge", "csqIngestion", "annotationTracks", "problematicSites", "variantsOfConcernHandler", "runManifest", "cohortExport", "betaFitting", "syntheticCohort", "instrumentation"]
 
 from . import fileHandling
 from . import referenceGenomeHandler
 from . import viralVariantHandler
+from . import biasStatistics
 from . import vcfHandler
+from . import vcfIngestion
 from . import vepHandler
+from . import vepCache
 from . import vepRunner
+from . import nativeAnnotator
 from . import mutationDataMerge
+from . import csqIngestion
+from . import annotationTracks
 from . import problematicSites
 from . import variantsOfConcernHandler
-from . import freyjaVCFModder
\ No newline at end of file
+from . import freyjaVCFModder
+from . import runManifest
+from . import cohortExport
+from . import betaFitting
+from . import syntheticCohort
+from . import instrumentation
\ No newline at end of file
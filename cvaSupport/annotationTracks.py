@@ -0,0 +1,153 @@
+import os
+import re
+import typing
+import numpy
+try:
+    import fileHandling
+except ImportError:
+    from . import fileHandling
+
+
+defaultGenomeLength = 29903
+maxLabels = 64
+
+
+class AnnotationTrack:
+
+    def __init__(self, genomeLength:int=defaultGenomeLength, labels:typing.List[str]=None, flags:numpy.ndarray=None):
+        self.genomeLength = genomeLength
+        if labels is None:
+            labels = []
+        self.labels = list(labels)
+        if flags is None:
+            flags = numpy.zeros(genomeLength + 1, dtype=numpy.uint64)
+        self.flags = flags
+
+    def getLabelBit(self, label:str):
+        if not label in self.labels:
+            if len(self.labels) >= maxLabels:
+                raise ValueError("Annotation tracks can only hold %s distinct labels" %maxLabels)
+            self.labels.append(label)
+        return numpy.uint64(1 << self.labels.index(label))
+
+    def labelMask(self, labelPrefix:str):
+        mask = numpy.uint64(0)
+        for index, label in enumerate(self.labels):
+            if label.startswith(labelPrefix + ":") or label == labelPrefix:
+                mask |= numpy.uint64(1 << index)
+        return mask
+
+    def setLabel(self, start:int, end:int, label:str, replacePrefix:str=None):
+        start = max(start, 1)
+        end = min(end, self.genomeLength)
+        if start > end:
+            return
+        if replacePrefix:
+            self.flags[start:end + 1] &= ~self.labelMask(replacePrefix)
+        self.flags[start:end + 1] |= self.getLabelBit(label)
+
+    def addVCFMask(self, vcfPath:str, prefix:str="ProblemSite"):
+        if not os.path.isfile(vcfPath):
+            raise FileNotFoundError("Unable to find mask VCF at %s" %vcfPath)
+        for line in fileHandling.iterLines(vcfPath):
+            line = line.decode()
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                continue
+            lineSplit = line.rstrip("\r\n").split("\t")
+            position = int(lineSplit[1])
+            filterValue = lineSplit[6]
+            self.setLabel(position, position, "%s:%s" %(prefix, filterValue), replacePrefix=prefix)
+
+    def addBEDMask(self, bedPath:str, prefix:str):
+        if not os.path.isfile(bedPath):
+            raise FileNotFoundError("Unable to find mask BED at %s" %bedPath)
+        for line in fileHandling.iterLines(bedPath):
+            line = line.decode()
+            if not line.strip():
+                continue
+            if line.startswith("#") or line.startswith("track") or line.startswith("browser"):
+                continue
+            lineSplit = line.rstrip("\r\n").split("\t")
+            start = int(lineSplit[1]) + 1
+            end = int(lineSplit[2])
+            self.setLabel(start, end, prefix)
+
+    def addMask(self, maskPath:str, prefix:str):
+        lowerPath = maskPath.lower()
+        if lowerPath.endswith(".bed") or lowerPath.endswith(".bed.gz"):
+            self.addBEDMask(maskPath, prefix)
+        else:
+            self.addVCFMask(maskPath, prefix)
+
+    def lookup(self, positions:typing.Sequence[int]):
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        inGenome = (positions >= 1) & (positions <= self.genomeLength)
+        positionFlags = numpy.zeros(len(positions), dtype=numpy.uint64)
+        positionFlags[inGenome] = self.flags[positions[inGenome]]
+        return positionFlags
+
+    def labelsForFlags(self, flagValue:int):
+        flagValue = int(flagValue)
+        return [label for index, label in enumerate(self.labels) if flagValue & (1 << index)]
+
+    def labelsForPositions(self, positions:typing.Sequence[int]):
+        labelLists = [[] for position in positions]
+        positionFlags = self.lookup(positions)
+        for index in numpy.flatnonzero(positionFlags):
+            labelLists[index] = self.labelsForFlags(positionFlags[index])
+        return labelLists
+
+    def save(self, outputPath:str, fingerprint:str=""):
+        outputFile = open(outputPath, 'wb')
+        numpy.savez_compressed(outputFile, flags=self.flags, labels=numpy.array(self.labels, dtype=str), genomeLength=self.genomeLength, fingerprint=fingerprint)
+        outputFile.close()
+
+    @classmethod
+    def load(cls, inputPath:str):
+        archive = numpy.load(inputPath)
+        track = cls(int(archive["genomeLength"]), [str(label) for label in archive["labels"]], archive["flags"])
+        fingerprint = str(archive["fingerprint"])
+        archive.close()
+        return track, fingerprint
+
+
+def parseMaskSpecs(maskSpecString:str):
+    maskSpecs = []
+    for maskSpec in maskSpecString.split(","):
+        maskSpec = maskSpec.strip()
+        if not maskSpec:
+            continue
+        if "=" in maskSpec:
+            prefix, maskPath = maskSpec.split("=", 1)
+        else:
+            maskPath = maskSpec
+            prefix = re.sub(r"\W", "_", os.path.basename(maskPath).split(".")[0])
+        maskSpecs.append((prefix.strip(), maskPath.strip()))
+    return maskSpecs
+
+
+def buildAnnotationTrack(maskSpecs:typing.List[typing.Tuple[str, str]], genomeLength:int=defaultGenomeLength):
+    track = AnnotationTrack(genomeLength)
+    for prefix, maskPath in maskSpecs:
+        track.addMask(maskPath, prefix)
+    return track
+
+
+def loadAnnotationTrack(maskSpecs:typing.List[typing.Tuple[str, str]], cacheFolder:str="", genomeLength:int=defaultGenomeLength):
+    fingerprint = fileHandling.hashFiles([maskPath for prefix, maskPath in maskSpecs], [prefix for prefix, maskPath in maskSpecs] + [genomeLength])
+    cachePath = os.path.join(cacheFolder, "annotationTrack.npz")
+    if cacheFolder and os.path.isfile(cachePath):
+        try:
+            track, cachedFingerprint = AnnotationTrack.load(cachePath)
+            if cachedFingerprint == fingerprint:
+                return track
+        except (OSError, ValueError, KeyError):
+            pass
+    track = buildAnnotationTrack(maskSpecs, genomeLength)
+    if cacheFolder and os.path.isdir(cacheFolder):
+        temporaryPath = "%s.%s.tmp" %(cachePath, os.getpid())
+        track.save(temporaryPath, fingerprint)
+        os.replace(temporaryPath, cachePath)
+    return track
@@ -0,0 +1,97 @@
+import concurrent.futures
+import math
+import typing
+import warnings
+import numpy
+import scipy.stats
+
+
+fitMethods = ["moments", "mle", "legacy"]
+failedFit = (math.nan, math.nan, math.nan, math.nan, "failed")
+
+
+def fitMoments(values:typing.Sequence[float]):
+    values = numpy.asarray(values, dtype=float)
+    if len(values) < 2:
+        raise ValueError("Method of moments beta fitting needs at least two values")
+    mean = values.mean()
+    variance = values.var(ddof=1)
+    if not 0 < mean < 1 or not 0 < variance < mean * (1 - mean):
+        raise ValueError("Values have no method of moments beta fit (mean %s, variance %s)" %(mean, variance))
+    common = mean * (1 - mean) / variance - 1
+    return mean * common, (1 - mean) * common, 0.0, 1.0
+
+
+def squeezeUnitInterval(values:typing.Sequence[float]):
+    values = numpy.asarray(values, dtype=float)
+    return (values * (len(values) - 1) + 0.5) / len(values)
+
+
+def fitFixedMLE(values:typing.Sequence[float]):
+    values = squeezeUnitInterval(values)
+    alphaStart, betaStart, lowerLimit, scale = fitMoments(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        alpha, beta, lowerLimit, scale = scipy.stats.beta.fit(values, alphaStart, betaStart, floc=0, fscale=1)
+    return float(alpha), float(beta), float(lowerLimit), float(scale)
+
+
+def fitLegacy(values:typing.Sequence[float]):
+    return scipy.stats.beta.fit(values)
+
+
+fitFunctions = {
+    "moments": fitMoments,
+    "mle": fitFixedMLE,
+    "legacy": fitLegacy
+}
+
+
+def fitBeta(values:typing.Sequence[float], method:str="legacy"):
+    if not method in fitMethods:
+        raise ValueError("Beta fitting method must be one of %s. Got %s" %(", ".join(fitMethods), method))
+    if method != "legacy":
+        try:
+            fit = fitFunctions[method](values)
+            if all(math.isfinite(value) for value in fit) and fit[0] > 0 and fit[1] > 0:
+                return tuple(fit) + (method,)
+        except (ValueError, RuntimeError, FloatingPointError):
+            pass
+    try:
+        return tuple(fitLegacy(values)) + ("legacy",)
+    except (ValueError, RuntimeError, FloatingPointError):
+        return failedFit
+
+
+def fitMany(valueLists:typing.List[typing.Sequence[float]], method:str="legacy", workers:int=1):
+    if workers > 1 and len(valueLists) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(valueLists)))
+        try:
+            return list(executor.map(fitBeta, valueLists, [method] * len(valueLists)))
+        finally:
+            executor.shutdown()
+    return [fitBeta(values, method) for values in valueLists]
+
+
+if __name__ == "__main__":
+    import sys
+    import timeit
+    sampleCount = 200
+    if len(sys.argv) > 1:
+        sampleCount = int(sys.argv[1])
+    generator = numpy.random.default_rng(0)
+    valueLists = []
+    for sampleNumber in range(sampleCount):
+        values = generator.beta(generator.uniform(0.1, 2), generator.uniform(0.1, 2), int(generator.integers(20, 300)))
+        values[:int(generator.integers(0, 10))] = 1.0
+        values[-int(generator.integers(0, 5)) - 1:] = 0.0
+        valueLists.append(list(values))
+    for method in fitMethods:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fits = []
+            elapsed = timeit.timeit(lambda: fits.extend(fitMany(valueLists, method)), number=1)
+        usedMethods = {}
+        for fit in fits:
+            usedMethods[fit[-1]] = usedMethods.get(fit[-1], 0) + 1
+        print("%-8s %8.2f ms per sample  methods used: %s" %(method, elapsed * 1000 / sampleCount, usedMethods))
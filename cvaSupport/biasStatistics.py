@@ -0,0 +1,115 @@
+import collections
+import typing
+import numpy
+import scipy.special
+
+
+relativeTolerance = 1 + 1e-7
+maxGridSize = 4000000
+
+
+def tablesToArray(tables:typing.Iterable[typing.Sequence[int]]):
+    return numpy.asarray(list(tables), dtype=numpy.int64).reshape(-1, 4)
+
+
+def logChoose(n:numpy.ndarray, k:numpy.ndarray):
+    return scipy.special.gammaln(n + 1) - scipy.special.gammaln(k + 1) - scipy.special.gammaln(n - k + 1)
+
+
+def oddsRatios(tables:numpy.ndarray):
+    forwardRef, reverseRef, forwardAlt, reverseAlt = [tables[:, column].astype(float) for column in range(4)]
+    numerator = forwardRef * reverseAlt
+    denominator = reverseRef * forwardAlt
+    ratios = numpy.full(len(tables), numpy.inf)
+    hasDenominator = denominator > 0
+    ratios[hasDenominator] = numerator[hasDenominator] / denominator[hasDenominator]
+    return ratios
+
+
+def twoSidedPValues(tables:numpy.ndarray):
+    pValues = numpy.ones(len(tables))
+    if not len(tables):
+        return pValues
+    forwardRef = tables[:, 0]
+    refTotal = tables[:, 0] + tables[:, 1]
+    altTotal = tables[:, 2] + tables[:, 3]
+    forwardTotal = tables[:, 0] + tables[:, 2]
+    total = refTotal + altTotal
+    lowerBound = numpy.maximum(0, forwardTotal - altTotal)
+    upperBound = numpy.minimum(refTotal, forwardTotal)
+    supportSizes = upperBound - lowerBound + 1
+    order = numpy.argsort(supportSizes, kind="stable")
+    chunkStart = 0
+    while chunkStart < len(order):
+        chunkEnd = chunkStart + 1
+        while chunkEnd < len(order) and (chunkEnd - chunkStart + 1) * supportSizes[order[chunkEnd]] <= maxGridSize:
+            chunkEnd += 1
+        chunk = order[chunkStart:chunkEnd]
+        width = supportSizes[chunk].max()
+        successes = lowerBound[chunk, None] + numpy.arange(width)[None, :]
+        inSupport = successes <= upperBound[chunk, None]
+        successes = numpy.where(inSupport, successes, lowerBound[chunk, None])
+        logNormalizer = logChoose(total[chunk], forwardTotal[chunk])
+        logPMFs = logChoose(refTotal[chunk, None], successes) + logChoose(altTotal[chunk, None], forwardTotal[chunk, None] - successes) - logNormalizer[:, None]
+        logObserved = logChoose(refTotal[chunk], forwardRef[chunk]) + logChoose(altTotal[chunk], forwardTotal[chunk] - forwardRef[chunk]) - logNormalizer
+        asExtreme = inSupport & (logPMFs <= logObserved[:, None] + numpy.log(relativeTolerance))
+        pValues[chunk] = numpy.where(asExtreme, numpy.exp(logPMFs), 0.0).sum(axis=1)
+        pValues[chunk[(asExtreme == inSupport).all(axis=1)]] = 1.0
+        chunkStart = chunkEnd
+    emptyMargin = (refTotal == 0) | (altTotal == 0) | (forwardTotal == 0) | (forwardTotal == total)
+    pValues[emptyMargin] = 1.0
+    return numpy.minimum(pValues, 1.0)
+
+
+def fisherExactArray(tables:numpy.ndarray):
+    tables = numpy.asarray(tables, dtype=numpy.int64).reshape(-1, 4)
+    ratios = oddsRatios(tables)
+    refTotal = tables[:, 0] + tables[:, 1]
+    altTotal = tables[:, 2] + tables[:, 3]
+    forwardTotal = tables[:, 0] + tables[:, 2]
+    reverseTotal = tables[:, 1] + tables[:, 3]
+    emptyMargin = (refTotal == 0) | (altTotal == 0) | (forwardTotal == 0) | (reverseTotal == 0)
+    ratios[emptyMargin] = numpy.nan
+    return ratios, twoSidedPValues(tables)
+
+
+class FisherExactEngine:
+
+    def __init__(self, maxSize:int=1000000):
+        self.maxSize = maxSize
+        self.memo = collections.OrderedDict()
+
+    def remember(self, table:tuple, result:tuple):
+        self.memo[table] = result
+        if len(self.memo) > self.maxSize:
+            self.memo.popitem(last=False)
+
+    def fisherExact(self, table:typing.Sequence[int]):
+        table = tuple(int(count) for count in table)
+        if table in self.memo:
+            self.memo.move_to_end(table)
+            return self.memo[table]
+        ratios, pValues = fisherExactArray(numpy.array([table]))
+        result = (float(ratios[0]), float(pValues[0]))
+        self.remember(table, result)
+        return result
+
+    def fisherExactMany(self, tables:typing.Iterable[typing.Sequence[int]]):
+        tables = [tuple(int(count) for count in table) for table in tables]
+        results = {}
+        uncached = []
+        for table in dict.fromkeys(tables):
+            if table in self.memo:
+                self.memo.move_to_end(table)
+                results[table] = self.memo[table]
+            else:
+                uncached.append(table)
+        if uncached:
+            ratios, pValues = fisherExactArray(tablesToArray(uncached))
+            for table, ratio, pValue in zip(uncached, ratios, pValues):
+                results[table] = (float(ratio), float(pValue))
+                self.remember(table, results[table])
+        return [results[table] for table in tables]
+
+
+defaultEngine = FisherExactEngine()
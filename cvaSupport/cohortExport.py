@@ -0,0 +1,194 @@
+import os
+import typing
+import numpy
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+try:
+    import mutationDataMerge
+except ImportError:
+    from . import mutationDataMerge
+
+
+defaultRowGroupSize = 65536
+missingInteger = -1
+
+cohortColumnTypes = {
+    "sample": "string",
+    "contig": "string",
+    "position": "integer",
+    "ref": "string",
+    "alt": "string",
+    "identifier": "string",
+    "consequence": "string",
+    "proteinChange": "string",
+    "refDepth": "integer",
+    "altDepth": "integer",
+    "totalDepth": "integer",
+    "percentAlt": "float",
+    "strandForwardRef": "integer",
+    "strandReverseRef": "integer",
+    "strandForwardAlt": "integer",
+    "strandReverseAlt": "integer",
+    "strandOddsRatio": "float",
+    "strandPValue": "float",
+    "strandBiasInvLog": "float",
+    "mateForwardRef": "integer",
+    "mateReverseRef": "integer",
+    "mateForwardAlt": "integer",
+    "mateReverseAlt": "integer",
+    "mateOddsRatio": "float",
+    "matePValue": "float",
+    "mateBiasInvLog": "float",
+    "flags": "string",
+    "alerts": "string",
+    "confidence": "integer"
+}
+cohortColumns = list(cohortColumnTypes)
+exportFormats = ["parquet", "npz"]
+
+
+def biasValues(biasTable):
+    if biasTable is None:
+        return [None] * 6
+    return list(biasTable.counts) + [biasTable.oddsRatio, biasTable.pValue]
+
+
+def makeCohortRow(sampleID:str, variantRecord:mutationDataMerge.CombinedMutantData):
+    variantCall = variantRecord.variantCall
+    row = [sampleID, variantCall.contig, variantCall.position, variantCall.ref, variantCall.alt, variantRecord.standardDNANotation, variantRecord.consequence, variantRecord.proteinChange, variantRecord.refDepth, variantRecord.altDepth, variantRecord.totalDepth, variantRecord.percentAlt]
+    row.extend(biasValues(variantCall.strandBias))
+    row.append(variantRecord.strandBiasInvLog)
+    row.extend(biasValues(variantCall.mateBias))
+    row.append(variantRecord.mateBiasInvLog)
+    row.extend(["|".join(variantRecord.flags), "|".join(variantRecord.alerts), variantRecord.confidenceLevel])
+    return row
+
+
+def makeSampleCohortRows(sampleID:str, variantRecords:typing.List[mutationDataMerge.CombinedMutantData]):
+    return [tuple(makeCohortRow(sampleID, variantRecord)) for variantRecord in variantRecords]
+
+
+def makeCohortColumns(mutationRecordTable:typing.Dict[str, typing.List[mutationDataMerge.CombinedMutantData]]):
+    rows = []
+    for sampleID, variantRecords in mutationRecordTable.items():
+        rows.extend(makeSampleCohortRows(sampleID, variantRecords))
+    return rowsToColumns(rows)
+
+
+def rowsToColumns(rows:typing.List[tuple]):
+    rows = sorted(rows, key=lambda row: (row[1], row[2], row[0]))
+    columns = {}
+    for index, columnName in enumerate(cohortColumns):
+        columns[columnName] = [row[index] for row in rows]
+    return columns
+
+
+def getRowGroupStarts(columns:typing.Dict[str, list], rowGroupSize:int=defaultRowGroupSize):
+    rowGroupStarts = []
+    previousContig = None
+    rowsInGroup = 0
+    for index, contig in enumerate(columns["contig"]):
+        if contig != previousContig or rowsInGroup >= rowGroupSize:
+            rowGroupStarts.append(index)
+            previousContig = contig
+            rowsInGroup = 0
+        rowsInGroup += 1
+    return rowGroupStarts
+
+
+def toNumpyColumn(values:list, columnType:str):
+    if columnType == "integer":
+        return numpy.array([missingInteger if value is None else value for value in values], dtype=numpy.int64)
+    if columnType == "float":
+        return numpy.array([numpy.nan if value is None else value for value in values], dtype=numpy.float64)
+    return numpy.array(["" if value is None else value for value in values], dtype=str)
+
+
+def writeNumpyExport(columns:typing.Dict[str, list], outputPath:str, rowGroupSize:int=defaultRowGroupSize):
+    rowGroupStarts = getRowGroupStarts(columns, rowGroupSize)
+    rowGroupEnds = rowGroupStarts[1:] + [len(columns["position"])]
+    arrays = {}
+    for columnName, columnType in cohortColumnTypes.items():
+        arrays[columnName] = toNumpyColumn(columns[columnName], columnType)
+    arrays["rowGroupStarts"] = numpy.array(rowGroupStarts, dtype=numpy.int64)
+    arrays["rowGroupContigs"] = numpy.array([columns["contig"][start] for start in rowGroupStarts], dtype=str)
+    arrays["rowGroupMinPositions"] = numpy.array([columns["position"][start] for start in rowGroupStarts], dtype=numpy.int64)
+    arrays["rowGroupMaxPositions"] = numpy.array([columns["position"][end - 1] for end in rowGroupEnds], dtype=numpy.int64)
+    outputFile = open(outputPath, 'wb')
+    numpy.savez_compressed(outputFile, **arrays)
+    outputFile.close()
+
+
+def writeParquetExport(columns:typing.Dict[str, list], outputPath:str, rowGroupSize:int=defaultRowGroupSize):
+    if pyarrow is None:
+        raise ImportError("Parquet cohort exports require pyarrow to be installed")
+    arrowTypes = {"string": pyarrow.string(), "integer": pyarrow.int64(), "float": pyarrow.float64()}
+    arrays = [pyarrow.array(columns[columnName], type=arrowTypes[columnType]) for columnName, columnType in cohortColumnTypes.items()]
+    table = pyarrow.Table.from_arrays(arrays, names=cohortColumns)
+    pyarrow.parquet.write_table(table, outputPath, row_group_size=rowGroupSize, compression="zstd", write_statistics=True)
+
+
+def writeCohortExport(mutationRecordTable:typing.Dict[str, typing.List[mutationDataMerge.CombinedMutantData]], outputFolder:str, exportFormat:str="parquet", rowGroupSize:int=defaultRowGroupSize):
+    return writeCohortColumns(makeCohortColumns(mutationRecordTable), outputFolder, exportFormat, rowGroupSize)
+
+
+def writeCohortRows(rows:typing.List[tuple], outputFolder:str, exportFormat:str="parquet", rowGroupSize:int=defaultRowGroupSize):
+    return writeCohortColumns(rowsToColumns(rows), outputFolder, exportFormat, rowGroupSize)
+
+
+def writeCohortColumns(columns:typing.Dict[str, list], outputFolder:str, exportFormat:str="parquet", rowGroupSize:int=defaultRowGroupSize):
+    if not exportFormat in exportFormats:
+        raise ValueError("Cohort export format must be one of %s. Got %s" %(", ".join(exportFormats), exportFormat))
+    outputPath = os.path.join(outputFolder, "cohortVariants.%s" %exportFormat)
+    temporaryPath = "%s.%s.tmp" %(outputPath, os.getpid())
+    if exportFormat == "parquet":
+        writeParquetExport(columns, temporaryPath, rowGroupSize)
+    else:
+        writeNumpyExport(columns, temporaryPath, rowGroupSize)
+    os.replace(temporaryPath, outputPath)
+    return outputPath
+
+
+def readNumpyExport(inputPath:str, contig:str=None, start:int=None, end:int=None, columnNames:typing.List[str]=None):
+    if columnNames is None:
+        columnNames = cohortColumns
+    archive = numpy.load(inputPath)
+    rowGroupStarts = archive["rowGroupStarts"]
+    rowGroupEnds = numpy.append(rowGroupStarts[1:], len(archive["position"]))
+    selected = numpy.ones(len(rowGroupStarts), dtype=bool)
+    if contig is not None:
+        selected &= archive["rowGroupContigs"] == contig
+    if start is not None:
+        selected &= archive["rowGroupMaxPositions"] >= start
+    if end is not None:
+        selected &= archive["rowGroupMinPositions"] <= end
+    rowIndices = numpy.concatenate([numpy.arange(rowGroupStarts[index], rowGroupEnds[index]) for index in numpy.flatnonzero(selected)] + [numpy.zeros(0, dtype=numpy.int64)])
+    positions = archive["position"][rowIndices]
+    keep = numpy.ones(len(rowIndices), dtype=bool)
+    if start is not None:
+        keep &= positions >= start
+    if end is not None:
+        keep &= positions <= end
+    rowIndices = rowIndices[keep]
+    columns = {columnName: archive[columnName][rowIndices] for columnName in columnNames}
+    archive.close()
+    return columns
+
+
+def readCohortExport(inputPath:str, contig:str=None, start:int=None, end:int=None, columnNames:typing.List[str]=None):
+    if inputPath.endswith(".npz"):
+        return readNumpyExport(inputPath, contig, start, end, columnNames)
+    if pyarrow is None:
+        raise ImportError("Reading Parquet cohort exports requires pyarrow to be installed")
+    filters = []
+    if contig is not None:
+        filters.append(("contig", "=", contig))
+    if start is not None:
+        filters.append(("position", ">=", start))
+    if end is not None:
+        filters.append(("position", "<=", end))
+    table = pyarrow.parquet.read_table(inputPath, columns=columnNames, filters=filters or None)
+    return {columnName: table.column(columnName).to_numpy(zero_copy_only=False) for columnName in table.column_names}
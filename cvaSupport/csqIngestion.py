@@ -0,0 +1,72 @@
+import os
+import typing
+try:
+    import fileHandling
+    import vcfHandler
+    import vepHandler
+    import mutationDataMerge
+except ImportError:
+    from . import fileHandling
+    from . import vcfHandler
+    from . import vepHandler
+    from . import mutationDataMerge
+
+
+class AnnotatedVCF:
+
+    __slots__ = ("vcfPath", "sampleID", "annotationTable")
+
+    def __init__(self, vcfPath:str, sampleID:str, annotationTable:typing.Dict[str, typing.Tuple[vcfHandler.VariantRecord, vepHandler.VariantEffect]]):
+        self.vcfPath = vcfPath
+        self.sampleID = sampleID
+        self.annotationTable = annotationTable
+
+    @property
+    def variantRecords(self):
+        return [variantRecord for variantRecord, variantEffect in self.annotationTable.values()]
+
+    def makeCombinedMutantData(self):
+        return [mutationDataMerge.CombinedMutantData(variantRecord, variantEffect) for variantRecord, variantEffect in self.annotationTable.values()]
+
+
+def getCSQValue(infoField:str):
+    for infoEntry in infoField.split(";"):
+        if infoEntry.startswith("CSQ="):
+            return infoEntry[4:]
+    return ""
+
+
+def ingestCSQVCF(vcfPath:str, sampleNumber:int=0):
+    if not os.path.isfile(vcfPath):
+        raise FileNotFoundError("Unable to find annotated VCF at %s" %vcfPath)
+    sampleID = ""
+    csqLayout = None
+    formatCache = {}
+    annotationTable = {}
+    for line in fileHandling.iterLines(vcfPath):
+        line = line.decode()
+        if line.startswith("#"):
+            if line.startswith("##INFO=<ID=CSQ,"):
+                csqLayout = vepHandler.getCSQLayout(vepHandler.parseCSQHeader(line))
+            elif line.startswith("#CHROM"):
+                sampleID = vcfHandler.getHeaderSampleID(line, sampleNumber)
+            continue
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if csqLayout is None:
+            raise ValueError("No CSQ header was found in %s. Was VEP run with --vcf?" %vcfPath)
+        columns = line.split("\t")
+        contig, position, ref, alts, filter, mateBias, strandBias = vcfHandler.parseVCFColumns(columns, formatCache, sampleNumber)
+        variantRecord = vcfHandler.VariantRecord.fromVCFFields(contig, position, ref, alts, filter, mateBias, strandBias, sampleID)
+        identifier = variantRecord.vepIdentifier
+        variantEffect = None
+        csqValue = getCSQValue(columns[7])
+        if csqValue:
+            csqValues = vepHandler.selectCSQEntry(csqValue, csqLayout, identifier.rsplit("/", 1)[1])
+            if csqValues is not None:
+                variantEffect = vepHandler.variantEffectFromCSQ(identifier, csqValues, csqLayout)
+        annotationTable[identifier] = (variantRecord, variantEffect)
+    if not annotationTable:
+        raise ValueError("No variant records were found in %s" %vcfPath)
+    return AnnotatedVCF(vcfPath, sampleID, annotationTable)
@@ -1,18 +1,311 @@
 import os
-import binascii
+import concurrent.futures
 import gzip
+import hashlib
+import io
+import itertools
+import mmap
+import struct
+import typing
+import zlib
 
-def isGzipped(path:str):
+def openTextFile(path:str):
+    gzipped = isGzipped(path)
+    file = open(path, 'rb')
+    if gzipped:
+        gzipFile = gzip.GzipFile(fileobj=file, mode='rb')
+        gzipFile.myfileobj = file
+        return io.TextIOWrapper(gzipFile)
+    return io.TextIOWrapper(file)
+
+
+readChunkSize = 4194304
+decompressionThreads = min(4, os.cpu_count() or 1)
+blocksPerThread = 16
+
+
+def sniffFormat(path:str):
     if not os.path.isfile(path):
-        raise FileNotFoundError("Unable to determine if file %s is gzipped because that file does not exist." %path)
+        raise FileNotFoundError("Unable to determine the format of %s because that file does not exist." %path)
     file = open(path, 'rb')
-    firstTwoBytes = file.read(2)
+    header = file.read(18)
     file.close()
-    if not binascii.hexlify(firstTwoBytes) == b'1f8b':
-        return False
+    if header[:2] != b"\x1f\x8b":
+        return "plain"
+    if len(header) >= 18 and header[3] & 4 and header[12:14] == b"BC" and header[14:16] == b"\x02\x00":
+        return "bgzf"
+    return "gzip"
+
+
+def isGzipped(path:str):
+    return sniffFormat(path) != "plain"
+
+
+def mapFile(path:str):
+    file = open(path, 'rb')
+    try:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        file.close()
+
+
+def iterMappedChunks(path:str, chunkSize:int=readChunkSize):
+    mappedFile = mapFile(path)
+    if mappedFile is None:
+        return
+    try:
+        for offset in range(0, len(mappedFile), chunkSize):
+            yield mappedFile[offset:offset + chunkSize]
+    finally:
+        mappedFile.close()
+
+
+def iterBGZFBlocks(mappedFile:mmap.mmap):
+    offset = 0
+    fileSize = len(mappedFile)
+    while offset < fileSize:
+        if mappedFile[offset:offset + 4] != b"\x1f\x8b\x08\x04":
+            raise ValueError("Invalid BGZF block header at byte %s" %offset)
+        extraLength = struct.unpack_from("<H", mappedFile, offset + 10)[0]
+        extraOffset = offset + 12
+        blockSize = None
+        while extraOffset < offset + 12 + extraLength:
+            subfieldID = mappedFile[extraOffset:extraOffset + 2]
+            subfieldLength = struct.unpack_from("<H", mappedFile, extraOffset + 2)[0]
+            if subfieldID == b"BC":
+                blockSize = struct.unpack_from("<H", mappedFile, extraOffset + 4)[0] + 1
+            extraOffset += 4 + subfieldLength
+        if blockSize is None:
+            raise ValueError("BGZF block at byte %s has no block size field" %offset)
+        yield mappedFile[offset + 12 + extraLength:offset + blockSize - 8]
+        offset += blockSize
+
+
+def decompressBGZFBlock(compressedData:bytes):
+    return zlib.decompress(compressedData, -15)
+
+
+def iterBGZFChunks(path:str, threads:int=decompressionThreads):
+    mappedFile = mapFile(path)
+    if mappedFile is None:
+        return
+    executor = None
+    if threads > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    try:
+        blocks = []
+        for block in iterBGZFBlocks(mappedFile):
+            blocks.append(block)
+            if len(blocks) >= threads * blocksPerThread:
+                if executor is None:
+                    yield b"".join(map(decompressBGZFBlock, blocks))
+                else:
+                    yield b"".join(executor.map(decompressBGZFBlock, blocks))
+                blocks = []
+        if blocks:
+            if executor is None:
+                yield b"".join(map(decompressBGZFBlock, blocks))
+            else:
+                yield b"".join(executor.map(decompressBGZFBlock, blocks))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        mappedFile.close()
+
+
+def iterGzipChunks(path:str, chunkSize:int=readChunkSize):
+    file = gzip.open(path, 'rb')
+    try:
+        chunk = file.read(chunkSize)
+        while chunk:
+            yield chunk
+            chunk = file.read(chunkSize)
+    finally:
+        file.close()
+
+
+def iterChunks(path:str, threads:int=decompressionThreads):
+    fileFormat = sniffFormat(path)
+    if fileFormat == "bgzf":
+        return iterBGZFChunks(path, threads)
+    if fileFormat == "gzip":
+        return iterGzipChunks(path)
+    return iterMappedChunks(path)
+
+
+def iterMappedLines(path:str):
+    mappedFile = mapFile(path)
+    if mappedFile is None:
+        return
     try:
-        file = gzip.open(path, 'rb')
-        tenBytes = file.read(10)
-    except OSError:
-        return False
-    return True
+        yield from iter(mappedFile.readline, b"")
+    finally:
+        mappedFile.close()
+
+
+def iterLineBatches(chunks:typing.Iterable[bytes]):
+    remainder = b""
+    for chunk in chunks:
+        lines = (remainder + chunk).splitlines(True)
+        remainder = b""
+        if lines and not lines[-1].endswith(b"\n"):
+            remainder = lines.pop()
+        yield lines
+    if remainder:
+        yield [remainder]
+
+
+def iterLines(path:str, threads:int=decompressionThreads):
+    if sniffFormat(path) == "plain":
+        return iterMappedLines(path)
+    return itertools.chain.from_iterable(iterLineBatches(iterChunks(path, threads)))
+
+
+def readBytes(path:str, threads:int=decompressionThreads):
+    return b"".join(iterChunks(path, threads))
+
+
+def hashFiles(filePaths:typing.List[str], extraValues:typing.List[str]=None, blockSize:int=1048576):
+    hasher = hashlib.sha256()
+    for filePath in filePaths:
+        hasher.update(os.path.basename(filePath).encode())
+        if not os.path.isfile(filePath):
+            hasher.update(b"missing")
+            continue
+        file = open(filePath, 'rb')
+        block = file.read(blockSize)
+        while block:
+            hasher.update(block)
+            block = file.read(blockSize)
+        file.close()
+    if extraValues:
+        for value in extraValues:
+            hasher.update(str(value).encode())
+    return hasher.hexdigest()
+
+
+bgzfBlockSize = 65280
+bgzfEOFBlock = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+tabixMinShift = 14
+tabixDepth = 5
+
+
+def compressBGZFBlock(data:bytes, compressionLevel:int=6):
+    compressor = zlib.compressobj(compressionLevel, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(compressed) + 25)
+    return header + compressed + struct.pack("<2I", zlib.crc32(data), len(data))
+
+
+class BGZFWriter:
+
+    def __init__(self, path:str, compressionLevel:int=6):
+        self.file = open(path, 'wb')
+        self.compressionLevel = compressionLevel
+        self.buffer = bytearray()
+        self.blockOffset = 0
+
+    def tell(self):
+        return (self.blockOffset << 16) | len(self.buffer)
+
+    def flushBlock(self):
+        block = compressBGZFBlock(bytes(self.buffer[:bgzfBlockSize]), self.compressionLevel)
+        del self.buffer[:bgzfBlockSize]
+        self.file.write(block)
+        self.blockOffset += len(block)
+
+    def write(self, data:bytes):
+        self.buffer.extend(data)
+        while len(self.buffer) >= bgzfBlockSize:
+            self.flushBlock()
+
+    def close(self):
+        while self.buffer:
+            self.flushBlock()
+        self.file.write(bgzfEOFBlock)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def regionToBin(start:int, end:int, minShift:int=tabixMinShift, depth:int=tabixDepth):
+    end -= 1
+    levelSize = (1 << (3 * depth)) - 1
+    shift = minShift
+    for level in range(depth, 0, -1):
+        if start >> shift == end >> shift:
+            return levelSize // 7 + (start >> shift)
+        levelSize >>= 3
+        shift += 3
+    return 0
+
+
+class TabixIndexBuilder:
+
+    def __init__(self, sequenceColumn:int=1, startColumn:int=2, endColumn:int=0, indexFormat:int=2, metaCharacter:str="#"):
+        self.sequenceColumn = sequenceColumn
+        self.startColumn = startColumn
+        self.endColumn = endColumn
+        self.indexFormat = indexFormat
+        self.metaCharacter = metaCharacter
+        self.contigs = []
+        self.bins = {}
+        self.linearIndexes = {}
+        self.previousRecord = None
+
+    def addRecord(self, contig:str, start:int, end:int, startOffset:int, endOffset:int):
+        if self.previousRecord is not None and self.previousRecord[0] == contig and start < self.previousRecord[1]:
+            raise ValueError("Records must be sorted by position to be indexed. %s:%s follows %s:%s" %(contig, start + 1, self.previousRecord[0], self.previousRecord[1] + 1))
+        if not contig in self.bins:
+            if self.contigs and self.previousRecord[0] != contig and contig in self.contigs:
+                raise ValueError("Records must be grouped by contig to be indexed. %s appears more than once" %contig)
+            self.contigs.append(contig)
+            self.bins[contig] = {}
+            self.linearIndexes[contig] = []
+        self.previousRecord = (contig, start)
+        chunks = self.bins[contig].setdefault(regionToBin(start, end), [])
+        if chunks and chunks[-1][1] == startOffset:
+            chunks[-1][1] = endOffset
+        else:
+            chunks.append([startOffset, endOffset])
+        linearIndex = self.linearIndexes[contig]
+        lastWindow = (end - 1) >> tabixMinShift
+        if len(linearIndex) <= lastWindow:
+            linearIndex.extend([None] * (lastWindow + 1 - len(linearIndex)))
+        for window in range(start >> tabixMinShift, lastWindow + 1):
+            if linearIndex[window] is None:
+                linearIndex[window] = startOffset
+
+    def toBytes(self):
+        names = b"".join(contig.encode() + b"\0" for contig in self.contigs)
+        parts = [b"TBI\1", struct.pack("<8i", len(self.contigs), self.indexFormat, self.sequenceColumn, self.startColumn, self.endColumn, ord(self.metaCharacter), 0, len(names)), names]
+        for contig in self.contigs:
+            bins = self.bins[contig]
+            parts.append(struct.pack("<i", len(bins)))
+            for binNumber in sorted(bins):
+                chunks = bins[binNumber]
+                parts.append(struct.pack("<Ii", binNumber, len(chunks)))
+                for chunkStart, chunkEnd in chunks:
+                    parts.append(struct.pack("<2Q", chunkStart, chunkEnd))
+            linearIndex = self.linearIndexes[contig]
+            previousOffset = 0
+            for window, offset in enumerate(linearIndex):
+                if offset is None:
+                    linearIndex[window] = previousOffset
+                else:
+                    previousOffset = offset
+            parts.append(struct.pack("<i", len(linearIndex)))
+            parts.append(struct.pack("<%sQ" %len(linearIndex), *linearIndex))
+        return b"".join(parts)
+
+    def write(self, path:str):
+        indexFile = BGZFWriter(path)
+        indexFile.write(self.toBytes())
+        indexFile.close()
+        return path
@@ -1,8 +1,19 @@
+import os
+try:
+    import fileHandling
+except ImportError:
+    from . import fileHandling
+
+
 FORMATLINESTOADD = [
     '##FORMAT=<ID=ALT_DP,Number=1,Type=Integer,Description="Alternate allele depth">',
     '##FORMAT=<ID=ALT_FREQ,Number=1,Type=Float,Description="Alternate allele frequency">'
 ]
 
+outputFormats = ["vcf", "bgzf"]
+formatTransforms = {}
+
+
 def processVCFLine(vcfLine:str) -> str:
     vcfLine = vcfLine.strip()
     if vcfLine.startswith("#"):
@@ -11,49 +22,78 @@ def processVCFLine(vcfLine:str) -> str:
         return modifyVCFLine(vcfLine)
 
 
+def getFormatTransform(formatFields:str):
+    if not formatFields in formatTransforms:
+        formatFieldList = formatFields.split(":")
+        formatTransforms[formatFields] = (formatFieldList.index("AD"), formatFieldList.index("AF"), formatFields + ":ALT_DP:ALT_FREQ")
+    return formatTransforms[formatFields]
+
+
 def modifyVCFLine(vcfLine:str) -> str:
-    lineElements = vcfLine.split("\t")
-    formatFields = lineElements[-2]
-    dataFields = lineElements[-1]
-    formatFieldList = formatFields.split(":")
+    lineStart, formatFields, dataFields = vcfLine.rsplit("\t", 2)
+    allelicDepthIndex, allelicFrequencyIndex, newFormatFields = getFormatTransform(formatFields)
     dataFieldList = dataFields.split(":")
-    fieldTable = {}
-    for field, data in zip(formatFieldList, dataFieldList):
-        fieldTable[field] = data
-    allelicDepths = fieldTable["AD"].split(",")
-    allelicFrequencies = fieldTable["AF"].split(",")
-    variantAllelicDepths = allelicDepths[1:]
-    newFormatFieldList = formatFieldList.copy()
-    newFormatFieldList.append("ALT_DP")
-    newFormatFieldList.append("ALT_FREQ")
-    fieldTable["ALT_DP"] = ",".join(variantAllelicDepths)
-    fieldTable["ALT_FREQ"] = ",".join(allelicFrequencies)
-    newDataFieldsList = []
-    for element in newFormatFieldList:
-        newDataFieldsList.append(fieldTable[element])
-    newDataFields = ":".join(newDataFieldsList)
-    newFormatFields = ":".join(newFormatFieldList)
-    newLineElements = lineElements.copy()
-    newLineElements[-2] = newFormatFields
-    newLineElements[-1] = newDataFields
-    newLine = "\t".join(newLineElements)
-    return newLine
-
-
-def processVCF(vcfPathInputPath:str, vcfOutputPath:str):
-    addedFormatLines = False
-    vcf = open(vcfPathInputPath, 'r')
-    vcfOutput = open(vcfOutputPath, 'w')
-    for line in vcf:
+    variantAllelicDepths = dataFieldList[allelicDepthIndex].partition(",")[2]
+    return "%s\t%s\t%s:%s:%s" %(lineStart, newFormatFields, dataFields, variantAllelicDepths, dataFieldList[allelicFrequencyIndex])
+
+
+def getRecordSpan(vcfLine:str):
+    contig, position, variantID, ref = vcfLine.split("\t", 4)[:4]
+    start = int(position) - 1
+    return contig, start, start + max(len(ref), 1)
+
+
+class FreyjaVCFWriter:
+
+    def __init__(self, vcfOutputPath:str, outputFormat:str="vcf", indexPath:str=None):
+        if not outputFormat in outputFormats:
+            raise ValueError("Freyja VCF output format must be one of %s. Got %s" %(", ".join(outputFormats), outputFormat))
+        if indexPath and outputFormat != "bgzf":
+            raise ValueError("Only bgzf Freyja VCF outputs can be indexed")
+        self.vcfOutputPath = vcfOutputPath
+        self.indexPath = indexPath
+        self.addedFormatLines = False
+        if outputFormat == "bgzf":
+            self.vcfOutput = fileHandling.BGZFWriter(vcfOutputPath)
+        else:
+            self.vcfOutput = open(vcfOutputPath, 'wb', buffering=1048576)
+        self.indexBuilder = None
+        if indexPath:
+            self.indexBuilder = fileHandling.TabixIndexBuilder()
+
+    def writeLine(self, line:str):
         newLine = processVCFLine(line)
-        if newLine.startswith("#CHROM"):
-            if FORMATLINESTOADD and not addedFormatLines:
-                for line in FORMATLINESTOADD:
-                    print(line, file=vcfOutput)
-                addedFormatLines = True
-        print(newLine, file=vcfOutput)
-    vcf.close()
-    vcfOutput.close()
+        if newLine.startswith("#"):
+            if newLine.startswith("#CHROM") and FORMATLINESTOADD and not self.addedFormatLines:
+                self.vcfOutput.write("".join(formatLine + "\n" for formatLine in FORMATLINESTOADD).encode())
+                self.addedFormatLines = True
+            self.vcfOutput.write((newLine + "\n").encode())
+        elif self.indexBuilder is not None:
+            startOffset = self.vcfOutput.tell()
+            self.vcfOutput.write((newLine + "\n").encode())
+            contig, start, end = getRecordSpan(newLine)
+            self.indexBuilder.addRecord(contig, start, end, startOffset, self.vcfOutput.tell())
+        else:
+            self.vcfOutput.write((newLine + "\n").encode())
+
+    def close(self):
+        self.vcfOutput.close()
+        if self.indexBuilder is not None:
+            self.indexBuilder.write(self.indexPath)
+        return self.vcfOutputPath
+
+    def abort(self):
+        self.vcfOutput.close()
+        for path in [self.vcfOutputPath, self.indexPath]:
+            if path and os.path.isfile(path):
+                os.remove(path)
+
+
+def processVCF(vcfPathInputPath:str, vcfOutputPath:str, outputFormat:str="vcf", indexPath:str=None):
+    vcfOutput = FreyjaVCFWriter(vcfOutputPath, outputFormat, indexPath)
+    for line in fileHandling.iterLines(vcfPathInputPath):
+        vcfOutput.writeLine(line.decode())
+    return vcfOutput.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import typing
+import datetime
+import resource
+import contextlib
+import cProfile
+import tracemalloc
+
+
+profilingModes = ["none", "cprofile", "tracemalloc"]
+tracemallocTopCount = 25
+
+
+def childCPUTime():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peakRSSKilobytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RunInstrumentation:
+
+    def __init__(self):
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.wallStart = time.perf_counter()
+        self.stageRecords = []
+
+    @contextlib.contextmanager
+    def measure(self, stage:str, sampleID:str=None, records:int=None):
+        stageRecord = {"stage": stage, "sampleID": sampleID, "records": records}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wallStart = time.perf_counter()
+        cpuStart = time.process_time()
+        childCPUStart = childCPUTime()
+        try:
+            yield stageRecord
+        finally:
+            stageRecord["wallSeconds"] = time.perf_counter() - wallStart
+            stageRecord["cpuSeconds"] = time.process_time() - cpuStart
+            stageRecord["childCPUSeconds"] = childCPUTime() - childCPUStart
+            stageRecord["peakRSSKilobytes"] = peakRSSKilobytes()
+            stageRecord["pid"] = os.getpid()
+            if tracemalloc.is_tracing():
+                stageRecord["tracedPeakBytes"] = tracemalloc.get_traced_memory()[1]
+            self.stageRecords.append(stageRecord)
+
+    def addStageRecord(self, stage:str, sampleID:str=None, records:int=None, wallSeconds:float=0.0, cpuSeconds:float=0.0, childCPUSeconds:float=0.0):
+        stageRecord = {"stage": stage, "sampleID": sampleID, "records": records, "wallSeconds": wallSeconds, "cpuSeconds": cpuSeconds, "childCPUSeconds": childCPUSeconds, "peakRSSKilobytes": peakRSSKilobytes(), "pid": os.getpid()}
+        self.stageRecords.append(stageRecord)
+        return stageRecord
+
+    def extend(self, stageRecords:typing.List[dict]):
+        self.stageRecords.extend(stageRecords)
+
+    def summarizeStages(self):
+        stageSummaries = {}
+        for stageRecord in self.stageRecords:
+            if not stageRecord["stage"] in stageSummaries:
+                stageSummaries[stageRecord["stage"]] = {"calls": 0, "records": 0, "wallSeconds": 0.0, "cpuSeconds": 0.0, "childCPUSeconds": 0.0, "peakRSSKilobytes": 0}
+            stageSummary = stageSummaries[stageRecord["stage"]]
+            stageSummary["calls"] += 1
+            stageSummary["records"] += stageRecord["records"] or 0
+            stageSummary["wallSeconds"] += stageRecord["wallSeconds"]
+            stageSummary["cpuSeconds"] += stageRecord["cpuSeconds"]
+            stageSummary["childCPUSeconds"] += stageRecord["childCPUSeconds"]
+            stageSummary["peakRSSKilobytes"] = max(stageSummary["peakRSSKilobytes"], stageRecord["peakRSSKilobytes"])
+            if "tracedPeakBytes" in stageRecord:
+                stageSummary["tracedPeakBytes"] = max(stageSummary.get("tracedPeakBytes", 0), stageRecord["tracedPeakBytes"])
+        for stageSummary in stageSummaries.values():
+            if stageSummary["wallSeconds"] and stageSummary["records"]:
+                stageSummary["recordsPerSecond"] = stageSummary["records"] / stageSummary["wallSeconds"]
+        return stageSummaries
+
+    def summarizeSamples(self):
+        sampleSummaries = {}
+        for stageRecord in self.stageRecords:
+            if stageRecord["sampleID"] is None:
+                continue
+            if not stageRecord["sampleID"] in sampleSummaries:
+                sampleSummaries[stageRecord["sampleID"]] = {"wallSeconds": 0.0, "cpuSeconds": 0.0, "stages": {}}
+            sampleSummary = sampleSummaries[stageRecord["sampleID"]]
+            sampleSummary["wallSeconds"] += stageRecord["wallSeconds"]
+            sampleSummary["cpuSeconds"] += stageRecord["cpuSeconds"]
+            stageEntry = {key: value for key, value in stageRecord.items() if not key in ["stage", "sampleID"]}
+            sampleSummary["stages"][stageRecord["stage"]] = stageEntry
+        return sampleSummaries
+
+    def makeReport(self, settings:dict=None):
+        return {
+            "started": self.started,
+            "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+            "wallSeconds": time.perf_counter() - self.wallStart,
+            "cpuSeconds": time.process_time(),
+            "childCPUSeconds": childCPUTime(),
+            "peakRSSKilobytes": peakRSSKilobytes(),
+            "peakChildRSSKilobytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            "settings": settings or {},
+            "stages": self.summarizeStages(),
+            "samples": self.summarizeSamples()
+        }
+
+    def writeReport(self, outputPath:str, settings:dict=None):
+        temporaryPath = "%s.%s.tmp" %(outputPath, os.getpid())
+        outputFile = open(temporaryPath, 'w')
+        json.dump(self.makeReport(settings), outputFile, indent=4)
+        outputFile.close()
+        os.replace(temporaryPath, outputPath)
+        return outputPath
+
+
+@contextlib.contextmanager
+def profiled(mode:str, outputPathPrefix:str):
+    if not mode in profilingModes:
+        raise ValueError("Profiling mode must be one of %s. Got %s" %(", ".join(profilingModes), mode))
+    if mode == "none":
+        yield
+        return
+    outputFolder = os.path.dirname(outputPathPrefix)
+    if outputFolder and not os.path.isdir(outputFolder):
+        os.makedirs(outputFolder, exist_ok=True)
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(outputPathPrefix + ".pstats")
+        return
+    alreadyTracing = tracemalloc.is_tracing()
+    if not alreadyTracing:
+        tracemalloc.start(10)
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        currentBytes = tracemalloc.get_traced_memory()[0]
+        if not alreadyTracing:
+            tracemalloc.stop()
+        outputFile = open(outputPathPrefix + ".tracemalloc.txt", 'w')
+        print("Current traced bytes: %s" %currentBytes, file=outputFile)
+        for statistic in snapshot.statistics("lineno")[:tracemallocTopCount]:
+            print(statistic, file=outputFile)
+        outputFile.close()
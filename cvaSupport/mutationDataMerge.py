@@ -10,6 +10,8 @@ except ImportError:
 
 class CombinedMutantData:
 
+    __slots__ = ("variantCall", "locus", "variantEffect", "vepDNANotation", "standardDNANotation", "consequence", "proteinChange", "isMissense", "isNonsense", "isCoding", "isMakingMutantProtein", "isSynonymous", "isInsideGene", "refDepth", "altDepth", "totalDepth", "confidenceLevel", "percentAlt", "mateBiasInvLog", "strandBiasInvLog", "flags", "alerts")
+
     def __init__(self, vcf:vcfHandler.VariantRecord, vep:vepHandler.VariantEffect=None):
         self.variantCall = vcf
         self.locus = (vcf.contig, vcf.position)
@@ -109,3 +111,54 @@ def mergeVCFandVEPTables(vcfTable:typing.Dict[str, vcfHandler.VariantRecord], ve
         vepRecord = vepTable.setdefault(vcfIdentifier, None)
         mergeList.append(CombinedMutantData(vcfRecord, vepRecord))
     return mergeList
+
+
+if __name__ == "__main__":
+    import sys
+    import tracemalloc
+    vcfPath = "/opt/vep/ronavep/references/in2442-23.hard-filtered.vcf.gz"
+    vepPath = "/opt/vep/ronavep/references/in2442-23.vep.txt"
+    copies = 200
+    if len(sys.argv) > 2:
+        vcfPath, vepPath = sys.argv[1:3]
+    if len(sys.argv) > 3:
+        copies = int(sys.argv[3])
+    def mergeSample():
+        vcfTable = {record.vepIdentifier: record for record in vcfHandler.iterVCF(vcfPath)}
+        vepTable = vepHandler.processVEPTable(vepPath)
+        mergeList = mergeVCFandVEPTables(vcfTable, vepTable)
+        for mergedRecord in mergeList:
+            mergedRecord.variantCall.standardMutationIdentifier
+        return mergeList
+    def copyObjectGraph(mergedRecord:CombinedMutantData, classTable:dict):
+        def copyInstance(instance):
+            if instance is None:
+                return None
+            copiedInstance = object.__new__(classTable[type(instance)])
+            for slotName in type(instance).__slots__:
+                setattr(copiedInstance, slotName, getattr(instance, slotName))
+            return copiedInstance
+        variantCall = mergedRecord.variantCall
+        return (copyInstance(mergedRecord), copyInstance(variantCall), copyInstance(variantCall.strandBias), copyInstance(variantCall.mateBias), copyInstance(mergedRecord.variantEffect))
+    def measureAllocation(function):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return result, allocated
+    slottedClasses = [CombinedMutantData, vcfHandler.VariantRecord, vcfHandler.BiasTable, vepHandler.VariantEffect]
+    slottedTable = {slottedClass: slottedClass for slottedClass in slottedClasses}
+    dictBackedTable = {slottedClass: type("DictBacked%s" %slottedClass.__name__, (), {}) for slottedClass in slottedClasses}
+    cohort, cohortBytes = measureAllocation(lambda: [mergeSample() for copy in range(copies)])
+    records = [mergedRecord for mergeList in cohort for mergedRecord in mergeList]
+    slottedCopies, slottedBytes = measureAllocation(lambda: [copyObjectGraph(mergedRecord, slottedTable) for mergedRecord in records])
+    dictBackedCopies, dictBackedBytes = measureAllocation(lambda: [copyObjectGraph(mergedRecord, dictBackedTable) for mergedRecord in records])
+    legacyBytes = cohortBytes - slottedBytes + dictBackedBytes
+    print("%s merged records from %s copies of %s" %(len(records), copies, vcfPath))
+    print("Object overhead per merged record (CombinedMutantData, VariantRecord, BiasTables, VariantEffect):")
+    print("    per-instance __dict__: %.0f bytes" %(dictBackedBytes / len(records)))
+    print("    __slots__:             %.0f bytes" %(slottedBytes / len(records)))
+    print("Total traced memory per merged record:")
+    print("    per-instance __dict__: %.0f bytes (estimated)" %(legacyBytes / len(records)))
+    print("    __slots__:             %.0f bytes (%.1f%% less)" %(cohortBytes / len(records), 100 * (1 - cohortBytes / legacyBytes)))
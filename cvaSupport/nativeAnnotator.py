@@ -0,0 +1,252 @@
+import typing
+import itertools
+try:
+    import referenceGenomeHandler
+    import vcfHandler
+    import vepHandler
+    import vepRunner
+except ImportError:
+    from . import referenceGenomeHandler
+    from . import vcfHandler
+    from . import vepHandler
+    from . import vepRunner
+
+
+nativeReferenceGenomePath = "/opt/vep/ronavep/references/NC_045512.2.gb"
+
+codonTable = dict(zip(["".join(codon) for codon in itertools.product("TCAG", repeat=3)], "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"))
+
+highImpactConsequences = ["frameshift_variant", "stop_gained", "stop_lost", "start_lost"]
+moderateImpactConsequences = ["missense_variant", "inframe_deletion", "inframe_insertion", "coding_sequence_variant"]
+lowImpactConsequences = ["synonymous_variant", "stop_retained_variant"]
+
+
+def translate(sequence:str):
+    aminoAcids = []
+    for codonStart in range(0, len(sequence), 3):
+        codon = sequence[codonStart:codonStart + 3].upper()
+        if len(codon) < 3:
+            aminoAcids.append("X")
+        else:
+            aminoAcids.append(codonTable.get(codon, "X"))
+    return "".join(aminoAcids)
+
+
+def formatRange(start:int, end:int):
+    if start == end:
+        return str(start)
+    return "%s-%s" %(start, end)
+
+
+def getImpact(consequence:str):
+    consequenceTerms = consequence.split(",")
+    for consequenceTerm in consequenceTerms:
+        if consequenceTerm in highImpactConsequences:
+            return "HIGH"
+    for consequenceTerm in consequenceTerms:
+        if consequenceTerm in moderateImpactConsequences:
+            return "MODERATE"
+    for consequenceTerm in consequenceTerms:
+        if consequenceTerm in lowImpactConsequences:
+            return "LOW"
+    return "MODIFIER"
+
+
+class GeneModel:
+
+    def __init__(self, geneID:str, start:int, end:int, sequence:str):
+        self.geneID = geneID
+        self.start = start
+        self.end = end
+        self.sequence = sequence.lower()
+
+    def codonSpan(self, firstCDSPosition:int, lastCDSPosition:int):
+        firstCodon = (firstCDSPosition - 1) // 3
+        lastCodon = (lastCDSPosition - 1) // 3
+        return firstCodon, lastCodon
+
+
+class NativeAnnotator:
+
+    def __init__(self, referenceGenome:referenceGenomeHandler.ReferenceGenome=None, distance:int=vepRunner.geneRadius):
+        if referenceGenome is None:
+            referenceGenome = referenceGenomeHandler.ReferenceGenome(nativeReferenceGenomePath)
+        self.referenceGenome = referenceGenome
+        self.contig = referenceGenome.recordID
+        self.distance = distance
+        self.geneModels = []
+        for (start, end), geneID in sorted(referenceGenome.geneTableByLocation.items()):
+            self.geneModels.append(GeneModel(geneID, start + 1, end, referenceGenome.sequenceTable[geneID]))
+
+    def annotate(self, contig:str, position:int, ref:str, alt:str):
+        identifier = "%s_%s_%s/%s" %(contig, position, ref, alt)
+        if ref == "-":
+            location = "%s:%s" %(contig, formatRange(position - 1, position))
+            variantStart = position - 1
+            variantEnd = position
+        else:
+            location = "%s:%s" %(contig, formatRange(position, position + len(ref) - 1))
+            variantStart = position
+            variantEnd = position + len(ref) - 1
+        nearbyEffects = []
+        overlappingEffects = []
+        for geneModel in self.geneModels:
+            if ref == "-":
+                isOverlapping = variantStart >= geneModel.start and variantEnd <= geneModel.end
+            else:
+                isOverlapping = variantStart <= geneModel.end and variantEnd >= geneModel.start
+            if isOverlapping:
+                overlappingEffects.append(self.annotateCoding(identifier, location, geneModel, position, ref, alt))
+            elif geneModel.start > variantEnd and geneModel.start - variantEnd <= self.distance:
+                nearbyEffects.append(self.makeVariantEffect(identifier, location, alt, geneModel.geneID, "upstream_gene_variant", distance=geneModel.start - variantEnd))
+            elif geneModel.end < variantStart and variantStart - geneModel.end <= self.distance:
+                nearbyEffects.append(self.makeVariantEffect(identifier, location, alt, geneModel.geneID, "downstream_gene_variant", distance=variantStart - geneModel.end))
+        if not nearbyEffects and not overlappingEffects:
+            return [vepHandler.VariantEffect(identifier, location, alt, "-", "-", "-", "intergenic_variant", "-", "-", "-", "-", "-", "-", "IMPACT=MODIFIER")]
+        return nearbyEffects + overlappingEffects
+
+    def annotateVariantRecord(self, variantRecord:vcfHandler.VariantRecord):
+        identifierSplit = variantRecord.vepIdentifier.split("_")
+        ref, alt = identifierSplit[-1].split("/")[:2]
+        return self.annotate("_".join(identifierSplit[:-2]), int(identifierSplit[-2]), ref, alt)
+
+    def annotateCoding(self, identifier:str, location:str, geneModel:GeneModel, position:int, ref:str, alt:str):
+        sequence = geneModel.sequence
+        if ref == "-":
+            insertAfter = position - geneModel.start
+            cdsRange = formatRange(insertAfter, insertAfter + 1)
+            if insertAfter % 3 == 0:
+                codonIndex = insertAfter // 3
+                refCodons = "-"
+                altCodons = alt.upper()
+                refAminoAcids = "-"
+                altAminoAcids = translate(alt)
+                proteinRange = formatRange(codonIndex, codonIndex + 1)
+                affectedCodons = [codonIndex, codonIndex + 1]
+            else:
+                codonIndex = (insertAfter - 1) // 3
+                codonStart = codonIndex * 3
+                refCodons = sequence[codonStart:codonStart + 3]
+                altCodons = sequence[codonStart:insertAfter] + alt.upper() + sequence[insertAfter:codonStart + 3]
+                refAminoAcids = translate(refCodons)
+                altAminoAcids = translate(altCodons)
+                proteinRange = str(codonIndex + 1)
+                affectedCodons = [codonIndex + 1]
+            isFrameshift = len(alt) % 3 != 0
+            indelType = "inframe_insertion"
+        else:
+            firstCDSPosition = position - geneModel.start + 1
+            lastCDSPosition = firstCDSPosition + len(ref) - 1
+            if firstCDSPosition < 1 or lastCDSPosition > len(sequence):
+                return self.makeVariantEffect(identifier, location, alt, geneModel.geneID, "coding_sequence_variant")
+            cdsRange = formatRange(firstCDSPosition, lastCDSPosition)
+            firstCodon, lastCodon = geneModel.codonSpan(firstCDSPosition, lastCDSPosition)
+            codonStart = firstCodon * 3
+            codonEnd = min(lastCodon * 3 + 3, len(sequence))
+            before = sequence[codonStart:firstCDSPosition - 1]
+            after = sequence[lastCDSPosition:codonEnd]
+            refCodons = before + sequence[firstCDSPosition - 1:lastCDSPosition].upper() + after
+            refAminoAcids = translate(refCodons)
+            proteinRange = formatRange(firstCodon + 1, lastCodon + 1)
+            affectedCodons = list(range(firstCodon + 1, lastCodon + 2))
+            if alt == "-":
+                if not before and not after:
+                    altCodons = "-"
+                    altAminoAcids = "-"
+                else:
+                    altCodons = before + after
+                    altAminoAcids = translate(altCodons)
+                isFrameshift = len(ref) % 3 != 0
+                indelType = "inframe_deletion"
+            else:
+                altCodons = before + alt.upper() + after
+                altAminoAcids = translate(altCodons)
+                isFrameshift = len(ref) != len(alt) and (len(ref) - len(alt)) % 3 != 0
+                indelType = None
+        if isFrameshift:
+            consequence = "frameshift_variant"
+            if 1 in affectedCodons:
+                consequence = "frameshift_variant,start_lost"
+        elif 1 in affectedCodons and refAminoAcids.startswith("M") and not altAminoAcids.startswith("M"):
+            consequence = "start_lost"
+        elif "*" in altAminoAcids and not "*" in refAminoAcids:
+            consequence = "stop_gained"
+        elif "*" in refAminoAcids and not "*" in altAminoAcids:
+            consequence = "stop_lost"
+        elif indelType:
+            consequence = indelType
+        elif refAminoAcids == altAminoAcids:
+            if refAminoAcids == "*":
+                consequence = "stop_retained_variant"
+            else:
+                consequence = "synonymous_variant"
+        else:
+            consequence = "missense_variant"
+        if consequence in ["synonymous_variant", "stop_retained_variant"]:
+            aminoAcids = refAminoAcids
+        else:
+            aminoAcids = "%s/%s" %(refAminoAcids, altAminoAcids)
+        codons = "%s/%s" %(refCodons, altCodons)
+        return self.makeVariantEffect(identifier, location, alt, geneModel.geneID, consequence, cdsRange, proteinRange, aminoAcids, codons)
+
+    def makeVariantEffect(self, identifier:str, location:str, alt:str, geneID:str, consequence:str, cdsRange:str="-", proteinRange:str="-", aminoAcids:str="-", codons:str="-", distance:int=None):
+        notes = ["IMPACT=%s" %getImpact(consequence)]
+        if distance is not None:
+            notes.append("DISTANCE=%s" %distance)
+        notes.append("STRAND=1")
+        return vepHandler.VariantEffect(identifier, location, alt, geneID, geneID, "Transcript", consequence, cdsRange, cdsRange, proteinRange, aminoAcids, codons, "-", ";".join(notes))
+
+    def annotateVariantRecords(self, variantRecords:typing.Iterable[vcfHandler.VariantRecord]):
+        variantEffects = []
+        for variantRecord in variantRecords:
+            variantEffects.extend(self.annotateVariantRecord(variantRecord))
+        return variantEffects
+
+
+def validateAgainstVEP(vepFilePath:str, annotator:NativeAnnotator=None, comparedFields:typing.List[str]=None):
+    if annotator is None:
+        annotator = NativeAnnotator()
+    if comparedFields is None:
+        comparedFields = ["consequence", "cdsPosition", "proteinPosition", "aminoAcid", "codons"]
+    modeledGenes = set(geneModel.geneID for geneModel in annotator.geneModels)
+    modeledGenes.add("-")
+    vepEffects = {}
+    for variantEffect in vepHandler.processVEPFile(vepFilePath):
+        if not variantEffect.gene in modeledGenes:
+            continue
+        vepEffects[(variantEffect.identifier, variantEffect.gene)] = variantEffect
+    nativeEffects = {}
+    for identifier in dict.fromkeys(identifier for identifier, gene in vepEffects):
+        identifierSplit = identifier.split("_")
+        ref, alt = identifierSplit[-1].split("/")[:2]
+        for variantEffect in annotator.annotate("_".join(identifierSplit[:-2]), int(identifierSplit[-2]), ref, alt):
+            nativeEffects[(variantEffect.identifier, variantEffect.gene)] = variantEffect
+    discrepancies = []
+    for key, vepEffect in vepEffects.items():
+        if not key in nativeEffects:
+            discrepancies.append({"identifier": key[0], "gene": key[1], "field": "missing", "vep": vepEffect.consequence, "native": None})
+            continue
+        nativeEffect = nativeEffects[key]
+        for field in comparedFields:
+            vepValue = getattr(vepEffect, field)
+            nativeValue = getattr(nativeEffect, field)
+            if vepValue != nativeValue:
+                discrepancies.append({"identifier": key[0], "gene": key[1], "field": field, "vep": vepValue, "native": nativeValue})
+    for key, nativeEffect in nativeEffects.items():
+        if not key in vepEffects:
+            discrepancies.append({"identifier": key[0], "gene": key[1], "field": "extra", "vep": None, "native": nativeEffect.consequence})
+    return discrepancies, len(vepEffects)
+
+
+if __name__ == "__main__":
+    import sys
+    vepFilePath = "/opt/vep/ronavep/references/in2442-23.vep.txt"
+    distance = 5000
+    if len(sys.argv) > 1:
+        vepFilePath = sys.argv[1]
+    if len(sys.argv) > 2:
+        distance = int(sys.argv[2])
+    discrepancies, comparedCount = validateAgainstVEP(vepFilePath, NativeAnnotator(distance=distance))
+    for discrepancy in discrepancies:
+        print("%s\t%s\t%s\tVEP: %s\tnative: %s" %(discrepancy["identifier"], discrepancy["gene"], discrepancy["field"], discrepancy["vep"], discrepancy["native"]))
+    print("%s discrepancies across %s VEP annotations" %(len(discrepancies), comparedCount))
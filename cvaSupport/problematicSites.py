@@ -1,12 +1,13 @@
 import os
-import gzip
 import typing
 try:
     import fileHandling
     import mutationDataMerge
+    import annotationTracks
 except ImportError:
     from . import fileHandling
     from . import mutationDataMerge
+    from . import annotationTracks
 
 
 problematicSitesFile = "/opt/vep/ronavep/references/problematicSiteFilter.vcf"
@@ -15,12 +16,9 @@ problematicSitesFile = "/opt/vep/ronavep/references/problematicSiteFilter.vcf"
 def getProblematicSitesTable(problematicSitesFilePath:str=problematicSitesFile):
     if not os.path.isfile(problematicSitesFilePath):
         raise FileNotFoundError("Unable to find problematic sites list at %s" %problematicSitesFilePath)
-    if fileHandling.isGzipped(problematicSitesFilePath):
-        vcfFileHandle = gzip.open(problematicSitesFilePath, 'rt')
-    else:
-        vcfFileHandle = open(problematicSitesFilePath, 'r')
     positionTable = {}
-    for line in vcfFileHandle:
+    for line in fileHandling.iterLines(problematicSitesFilePath):
+        line = line.decode()
         if not line.strip():
             continue
         if line.startswith("#"):
@@ -31,14 +29,27 @@ def getProblematicSitesTable(problematicSitesFilePath:str=problematicSitesFile):
     return positionTable
 
 
-def applySiteWarnings(mutantDataList:typing.List[mutationDataMerge.CombinedMutantData], biasWarningInvLog:float=2.0, problemSiteTable:dict=None):
-    if not problemSiteTable:
-        problemSiteTable = getProblematicSitesTable()
+def getProblematicSitesTrack(cacheFolder:str="", maskSpecs:typing.List[typing.Tuple[str, str]]=None):
+    if maskSpecs is None:
+        maskSpecs = [("ProblemSite", problematicSitesFile)]
+    return annotationTracks.loadAnnotationTrack(maskSpecs, cacheFolder)
+
+
+def applySiteWarnings(mutantDataList:typing.List[mutationDataMerge.CombinedMutantData], biasWarningInvLog:float=2.0, problemSiteTable:dict=None, annotationTrack:annotationTracks.AnnotationTrack=None):
+    if annotationTrack is not None:
+        siteLabels = annotationTrack.labelsForPositions([variantRecord.locus[1] for variantRecord in mutantDataList])
+        for variantRecord, labels in zip(mutantDataList, siteLabels):
+            for label in labels:
+                variantRecord.addFlag(label)
+    else:
+        if not problemSiteTable:
+            problemSiteTable = getProblematicSitesTable()
+        for variantRecord in mutantDataList:
+            position = variantRecord.locus[1]
+            if position in problemSiteTable:
+                flag = "ProblemSite:%s" %problemSiteTable[position]
+                variantRecord.addFlag(flag)
     for variantRecord in mutantDataList:
-        position = variantRecord.locus[1]
-        if position in problemSiteTable:
-            flag = "ProblemSite:%s" %problemSiteTable[position]
-            variantRecord.addFlag(flag)
         if variantRecord.strandBiasInvLog and variantRecord.strandBiasInvLog >= biasWarningInvLog:
             variantRecord.addFlag("StrandBias")
         if variantRecord.mateBiasInvLog and variantRecord.mateBiasInvLog >= biasWarningInvLog:
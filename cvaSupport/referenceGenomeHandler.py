@@ -1,52 +1,140 @@
 import os
-from Bio import SeqIO, Seq
-import io
+import sys
+import numpy
+try:
+    import fileHandling
+except ImportError:
+    from . import fileHandling
 
-referenceGenomePath = os.path.join(os.path.split(__file__)[0], "references", "MN908947.gb")
+referenceGenomePath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "references", "NC_045512.2.gb")
+defaultReferenceCacheFolder = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "cvaSupport")
+referenceCacheVersion = 2
+
+
+def getReferenceCachePath(gbkPath:str, cacheFolder:str=defaultReferenceCacheFolder):
+    return os.path.join(cacheFolder, os.path.splitext(os.path.basename(gbkPath))[0] + ".refcache.npz")
+
+
+def getReferenceFingerprint(gbkPath:str):
+    return fileHandling.hashFiles([gbkPath], [referenceCacheVersion])
+
+
+def readGenBankRecord(gbkPath:str):
+    from Bio import SeqIO
+    recordList = [record for record in SeqIO.parse(gbkPath, 'genbank')]
+    if not recordList:
+        raise RuntimeError("Reference genome %s returned no records" % gbkPath)
+    if len(recordList) > 1:
+        print("WARNING: %s appears to have multiple records" % gbkPath)
+    return recordList[0]
+
+
+def compileReferenceRecord(gbRecord, fingerprint:str=""):
+    from Bio import Seq
+    sequence = str(gbRecord.seq)
+    geneIDs = []
+    geneStarts = []
+    geneEnds = []
+    translations = []
+    for feature in gbRecord.features:
+        if not feature.type == "gene":
+            continue
+        geneID = feature.qualifiers["gene"][0]
+        if geneID in geneIDs:
+            geneIndex = geneIDs.index(geneID)
+            geneStarts[geneIndex] = feature.location.nofuzzy_start
+            geneEnds[geneIndex] = feature.location.nofuzzy_end
+            continue
+        geneIDs.append(geneID)
+        geneStarts.append(feature.location.nofuzzy_start)
+        geneEnds.append(feature.location.nofuzzy_end)
+    for geneStart, geneEnd in zip(geneStarts, geneEnds):
+        translations.append(str(Seq.translate(sequence[geneStart:geneEnd])))
+    return {
+        "fingerprint": fingerprint,
+        "recordID": gbRecord.id,
+        "sequence": numpy.frombuffer(sequence.encode("ascii"), dtype=numpy.uint8),
+        "geneIDs": numpy.array(geneIDs, dtype=str),
+        "geneStarts": numpy.array(geneStarts, dtype=numpy.int64),
+        "geneEnds": numpy.array(geneEnds, dtype=numpy.int64),
+        "translations": numpy.array(translations, dtype=str)
+    }
+
+
+def saveReferenceCache(referenceData:dict, cachePath:str):
+    cacheFolder = os.path.dirname(cachePath)
+    if cacheFolder and not os.path.isdir(cacheFolder):
+        os.makedirs(cacheFolder, exist_ok=True)
+    temporaryPath = "%s.%s.tmp" %(cachePath, os.getpid())
+    outputFile = open(temporaryPath, 'wb')
+    numpy.savez_compressed(outputFile, **referenceData)
+    outputFile.close()
+    os.replace(temporaryPath, cachePath)
+    return cachePath
+
+
+def loadReferenceCache(cachePath:str):
+    archive = numpy.load(cachePath)
+    referenceData = {name: archive[name] for name in archive.files}
+    archive.close()
+    referenceData["fingerprint"] = str(referenceData["fingerprint"])
+    referenceData["recordID"] = str(referenceData["recordID"])
+    return referenceData
+
+
+def buildReferenceCache(gbkPath:str=referenceGenomePath, cacheFolder:str=defaultReferenceCacheFolder):
+    if not os.path.isfile(gbkPath):
+        raise FileNotFoundError("Unable to find reference file %s" %gbkPath)
+    cachePath = getReferenceCachePath(gbkPath, cacheFolder)
+    return saveReferenceCache(compileReferenceRecord(readGenBankRecord(gbkPath), getReferenceFingerprint(gbkPath)), cachePath)
 
 
 class ReferenceGenome:
 
-    def __init__(self, gbkPath:str=referenceGenomePath):
+    def __init__(self, gbkPath:str=referenceGenomePath, cacheFolder:str=defaultReferenceCacheFolder):
         self.gbkPath = gbkPath
         if not os.path.isfile(gbkPath):
             raise FileNotFoundError("Unable to find reference file %s" %gbkPath)
-        file = open(gbkPath, 'r')
-        self.__gbkStream = io.StringIO()
-        self.__gbkStream.write(file.read())
-        file.close()
-        self.__gbkStream.seek(0)
-        self.__gbHandle = SeqIO.parse(self.__gbkStream, 'genbank')
-        recordList = [record for record in self.__gbHandle]
-        if not recordList:
-            raise RuntimeError("Reference genome %s returned no records" % self.gbkPath)
-        self.gbRecord = recordList[0]
-        if len(recordList) > 1:
-            print("WARNING: %s appears to have multiple records" % gbkPath)
-        self.makeAttributes()
-
-    def makeAttributes(self):
-        self.geneTable = self.getGeneTable()
+        cachePath = None
+        if cacheFolder:
+            cachePath = getReferenceCachePath(gbkPath, cacheFolder)
+        self.cachePath = cachePath
+        self.cachedRecord = None
+        fingerprint = getReferenceFingerprint(gbkPath)
+        referenceData = None
+        if cachePath and os.path.isfile(cachePath):
+            try:
+                referenceData = loadReferenceCache(cachePath)
+            except (OSError, ValueError, KeyError):
+                referenceData = None
+        if referenceData is None or not referenceData["fingerprint"] == fingerprint:
+            referenceData = compileReferenceRecord(self.gbRecord, fingerprint)
+            if cachePath:
+                try:
+                    saveReferenceCache(referenceData, cachePath)
+                except OSError as error:
+                    print("WARNING: Unable to write reference cache %s: %s" %(cachePath, error), file=sys.stderr)
+        self.makeAttributes(referenceData)
+
+    @property
+    def gbRecord(self):
+        if self.cachedRecord is None:
+            self.cachedRecord = readGenBankRecord(self.gbkPath)
+        return self.cachedRecord
+
+    def makeAttributes(self, referenceData:dict):
+        self.recordID = referenceData["recordID"]
+        self.sequence = referenceData["sequence"].tobytes().decode("ascii")
+        geneIDs = [str(geneID) for geneID in referenceData["geneIDs"]]
+        geneLocations = list(zip(referenceData["geneStarts"].tolist(), referenceData["geneEnds"].tolist()))
+        self.geneTable = dict(zip(geneIDs, geneLocations))
         self.geneTableByLocation = self.getGeneTableByLocation()
         self.sequenceTable = self.getSequenceTableByGene()
-        self.translations = self.getTranslationTableByGene()
-
-    def getGeneTable(self):
-        def getGeneList():
-            genes = {}
-            for feature in self.gbRecord.features:
-                if feature.type == "gene":
-                    genes[feature.qualifiers["gene"][0]] = feature
-            return genes
-        geneList = getGeneList()
-        return geneList
+        self.translations = dict(zip(geneIDs, [str(translation) for translation in referenceData["translations"]]))
 
     def getGeneTableByLocation(self):
         geneTableByLocation = {}
-        for geneID, geneData in self.geneTable.items():
-            geneStart = geneData.location.nofuzzy_start
-            geneEnd = geneData.location.nofuzzy_end
-            geneLocationTuple = (geneStart, geneEnd)
+        for geneID, geneLocationTuple in self.geneTable.items():
             geneTableByLocation[geneLocationTuple] = geneID
         return geneTableByLocation
 
@@ -54,18 +142,20 @@ class ReferenceGenome:
         sequenceTable = {}
         for coordinates, geneID in self.geneTableByLocation.items():
             start, end = coordinates
-            sequence = self.gbRecord.seq[start:end]
-            sequenceTable[geneID] = str(sequence)
+            sequenceTable[geneID] = self.sequence[start:end]
         return sequenceTable
 
-    def getTranslationTableByGene(self):
-        translationTable = {}
-        for geneID, sequence in self.sequenceTable.items():
-            translationTable[geneID] = Seq.translate(sequence)
-        return translationTable
 
 if __name__ == "__main__":
-    reference = ReferenceGenome()
-    print("something")
-
-
+    import time
+    gbkPaths = sys.argv[1:]
+    if not gbkPaths:
+        gbkPaths = [referenceGenomePath]
+    for gbkPath in gbkPaths:
+        startTime = time.perf_counter()
+        cachePath = buildReferenceCache(gbkPath)
+        buildTime = time.perf_counter() - startTime
+        startTime = time.perf_counter()
+        reference = ReferenceGenome(gbkPath)
+        loadTime = time.perf_counter() - startTime
+        print("Compiled %s (%s genes, %s bp) to %s in %.2f s; cached load takes %.2f ms" %(gbkPath, len(reference.geneTable), len(reference.sequence), cachePath, buildTime, loadTime * 1000))
@@ -0,0 +1,104 @@
+import os
+import json
+import pickle
+import datetime
+import typing
+try:
+    import fileHandling
+except ImportError:
+    from . import fileHandling
+
+
+manifestVersion = 1
+
+
+def writeFileAtomically(outputPath:str, data:[str, bytes]):
+    temporaryPath = "%s.%s.tmp" %(outputPath, os.getpid())
+    if type(data) == bytes:
+        outputFile = open(temporaryPath, 'wb')
+    else:
+        outputFile = open(temporaryPath, 'w')
+    outputFile.write(data)
+    outputFile.close()
+    os.replace(temporaryPath, outputPath)
+    return outputPath
+
+
+def saveCheckpoint(checkpointPath:str, data):
+    return writeFileAtomically(checkpointPath, pickle.dumps(data))
+
+
+def loadCheckpoint(checkpointPath:str):
+    checkpointFile = open(checkpointPath, 'rb')
+    data = pickle.load(checkpointFile)
+    checkpointFile.close()
+    return data
+
+
+class RunManifest:
+
+    def __init__(self, manifestPath:str, dependencyFingerprint:str, dependencies:typing.Dict[str, str]=None):
+        self.manifestPath = manifestPath
+        self.dependencyFingerprint = dependencyFingerprint
+        self.dependencies = dependencies or {}
+        self.samples = {}
+        if os.path.isfile(manifestPath):
+            try:
+                manifestFile = open(manifestPath, 'r')
+                manifestData = json.load(manifestFile)
+                manifestFile.close()
+                if manifestData.get("version") == manifestVersion:
+                    self.samples = manifestData.get("samples", {})
+            except (OSError, ValueError):
+                print("WARNING: Unable to read run manifest at %s. All samples will be reprocessed." %manifestPath)
+
+    def isCurrent(self, inputName:str, inputHash:str):
+        entry = self.samples.get(inputName)
+        if not entry:
+            return False
+        if entry.get("inputHash") != inputHash or entry.get("dependencyFingerprint") != self.dependencyFingerprint:
+            return False
+        for artifactPath in entry.get("artifacts", {}).values():
+            if artifactPath and not os.path.exists(artifactPath):
+                return False
+        return True
+
+    def getEntry(self, inputName:str):
+        return self.samples.get(inputName)
+
+    def getCheckpointPath(self, inputName:str):
+        return os.path.join(os.path.dirname(self.manifestPath), "%s.checkpoint.pickle" %inputName)
+
+    def loadSampleCheckpoint(self, inputName:str):
+        entry = self.samples.get(inputName)
+        if not entry or not entry.get("artifacts", {}).get("checkpoint"):
+            return None
+        try:
+            return loadCheckpoint(entry["artifacts"]["checkpoint"])
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def recordSample(self, inputName:str, inputHash:str, sampleData:tuple, artifacts:typing.Dict[str, str]):
+        artifacts = dict(artifacts)
+        artifacts["checkpoint"] = saveCheckpoint(self.getCheckpointPath(inputName), sampleData)
+        self.samples[inputName] = {
+            "sampleID": sampleData[0],
+            "inputHash": inputHash,
+            "dependencyFingerprint": self.dependencyFingerprint,
+            "completed": datetime.datetime.now().isoformat(timespec="seconds"),
+            "artifacts": artifacts
+        }
+        self.save()
+
+    def save(self):
+        manifestData = {
+            "version": manifestVersion,
+            "dependencyFingerprint": self.dependencyFingerprint,
+            "dependencies": self.dependencies,
+            "samples": self.samples
+        }
+        writeFileAtomically(self.manifestPath, json.dumps(manifestData, indent=4))
+
+
+def hashInput(inputPath:str):
+    return fileHandling.hashFiles([inputPath])
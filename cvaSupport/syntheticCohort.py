@@ -0,0 +1,141 @@
+import os
+import typing
+import numpy
+try:
+    import referenceGenomeHandler
+    import vcfHandler
+    import vepCache
+    import nativeAnnotator
+except ImportError:
+    from . import referenceGenomeHandler
+    from . import vcfHandler
+    from . import vepCache
+    from . import nativeAnnotator
+
+
+localReferenceGenomePath = referenceGenomeHandler.referenceGenomePath
+
+filterValues = ["PASS", "weak_evidence", "strand_bias", "clustered_events", "haplotype"]
+filterWeights = [0.8, 0.1, 0.04, 0.04, 0.02]
+
+vcfHeaderLines = [
+    "##fileformat=VCFv4.2",
+    "##FILTER=<ID=PASS,Description=\"All filters passed\">",
+    "##FILTER=<ID=weak_evidence,Description=\"Mutation does not meet likelihood threshold\">",
+    "##FILTER=<ID=strand_bias,Description=\"Evidence for alt allele comes from one read direction only\">",
+    "##FILTER=<ID=clustered_events,Description=\"Clustered events observed in the tumor\">",
+    "##FILTER=<ID=haplotype,Description=\"Variant near filtered variant on same haplotype.\">",
+    "##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">",
+    "##FORMAT=<ID=AD,Number=R,Type=Integer,Description=\"Allelic depths for the ref and alt alleles in the order listed\">",
+    "##FORMAT=<ID=AF,Number=A,Type=Float,Description=\"Allele fractions of alternate alleles in the tumor\">",
+    "##FORMAT=<ID=DP,Number=1,Type=Integer,Description=\"Approximate read depth (reads with MQ=255 or with bad mates are filtered)\">",
+    "##FORMAT=<ID=SB,Number=4,Type=Integer,Description=\"Per-sample component statistics which comprise the Fisher's Exact Test to detect strand bias.\">",
+    "##FORMAT=<ID=MB,Number=4,Type=Integer,Description=\"Per-sample component statistics to detect mate bias\">",
+    "##INFO=<ID=DP,Number=1,Type=Integer,Description=\"Approximate read depth; some reads may have been filtered\">"
+]
+
+
+class SyntheticCohort:
+
+    def __init__(self, samples:int=10, variantsPerSample:int=100, indelFraction:float=0.1, meanDepth:float=1000, depthDispersion:float=2, seed:int=0, referenceGenome:referenceGenomeHandler.ReferenceGenome=None):
+        if referenceGenome is None:
+            referenceGenome = referenceGenomeHandler.ReferenceGenome(localReferenceGenomePath)
+        self.referenceGenome = referenceGenome
+        self.contig = referenceGenome.recordID
+        self.sequence = referenceGenome.sequence.upper()
+        self.samples = samples
+        self.variantsPerSample = min(variantsPerSample, len(self.sequence) - 20)
+        self.indelFraction = indelFraction
+        self.meanDepth = meanDepth
+        self.depthDispersion = depthDispersion
+        self.seed = seed
+        self.sitePool = self.makeSitePool()
+
+    def makeSitePool(self):
+        generator = numpy.random.default_rng(self.seed)
+        poolSize = min(len(self.sequence) - 20, self.variantsPerSample * 3)
+        positions = generator.choice(numpy.arange(2, len(self.sequence) - 15), size=poolSize, replace=False)
+        sitePool = []
+        for position in sorted(int(position) for position in positions):
+            base = self.sequence[position - 1]
+            if generator.random() < self.indelFraction:
+                indelLength = int(generator.choice([1, 2, 3, 3, 6, 9]))
+                if generator.random() < 0.5:
+                    ref = self.sequence[position - 1:position + indelLength]
+                    alt = base
+                else:
+                    ref = base
+                    alt = base + "".join(generator.choice(list("ACGT"), size=indelLength))
+            else:
+                ref = base
+                alt = str(generator.choice([nucleotide for nucleotide in "ACGT" if nucleotide != base]))
+            sitePool.append((position, ref, alt))
+        return sitePool
+
+    def sampleName(self, sampleNumber:int):
+        return "synthetic%05d" %sampleNumber
+
+    def makeSampleVariants(self, sampleNumber:int):
+        generator = numpy.random.default_rng((self.seed, sampleNumber))
+        siteIndices = numpy.sort(generator.choice(len(self.sitePool), size=self.variantsPerSample, replace=False))
+        dispersion = self.depthDispersion
+        depths = generator.negative_binomial(dispersion, dispersion / (dispersion + self.meanDepth), size=len(siteIndices)) + 1
+        isFixed = generator.random(len(siteIndices)) < 0.6
+        alleleFractions = numpy.where(isFixed, generator.beta(20, 0.5, len(siteIndices)), generator.beta(0.5, 10, len(siteIndices)))
+        altDepths = generator.binomial(depths, alleleFractions)
+        refDepths = depths - altDepths
+        filters = generator.choice(filterValues, size=len(siteIndices), p=filterWeights)
+        variants = []
+        for index, siteIndex in enumerate(siteIndices):
+            position, ref, alt = self.sitePool[siteIndex]
+            refDepth = int(refDepths[index])
+            altDepth = int(altDepths[index])
+            forwardRef = int(generator.binomial(refDepth, 0.5))
+            forwardAlt = int(generator.binomial(altDepth, 0.5))
+            strandBias = [forwardRef, refDepth - forwardRef, forwardAlt, altDepth - forwardAlt]
+            firstRef = int(generator.binomial(refDepth, 0.5))
+            firstAlt = int(generator.binomial(altDepth, 0.5))
+            mateBias = [firstRef, refDepth - firstRef, firstAlt, altDepth - firstAlt]
+            variants.append((position, ref, alt, str(filters[index]), refDepth, altDepth, strandBias, mateBias))
+        return variants
+
+    def writeVCF(self, sampleNumber:int, outputPath:str):
+        sampleName = self.sampleName(sampleNumber)
+        outputFile = open(outputPath, 'w')
+        for headerLine in vcfHeaderLines:
+            print(headerLine, file=outputFile)
+        print("##contig=<ID=%s,length=%s>" %(self.contig, len(self.sequence)), file=outputFile)
+        print("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT", sampleName]), file=outputFile)
+        for position, ref, alt, filterValue, refDepth, altDepth, strandBias, mateBias in self.makeSampleVariants(sampleNumber):
+            depth = refDepth + altDepth
+            alleleFraction = "%.3f" %(altDepth / depth)
+            sampleField = ":".join(["0/1", "%s,%s" %(refDepth, altDepth), alleleFraction, str(depth), ",".join(str(count) for count in strandBias), ",".join(str(count) for count in mateBias)])
+            print("\t".join([self.contig, str(position), ".", ref, alt, ".", filterValue, "DP=%s" %depth, "GT:AD:AF:DP:SB:MB", sampleField]), file=outputFile)
+        outputFile.close()
+        return outputPath
+
+    def writeCohort(self, vcfFolder:str, vepFolder:str=None, annotator:nativeAnnotator.NativeAnnotator=None):
+        if not os.path.isdir(vcfFolder):
+            os.makedirs(vcfFolder)
+        if vepFolder and annotator is None:
+            annotator = nativeAnnotator.NativeAnnotator(self.referenceGenome)
+        if vepFolder and not os.path.isdir(vepFolder):
+            os.makedirs(vepFolder)
+        samplePaths = []
+        for sampleNumber in range(self.samples):
+            vcfPath = self.writeVCF(sampleNumber, os.path.join(vcfFolder, "%s.vcf" %self.sampleName(sampleNumber)))
+            vepPath = None
+            if vepFolder:
+                vepPath = annotateVCF(vcfPath, os.path.join(vepFolder, "%s.vep.txt" %self.sampleName(sampleNumber)), annotator)
+            samplePaths.append((vcfPath, vepPath))
+        return samplePaths
+
+
+def annotateVCF(vcfPath:str, outputPath:str, annotator:nativeAnnotator.NativeAnnotator):
+    vepLineTable = {}
+    for contig, position, ref, alts, filter, mateBias, strandBias, sampleID in vcfHandler.iterVCFFields(vcfPath):
+        for altAlleleNumber in range(len(alts)):
+            variantRecord = vcfHandler.VariantRecord.fromVCFFields(contig, position, ref, alts, filter, altAlleleNumber=altAlleleNumber)
+            if not variantRecord.vepIdentifier in vepLineTable:
+                vepLineTable[variantRecord.vepIdentifier] = [variantEffect.toVEPLine() for variantEffect in annotator.annotateVariantRecord(variantRecord)]
+    return vepCache.writeVEPFile(vepLineTable, outputPath)
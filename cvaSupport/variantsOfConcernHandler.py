@@ -1,5 +1,7 @@
+import os
+import re
 import json
-import gzip
+import pickle
 import typing
 try:
     import fileHandling
@@ -12,48 +14,141 @@ variantsOfConcernFile = "/opt/vep/ronavep/references/variantsOfConcern.json"
 
 
 def loadVariantsOfConcern(filePath:str = variantsOfConcernFile):
-    if fileHandling.isGzipped(filePath):
-        jsonFile = gzip.open(filePath, 'rt')
+    return json.loads(fileHandling.readBytes(filePath))
+
+
+deletionPattern = re.compile(r"^del(\d+)(?:-(\d+))?\s*([A-Z*]*)$")
+insertionPattern = re.compile(r"^ins(\d+)(?:-(\d+))?\s*([A-Z*]+)$")
+substitutionPattern = re.compile(r"^([A-Z*]+|-)(\d+)(?:-(\d+))?([A-Z*]+|-)$")
+
+
+def normalizeProteinChange(gene:str, start:int, ref:str, alt:str):
+    ref = ref.replace("-", "")
+    alt = alt.replace("-", "")
+    while ref and alt and ref[0] == alt[0]:
+        ref = ref[1:]
+        alt = alt[1:]
+        start += 1
+    while ref and alt and ref[-1] == alt[-1]:
+        ref = ref[:-1]
+        alt = alt[:-1]
+    if ref and not alt:
+        return (gene, "del", start, start + len(ref) - 1)
+    elif alt and not ref:
+        return (gene, "ins", start - 1, alt)
+    elif not ref and not alt:
+        return None
     else:
-        jsonFile = open(filePath, 'r')
-    data = json.load(jsonFile)
-    jsonFile.close()
-    return data
-
-
-def applyVariantsOfConcern(mutantDataList:typing.List[mutationDataMerge.CombinedMutantData], variantsTable:dict=None):
-    if not variantsTable:
-        variantsTable = loadVariantsOfConcern()
-    strainTable = variantsTable["strains"]
-    molecularTable = variantsTable["molecular"]
-    strainObservationTable = {}
-    variantToStrainTable = {}
-    allVariantsOfConcern = set()
-    for strain in strainTable:
-        strainObservationTable[strain] = {}
-        for gene, variantList in strainTable[strain]["mutations"].items():
-            for variant in variantList:
-                if not variant in variantToStrainTable:
-                    variantToStrainTable[variant] = []
-                variantToStrainTable[variant].append(strain)
-                strainObservationTable[strain][variant] = 0
-                allVariantsOfConcern.add(variant)
-    for variant in molecularTable:
-        allVariantsOfConcern.add(variant)
-    for variantRecord in mutantDataList:
-        proteinChange = variantRecord.proteinChange
-        if not proteinChange:
-            continue
-        if not proteinChange in allVariantsOfConcern:
-            continue
-        if proteinChange in variantToStrainTable:
-            concern = "Strain associated: %s" %(", ".join(variantToStrainTable[proteinChange]))
-            variantRecord.addAlert(concern)
-        if proteinChange in molecularTable:
-            variantRecord.addAlert(molecularTable[proteinChange]['note'])
-        for strain, mutations in strainObservationTable.items():
-            if proteinChange in mutations:
-                strainObservationTable[strain][proteinChange] = variantRecord.percentAlt * 100
-    return strainObservationTable
+        return (gene, "sub", start, alt)
+
+
+def normalizeProteinChangeNotation(notation:str):
+    if not notation or not ":" in notation:
+        return None
+    gene, change = notation.strip().split(":", 1)
+    change = change.strip()
+    deletion = deletionPattern.match(change)
+    if deletion:
+        start = int(deletion.group(1))
+        if deletion.group(2):
+            end = int(deletion.group(2))
+        else:
+            end = start + max(len(deletion.group(3)), 1) - 1
+        return (gene, "del", start, end)
+    insertion = insertionPattern.match(change)
+    if insertion:
+        return (gene, "ins", int(insertion.group(1)), insertion.group(3))
+    substitution = substitutionPattern.match(change)
+    if substitution:
+        return normalizeProteinChange(gene, int(substitution.group(2)), substitution.group(1), substitution.group(4))
+    return None
+
+
+class VariantsOfConcernMatcher:
+
+    def __init__(self, variantsTable:dict, fingerprint:str=""):
+        self.fingerprint = fingerprint
+        self.strainObservationTemplate = {}
+        self.strainsByKey = {}
+        self.observationsByKey = {}
+        self.notesByKey = {}
+        for strain, strainData in variantsTable["strains"].items():
+            self.strainObservationTemplate[strain] = {}
+            for gene, variantList in strainData["mutations"].items():
+                for variant in variantList:
+                    self.strainObservationTemplate[strain][variant] = 0
+                    key = self.makeKey(variant)
+                    if not key in self.strainsByKey:
+                        self.strainsByKey[key] = []
+                        self.observationsByKey[key] = []
+                    self.strainsByKey[key].append(strain)
+                    self.observationsByKey[key].append((strain, variant))
+        for variant, variantData in variantsTable["molecular"].items():
+            key = self.makeKey(variant)
+            if not key in self.notesByKey:
+                self.notesByKey[key] = []
+            self.notesByKey[key].append(variantData["note"])
+
+    @staticmethod
+    def makeKey(notation:str):
+        key = normalizeProteinChangeNotation(notation)
+        if key is None:
+            return notation
+        return key
+
+    def match(self, mutantDataList:typing.List[mutationDataMerge.CombinedMutantData]):
+        strainObservationTable = {strain: observations.copy() for strain, observations in self.strainObservationTemplate.items()}
+        for variantRecord in mutantDataList:
+            proteinChange = variantRecord.proteinChange
+            if not proteinChange:
+                continue
+            key = self.makeKey(proteinChange)
+            if key in self.strainsByKey:
+                concern = "Strain associated: %s" %(", ".join(self.strainsByKey[key]))
+                variantRecord.addAlert(concern)
+                for strain, variant in self.observationsByKey[key]:
+                    strainObservationTable[strain][variant] = variantRecord.percentAlt * 100
+            if key in self.notesByKey:
+                for note in self.notesByKey[key]:
+                    variantRecord.addAlert(note)
+        return strainObservationTable
+
+    def save(self, outputPath:str):
+        outputFile = open(outputPath, 'wb')
+        pickle.dump(self, outputFile)
+        outputFile.close()
+
+    @classmethod
+    def load(cls, inputPath:str):
+        inputFile = open(inputPath, 'rb')
+        matcher = pickle.load(inputFile)
+        inputFile.close()
+        if not isinstance(matcher, cls):
+            raise ValueError("%s does not contain a variants of concern matcher" %inputPath)
+        return matcher
+
+
+def loadVariantsOfConcernMatcher(filePath:str=variantsOfConcernFile, cacheFolder:str=""):
+    fingerprint = fileHandling.hashFiles([filePath])
+    cachePath = os.path.join(cacheFolder, "variantsOfConcernMatcher.pickle")
+    if cacheFolder and os.path.isfile(cachePath):
+        try:
+            matcher = VariantsOfConcernMatcher.load(cachePath)
+            if matcher.fingerprint == fingerprint:
+                return matcher
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+            pass
+    matcher = VariantsOfConcernMatcher(loadVariantsOfConcern(filePath), fingerprint)
+    if cacheFolder and os.path.isdir(cacheFolder):
+        temporaryPath = "%s.%s.tmp" %(cachePath, os.getpid())
+        matcher.save(temporaryPath)
+        os.replace(temporaryPath, cachePath)
+    return matcher
 
 
+def applyVariantsOfConcern(mutantDataList:typing.List[mutationDataMerge.CombinedMutantData], variantsTable:dict=None, matcher:VariantsOfConcernMatcher=None):
+    if matcher is None:
+        if not variantsTable:
+            variantsTable = loadVariantsOfConcern()
+        matcher = VariantsOfConcernMatcher(variantsTable)
+    return matcher.match(mutantDataList)
@@ -3,17 +3,22 @@ import vcf.model
 
 try:
     import fileHandling
+    import biasStatistics
 except ImportError:
     from . import fileHandling
-import gzip
+    from . import biasStatistics
 import os
 import io
-import scipy.stats
+import sys
 import json
+import typing
+import numpy
 
 
 class BiasTable:
 
+    __slots__ = ("forwardRefCount", "reverseRefCount", "forwardAltCount", "reverseAltCount", "statistics")
+
     def __init__(self, biasTable: list):
         if not len(biasTable) == 4:
             raise ValueError("Bias tables must be 4 items long")
@@ -21,8 +26,23 @@ class BiasTable:
             if not type(item) == int:
                 raise ValueError("All items in bias table must be integers")
         self.forwardRefCount, self.reverseRefCount, self.forwardAltCount, self.reverseAltCount = biasTable
-        self.oddsRatio, self.pValue = scipy.stats.fisher_exact(
-            [[self.forwardRefCount, self.reverseRefCount], [self.forwardAltCount, self.reverseAltCount]])
+        self.statistics = None
+
+    @property
+    def counts(self):
+        return (self.forwardRefCount, self.reverseRefCount, self.forwardAltCount, self.reverseAltCount)
+
+    @property
+    def oddsRatio(self):
+        if self.statistics is None:
+            self.statistics = biasStatistics.defaultEngine.fisherExact(self.counts)
+        return self.statistics[0]
+
+    @property
+    def pValue(self):
+        if self.statistics is None:
+            self.statistics = biasStatistics.defaultEngine.fisherExact(self.counts)
+        return self.statistics[1]
 
     @property
     def totalRefReads(self):
@@ -62,9 +82,11 @@ class BiasTable:
 
 class VariantRecord:
 
+    __slots__ = ("contig", "position", "ref", "alt", "filter", "isDeletion", "isIndel", "isSNV", "strandBias", "mateBias", "sampleID", "cachedVEPIdentifier", "cachedStandardMutationIdentifier")
+
     def __init__(self, contig: str, position: int, ref: str, alt: str, filter: list, isDeletion: bool, isIndel: bool,
                  isSNV: bool, mateBiasTable: list = None, strandBiasTable: list = None, sampleID:str=""):
-        self.contig = contig
+        self.contig = sys.intern(contig)
         self.position = position
         self.ref = ref
         self.alt = alt
@@ -80,7 +102,9 @@ class VariantRecord:
             self.mateBias = BiasTable(mateBiasTable)
         else:
             self.mateBias = None
-        self.sampleID = sampleID
+        self.sampleID = sys.intern(sampleID)
+        self.cachedVEPIdentifier = None
+        self.cachedStandardMutationIdentifier = None
 
     @property
     def refDepth(self):
@@ -117,6 +141,13 @@ class VariantRecord:
                    record.is_indel, record.is_snp, strandBias,
                    mateBias, record.samples[sampleNumber].sample)
 
+    @classmethod
+    def fromVCFFields(cls, contig: str, position: int, ref: str, alts: list, filter: list, mateBias: list = None,
+                      strandBias: list = None, sampleID: str = "", altAlleleNumber: int = 0):
+        isSNV, isIndel, isDeletion = classifyAlleles(ref, alts)
+        return cls(contig, position, ref, alts[altAlleleNumber], filter, isDeletion, isIndel, isSNV, strandBias,
+                   mateBias, sampleID)
+
     def toDict(self):
         dictionary = {
             "contig": self.contig,
@@ -141,47 +172,222 @@ class VariantRecord:
 
     @property
     def vepIdentifier(self):
+        if self.cachedVEPIdentifier is not None:
+            return self.cachedVEPIdentifier
         if self.isSNV:
-            return "%s_%s_%s/%s" % (self.contig, self.position, self.ref, self.alt)
+            identifier = "%s_%s_%s/%s" % (self.contig, self.position, self.ref, self.alt)
         elif self.isIndel:
             if self.isDeletion:
-                return "%s_%s_%s/%s" % (self.contig, self.position + 1, self.ref[1:], "-")
+                identifier = "%s_%s_%s/%s" % (self.contig, self.position + 1, self.ref[1:], "-")
             else:
-                return "%s_%s_%s/%s" % (self.contig, self.position + 1, "-", str(self.alt)[1:])
+                identifier = "%s_%s_%s/%s" % (self.contig, self.position + 1, "-", str(self.alt)[1:])
         else:
             raise RuntimeError("There should be no way to get to this value, please investigate")
+        self.cachedVEPIdentifier = sys.intern(identifier)
+        return self.cachedVEPIdentifier
 
     @property
     def standardMutationIdentifier(self):
+        if self.cachedStandardMutationIdentifier is not None:
+            return self.cachedStandardMutationIdentifier
         if self.isSNV:
-            return "%s_%s_%s/%s" % (self.contig, self.position, self.ref, self.alt)
+            identifier = "%s_%s_%s/%s" % (self.contig, self.position, self.ref, self.alt)
         elif self.isIndel:
             if self.isDeletion:
-                return "%s_%s:del%s" % (self.contig, self.position + 1, self.ref[1:])
+                identifier = "%s_%s:del%s" % (self.contig, self.position + 1, self.ref[1:])
             else:
-                return "%s_%s:ins%s" % (self.contig, self.position + 1, str(self.alt)[1:])
+                identifier = "%s_%s:ins%s" % (self.contig, self.position + 1, str(self.alt)[1:])
         else:
             raise RuntimeError("There should be no way to get to this value, please investigate")
+        self.cachedStandardMutationIdentifier = sys.intern(identifier)
+        return self.cachedStandardMutationIdentifier
+
+    def clearCachedIdentifiers(self):
+        self.cachedVEPIdentifier = None
+        self.cachedStandardMutationIdentifier = None
 
     def __str__(self):
         return self.standardMutationIdentifier
 
+def isSymbolicAllele(allele: str):
+    if allele is None:
+        return False
+    if allele.startswith("<") or "[" in allele or "]" in allele:
+        return True
+    return len(allele) > 1 and (allele.startswith(".") or allele.endswith("."))
+
+
+def classifyAlleles(ref: str, alts: list):
+    isSNV = len(ref) == 1
+    for alt in alts:
+        if alt is None or isSymbolicAllele(alt) or not alt in ["A", "C", "G", "T", "N", "*"]:
+            isSNV = False
+            break
+    isIndel = len(ref) > 1
+    if not isIndel:
+        for alt in alts:
+            if alt is None or isSymbolicAllele(alt):
+                break
+            if len(alt) != len(ref):
+                isIndel = True
+                break
+    isDeletion = isIndel and len(alts) == 1 and alts[0] is not None and len(ref) > len(alts[0])
+    return isSNV, isIndel, isDeletion
+
+
+def parseFilterField(filterField: str):
+    if filterField == ".":
+        return None
+    elif filterField == "PASS":
+        return []
+    else:
+        return filterField.split(";")
+
+
+def parseIntegerListField(field: str):
+    if not field or field == ".":
+        return None
+    return [int(value) for value in field.split(",")]
+
+
+def getInfoValue(infoField: str, key: str):
+    for infoItem in infoField.split(";"):
+        if infoItem.startswith(key + "="):
+            return infoItem[len(key) + 1:]
+    return None
+
+
+def parseVCFColumns(columns: typing.List[str], formatCache: dict, sampleNumber: int = 0):
+    contig, position, identifier, ref, alt, quality, filterField, infoField = columns[:8]
+    if alt == ".":
+        alts = [None]
+    else:
+        alts = alt.split(",")
+    mateBias = None
+    strandBias = None
+    if len(columns) > 9 + sampleNumber:
+        formatField = columns[8]
+        if not formatField in formatCache:
+            formatFields = formatField.split(":")
+            formatCache[formatField] = (formatFields.index("MB") if "MB" in formatFields else None, formatFields.index("SB") if "SB" in formatFields else None)
+        mateBiasIndex, strandBiasIndex = formatCache[formatField]
+        sampleFields = columns[9 + sampleNumber].split(":")
+        if mateBiasIndex is not None and mateBiasIndex < len(sampleFields):
+            mateBias = parseIntegerListField(sampleFields[mateBiasIndex])
+        if strandBiasIndex is not None:
+            if strandBiasIndex < len(sampleFields):
+                strandBias = parseIntegerListField(sampleFields[strandBiasIndex])
+        else:
+            strandBias = parseIntegerListField(getInfoValue(infoField, "DP4"))
+    return contig, int(position), ref, alts, parseFilterField(filterField), mateBias, strandBias
+
+
+def getHeaderSampleID(headerLine: str, sampleNumber: int = 0):
+    headerColumns = headerLine.rstrip("\r\n").split("\t")
+    if len(headerColumns) > 9 + sampleNumber:
+        return headerColumns[9 + sampleNumber]
+    return ""
+
+
+def iterVCFFields(vcfPath: str, sampleNumber: int = 0):
+    if not os.path.isfile(vcfPath):
+        raise FileNotFoundError("Unable to find VCF at %s" % vcfPath)
+    sampleID = ""
+    formatCache = {}
+    for line in fileHandling.iterLines(vcfPath):
+        if line.startswith(b"#"):
+            if line.startswith(b"#CHROM"):
+                sampleID = getHeaderSampleID(line.decode(), sampleNumber)
+            continue
+        line = line.decode().rstrip("\r\n")
+        if not line.strip():
+            continue
+        yield parseVCFColumns(line.split("\t"), formatCache, sampleNumber) + (sampleID,)
+
+
+def iterVCFFast(vcfPath: str, sampleNumber: int = 0):
+    for contig, position, ref, alts, filter, mateBias, strandBias, sampleID in iterVCFFields(vcfPath, sampleNumber):
+        yield VariantRecord.fromVCFFields(contig, position, ref, alts, filter, mateBias, strandBias, sampleID)
+
+
+def readVCFColumns(vcfPath: str, sampleNumber: int = 0):
+    contigs = []
+    positions = []
+    refs = []
+    alts = []
+    filters = []
+    snvFlags = []
+    indelFlags = []
+    deletionFlags = []
+    mateBiasTables = []
+    strandBiasTables = []
+    sampleID = ""
+    for contig, position, ref, altList, filter, mateBias, strandBias, sampleID in iterVCFFields(vcfPath, sampleNumber):
+        isSNV, isIndel, isDeletion = classifyAlleles(ref, altList)
+        contigs.append(contig)
+        positions.append(position)
+        refs.append(ref)
+        alts.append(altList[0])
+        filters.append(filter)
+        snvFlags.append(isSNV)
+        indelFlags.append(isIndel)
+        deletionFlags.append(isDeletion)
+        mateBiasTables.append(mateBias if mateBias else [-1, -1, -1, -1])
+        strandBiasTables.append(strandBias if strandBias else [-1, -1, -1, -1])
+    return {
+        "sampleID": sampleID,
+        "contig": numpy.array(contigs, dtype=object),
+        "position": numpy.array(positions, dtype=numpy.int64),
+        "ref": numpy.array(refs, dtype=object),
+        "alt": numpy.array(alts, dtype=object),
+        "filter": filters,
+        "isSNV": numpy.array(snvFlags, dtype=bool),
+        "isIndel": numpy.array(indelFlags, dtype=bool),
+        "isDeletion": numpy.array(deletionFlags, dtype=bool),
+        "mateBias": numpy.array(mateBiasTables, dtype=numpy.int64).reshape(-1, 4),
+        "strandBias": numpy.array(strandBiasTables, dtype=numpy.int64).reshape(-1, 4)
+    }
+
+
 def readVCF(vcfPath: str):
     if not os.path.isfile(vcfPath):
         raise FileNotFoundError("Unable to find VCF at %s" % vcfPath)
-    if fileHandling.isGzipped(vcfPath):
-        vcfFileHandle = gzip.open(vcfPath, 'rt')
-    else:
-        vcfFileHandle = open(vcfPath, 'r')
-    vcfStream = io.StringIO()
-    vcfStream.write(vcfFileHandle.read())
-    vcfFileHandle.close()
-    vcfStream.seek(0)
+    vcfStream = io.StringIO(fileHandling.readBytes(vcfPath).decode())
     vcfHandle = vcf.Reader(vcfStream)
     recordList = [record for record in vcfHandle]
     return vcfHandle, recordList
 
 
+def iterVCFRecords(vcfPath: str):
+    if not os.path.isfile(vcfPath):
+        raise FileNotFoundError("Unable to find VCF at %s" % vcfPath)
+    vcfFileHandle = fileHandling.openTextFile(vcfPath)
+    try:
+        for record in vcf.Reader(vcfFileHandle, compressed=False):
+            yield record
+    finally:
+        vcfFileHandle.close()
+
+
+def iterVCF(vcfPath: str, fastParser: bool = True):
+    if fastParser:
+        yield from iterVCFFast(vcfPath)
+        return
+    for record in iterVCFRecords(vcfPath):
+        yield VariantRecord.fromVCFRecord(record)
+
+
+def computeBiasStatistics(variantRecords: typing.Iterable[VariantRecord], engine: biasStatistics.FisherExactEngine = biasStatistics.defaultEngine):
+    biasTables = []
+    for variantRecord in variantRecords:
+        for biasTable in [variantRecord.strandBias, variantRecord.mateBias]:
+            if biasTable is not None and biasTable.statistics is None:
+                biasTables.append(biasTable)
+    for biasTable, statistics in zip(biasTables, engine.fisherExactMany([biasTable.counts for biasTable in biasTables])):
+        biasTable.statistics = statistics
+    return len(biasTables)
+
+
 def processVCFRecordList(recordList: list):
     processedRecordCollection = []
     for record in recordList:
@@ -192,12 +398,32 @@ def processVCFRecordList(recordList: list):
 def processVCF(vcfPath:str):
     if not os.path.isfile(vcfPath):
         raise FileNotFoundError("Unable to find VCF at %s" %vcfPath)
-    vcfHandle, recordList = readVCF(vcfPath)
-    return processVCFRecordList(recordList)
+    return list(iterVCF(vcfPath))
 
 
 
 if __name__ == "__main__":
-    vcfHandle, recordList = readVCF("/opt/vep/ronavep/references/in2442-23.hard-filtered.vcf.gz")
-    processedRecords = processVCFRecordList(recordList)
-    print("something")
\ No newline at end of file
+    import timeit
+    vcfPath = "/opt/vep/ronavep/references/in2442-23.hard-filtered.vcf.gz"
+    if len(sys.argv) > 1:
+        vcfPath = sys.argv[1]
+    def recordSummary(record: VariantRecord):
+        return (record.contig, record.position, record.ref, str(record.alt), record.filter, record.isDeletion, record.isIndel, record.isSNV, str(record.strandBias), str(record.mateBias), record.sampleID)
+    pyvcfRecords = [recordSummary(record) for record in iterVCF(vcfPath, fastParser=False)]
+    fastRecords = [recordSummary(record) for record in iterVCF(vcfPath, fastParser=True)]
+    if pyvcfRecords != fastRecords:
+        raise RuntimeError("Fast parser records did not match pyvcf records for %s" % vcfPath)
+    repeats = 20
+    pyvcfParseTime = timeit.timeit(lambda: list(iterVCFRecords(vcfPath)), number=repeats) / repeats
+    fastParseTime = timeit.timeit(lambda: list(iterVCFFields(vcfPath)), number=repeats) / repeats
+    columnarTime = timeit.timeit(lambda: readVCFColumns(vcfPath), number=repeats) / repeats
+    pyvcfTime = timeit.timeit(lambda: list(iterVCF(vcfPath, fastParser=False)), number=repeats) / repeats
+    fastTime = timeit.timeit(lambda: list(iterVCF(vcfPath, fastParser=True)), number=repeats) / repeats
+    print("%s records matched between parsers" % len(fastRecords))
+    print("Parsing only:")
+    print("    pyvcf parser:    %.2f ms per file" % (pyvcfParseTime * 1000))
+    print("    fast parser:     %.2f ms per file (%.1fx)" % (fastParseTime * 1000, pyvcfParseTime / fastParseTime))
+    print("    columnar parser: %.2f ms per file (%.1fx)" % (columnarTime * 1000, pyvcfParseTime / columnarTime))
+    print("Parsing and building VariantRecords:")
+    print("    pyvcf parser:    %.2f ms per file" % (pyvcfTime * 1000))
+    print("    fast parser:     %.2f ms per file (%.1fx)" % (fastTime * 1000, pyvcfTime / fastTime))
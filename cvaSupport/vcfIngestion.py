@@ -0,0 +1,62 @@
+import os
+import typing
+try:
+    import fileHandling
+    import vcfHandler
+    import freyjaVCFModder
+except ImportError:
+    from . import fileHandling
+    from . import vcfHandler
+    from . import freyjaVCFModder
+
+
+class IngestedVCF:
+
+    __slots__ = ("vcfPath", "sampleID", "variantTable", "freyjaOutput", "vepOutput")
+
+    def __init__(self, vcfPath:str, sampleID:str, variantTable:typing.Dict[str, vcfHandler.VariantRecord], freyjaOutput:str=None, vepOutput:str=None):
+        self.vcfPath = vcfPath
+        self.sampleID = sampleID
+        self.variantTable = variantTable
+        self.freyjaOutput = freyjaOutput
+        self.vepOutput = vepOutput
+
+    @property
+    def variantRecords(self):
+        return list(self.variantTable.values())
+
+
+def ingestVCF(vcfPath:str, freyjaOutputPath:str=None, freyjaOutputFormat:str="vcf", freyjaIndexPath:str=None, sampleNumber:int=0):
+    if not os.path.isfile(vcfPath):
+        raise FileNotFoundError("Unable to find VCF at %s" %vcfPath)
+    freyjaWriter = None
+    if freyjaOutputPath:
+        freyjaWriter = freyjaVCFModder.FreyjaVCFWriter(freyjaOutputPath, freyjaOutputFormat, freyjaIndexPath)
+    sampleID = ""
+    formatCache = {}
+    variantTable = {}
+    try:
+        for line in fileHandling.iterLines(vcfPath):
+            line = line.decode()
+            if freyjaWriter is not None:
+                freyjaWriter.writeLine(line)
+            if line.startswith("#"):
+                if line.startswith("#CHROM"):
+                    sampleID = vcfHandler.getHeaderSampleID(line, sampleNumber)
+                continue
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            contig, position, ref, alts, filter, mateBias, strandBias = vcfHandler.parseVCFColumns(line.split("\t"), formatCache, sampleNumber)
+            variantRecord = vcfHandler.VariantRecord.fromVCFFields(contig, position, ref, alts, filter, mateBias, strandBias, sampleID)
+            variantTable[variantRecord.vepIdentifier] = variantRecord
+    except BaseException:
+        if freyjaWriter is not None:
+            freyjaWriter.abort()
+        raise
+    freyjaOutput = None
+    if freyjaWriter is not None:
+        freyjaOutput = freyjaWriter.close()
+    if not variantTable:
+        raise ValueError("No variant records were found in %s" %vcfPath)
+    return IngestedVCF(vcfPath, sampleID, variantTable, freyjaOutput)
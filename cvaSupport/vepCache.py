@@ -0,0 +1,87 @@
+import sqlite3
+import typing
+try:
+    import fileHandling
+    import vepHandler
+except ImportError:
+    from . import fileHandling
+    from . import vepHandler
+
+
+vepOutputColumns = ["#Uploaded_variation", "Location", "Allele", "Gene", "Feature", "Feature_type", "Consequence", "cDNA_position", "CDS_position", "Protein_position", "Amino_acids", "Codons", "Existing_variation", "Extra"]
+
+
+class AnnotationCache:
+
+    def __init__(self, cachePath:str, fingerprint:str):
+        self.cachePath = cachePath
+        self.fingerprint = fingerprint
+        connection = self.connect()
+        connection.execute("CREATE TABLE IF NOT EXISTS annotations (fingerprint TEXT NOT NULL, identifier TEXT NOT NULL, vepLines TEXT NOT NULL, PRIMARY KEY (fingerprint, identifier))")
+        connection.commit()
+        connection.close()
+
+    def connect(self):
+        return sqlite3.connect(self.cachePath, timeout=60)
+
+    def getVEPLines(self, identifiers:typing.Iterable[str]):
+        identifiers = list(set(identifiers))
+        cachedLines = {}
+        connection = self.connect()
+        batchSize = 500
+        for batchStart in range(0, len(identifiers), batchSize):
+            batch = identifiers[batchStart:batchStart + batchSize]
+            query = "SELECT identifier, vepLines FROM annotations WHERE fingerprint = ? AND identifier IN (%s)" %(", ".join(["?"] * len(batch)))
+            for identifier, vepLines in connection.execute(query, [self.fingerprint] + batch):
+                if vepLines:
+                    cachedLines[identifier] = vepLines.split("\n")
+                else:
+                    cachedLines[identifier] = []
+        connection.close()
+        return cachedLines
+
+    def getVariantEffects(self, identifiers:typing.Iterable[str]):
+        variantEffects = []
+        for identifier, vepLines in self.getVEPLines(identifiers).items():
+            for vepLine in vepLines:
+                variantEffects.append(vepHandler.VariantEffect.fromVEPLine(vepLine))
+        return variantEffects
+
+    def storeVEPLines(self, vepLineTable:typing.Dict[str, typing.List[str]]):
+        connection = self.connect()
+        connection.executemany("INSERT OR REPLACE INTO annotations (fingerprint, identifier, vepLines) VALUES (?, ?, ?)", [(self.fingerprint, identifier, "\n".join(vepLines)) for identifier, vepLines in vepLineTable.items()])
+        connection.commit()
+        connection.close()
+
+    def storeVEPFile(self, vepFilePath:str):
+        vepLineTable = {}
+        vepFile = open(vepFilePath, 'r')
+        for line in vepFile:
+            if line.startswith("#"):
+                continue
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            identifier = line.split("\t", 1)[0].strip()
+            if not identifier in vepLineTable:
+                vepLineTable[identifier] = []
+            vepLineTable[identifier].append(line)
+        vepFile.close()
+        self.storeVEPLines(vepLineTable)
+        return vepLineTable
+
+    def __len__(self):
+        connection = self.connect()
+        count = connection.execute("SELECT COUNT(*) FROM annotations WHERE fingerprint = ?", [self.fingerprint]).fetchone()[0]
+        connection.close()
+        return count
+
+
+def writeVEPFile(vepLineTable:typing.Dict[str, typing.List[str]], outputPath:str):
+    outputFile = open(outputPath, 'w')
+    print("\t".join(vepOutputColumns), file=outputFile)
+    for identifier, vepLines in vepLineTable.items():
+        for vepLine in vepLines:
+            print(vepLine, file=outputFile)
+    outputFile.close()
+    return outputPath
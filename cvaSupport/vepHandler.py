@@ -2,8 +2,10 @@ try:
     import fileHandling
 except ImportError:
     from . import fileHandling
-import gzip
 import os
+import sys
+import typing
+import numpy
 
 
 missenseVariants = [
@@ -34,24 +36,71 @@ outsideGeneVariants = [
 
 codingVariants = missenseVariants + nonsenseVariants + inFrameIndelVariants
 
+consequenceSeverity = [
+    "transcript_ablation",
+    "splice_acceptor_variant",
+    "splice_donor_variant",
+    "stop_gained",
+    "frameshift_variant",
+    "stop_lost",
+    "start_lost",
+    "transcript_amplification",
+    "inframe_insertion",
+    "inframe_deletion",
+    "missense_variant",
+    "protein_altering_variant",
+    "splice_region_variant",
+    "incomplete_terminal_codon_variant",
+    "start_retained_variant",
+    "stop_retained_variant",
+    "synonymous_variant",
+    "coding_sequence_variant",
+    "mature_miRNA_variant",
+    "5_prime_UTR_variant",
+    "3_prime_UTR_variant",
+    "non_coding_transcript_exon_variant",
+    "intron_variant",
+    "NMD_transcript_variant",
+    "non_coding_transcript_variant",
+    "upstream_gene_variant",
+    "downstream_gene_variant",
+    "TFBS_ablation",
+    "TFBS_amplification",
+    "TF_binding_site_variant",
+    "regulatory_region_ablation",
+    "regulatory_region_amplification",
+    "feature_elongation",
+    "regulatory_region_variant",
+    "feature_truncation",
+    "intergenic_variant"
+]
+
+consequenceRanks = {consequence: rank for rank, consequence in enumerate(consequenceSeverity)}
+unrankedConsequence = len(consequenceSeverity)
+
+csqColumns = ["Allele", "Gene", "Feature", "Feature_type", "Consequence", "cDNA_position", "CDS_position", "Protein_position", "Amino_acids", "Codons", "Existing_variation"]
+csqLayouts = {}
+
 
 class VariantEffect:
 
+    __slots__ = ("identifier", "position", "contig", "ref", "alt", "location", "allele", "gene", "feature", "featureType", "consequence", "cDNAPosition", "cdsPosition", "proteinPosition", "aminoAcid", "codons", "existingVariation", "notes", "isMissense", "isNonsense", "isCoding", "isMakingMutantProtein", "isSynonymous", "isInsideGene", "cachedProteinChangeNotation")
+
     def __init__(self, identifier:str, location:[str, int], allele:str, gene:str, feature:str, featureType:str, consequence:str, cDNAPosition:str, cdsPosition:str, proteinPosition:str, aminoAcid:str, codons:str, existingVariation:str, notes:str):
-        self.identifier = identifier
+        self.identifier = sys.intern(identifier)
         identifierSplit = identifier.split("_")
         if not len(identifierSplit) >= 3:
             raise ValueError("VEP identifiers should be at least three fields")
         variation = identifierSplit[-1]
         self.position = int(identifierSplit[-2])
-        self.contig = "_".join(identifierSplit[:-2])
+        self.contig = sys.intern("_".join(identifierSplit[:-2]))
         self.ref, self.alt = variation.split("/")[:2] #rare cases with 3 items, but item 3 appears not annotated. Need to dig more on this.
         self.location = str(location)
-        self.allele = allele
-        self.gene = gene
-        self.feature = feature
-        self.featureType = featureType
-        self.consequence = consequence
+        self.allele = sys.intern(allele)
+        self.gene = sys.intern(gene)
+        self.feature = sys.intern(feature)
+        self.featureType = sys.intern(featureType)
+        self.consequence = sys.intern(consequence)
         self.cDNAPosition = cDNAPosition
         if self.cDNAPosition == "-":
             self.cDNAPosition = None
@@ -67,7 +116,7 @@ class VariantEffect:
         self.codons = codons
         if self.codons == "-":
             self.codons = None
-        self.existingVariation = existingVariation
+        self.existingVariation = sys.intern(existingVariation)
         self.notes = notes
         self.isMissense = consequence in missenseVariants
         self.isNonsense = consequence in nonsenseVariants
@@ -75,6 +124,7 @@ class VariantEffect:
         self.isMakingMutantProtein = consequence in codingVariants and consequence not in nonsenseVariants
         self.isSynonymous = consequence in synonymousVariants
         self.isInsideGene = consequence not in outsideGeneVariants
+        self.cachedProteinChangeNotation = None
 
     @classmethod
     def fromVEPLine(cls, vepLine:str):
@@ -84,12 +134,21 @@ class VariantEffect:
         vepSplit = [item.strip() for item in vepSplit]
         return cls(*vepSplit)
 
+    def toVEPLine(self):
+        fields = [self.identifier, self.location, self.allele, self.gene, self.feature, self.featureType, self.consequence, self.cDNAPosition, self.cdsPosition, self.proteinPosition, self.aminoAcid, self.codons, self.existingVariation, self.notes]
+        return "\t".join(["-" if field is None else str(field) for field in fields])
+
     @classmethod
     def variantOfNoEffect(cls, identifier:str, position:[str, int], alt:str):
         return cls(identifier, position, alt, "-", "-", "-", "-", "-", "-", "-", "-", "-", "-", "")
 
     @property
     def proteinChangeNotation(self):
+        if self.cachedProteinChangeNotation is None:
+            self.cachedProteinChangeNotation = self.formatProteinChangeNotation()
+        return self.cachedProteinChangeNotation
+
+    def formatProteinChangeNotation(self):
         if not self.aminoAcid:
             return ""
         if not self.isCoding:
@@ -102,6 +161,9 @@ class VariantEffect:
         else:
             return "%s:%s%s%s" %(self.gene, reference, self.proteinPosition, alt)
 
+    def clearCachedProteinChangeNotation(self):
+        self.cachedProteinChangeNotation = None
+
     def __str__(self):
         proteinChange = self.proteinChangeNotation
         if proteinChange:
@@ -113,20 +175,153 @@ def processVEPFile(vepFilePath:str):
     vepLineCollection = []
     if not os.path.isfile(vepFilePath):
         raise FileNotFoundError("Unable to find VCF at %s" % vepFilePath)
-    if fileHandling.isGzipped(vepFilePath):
-        vepFileHandle = gzip.open(vepFilePath, 'rt')
-    else:
-        vepFileHandle = open(vepFilePath, 'r')
-    for line in vepFileHandle:
-        if line.startswith("#"):
+    for line in fileHandling.iterLines(vepFilePath):
+        if line.startswith(b"#"):
             continue
         if not line.strip():
             continue
-        vepLineCollection.append(VariantEffect.fromVEPLine(line))
-    vepFileHandle.close()
+        vepLineCollection.append(VariantEffect.fromVEPLine(line.decode()))
     return vepLineCollection
 
 
+def getConsequenceRank(consequence:str):
+    if not consequence in consequenceRanks:
+        consequenceRanks[consequence] = min([consequenceRanks.get(consequenceTerm, unrankedConsequence) for consequenceTerm in consequence.split(",")])
+    return consequenceRanks[consequence]
+
+
+def readVEPColumns(vepFilePath:str):
+    if not os.path.isfile(vepFilePath):
+        raise FileNotFoundError("Unable to find VEP output at %s" % vepFilePath)
+    identifierCodes = {}
+    identifiers = []
+    codes = []
+    ranks = []
+    lines = []
+    for line in fileHandling.iterLines(vepFilePath):
+        if line.startswith(b"#"):
+            continue
+        if not line.strip():
+            continue
+        vepSplit = line.split(b"\t", 7)
+        if len(vepSplit) < 8:
+            raise ValueError("VEP output lines should have exactly 14 elements")
+        identifier = vepSplit[0].strip()
+        if not identifier in identifierCodes:
+            identifierCodes[identifier] = len(identifiers)
+            identifiers.append(identifier)
+        codes.append(identifierCodes[identifier])
+        ranks.append(getConsequenceRank(vepSplit[6].strip().decode()))
+        lines.append(line)
+    return {
+        "identifier": identifiers,
+        "code": numpy.array(codes, dtype=numpy.int64),
+        "severity": numpy.array(ranks, dtype=numpy.int64),
+        "line": lines
+    }
+
+
+def selectMostSevereRows(codes:numpy.ndarray, severities:numpy.ndarray):
+    if not len(codes):
+        return numpy.array([], dtype=numpy.int64)
+    rows = numpy.arange(len(codes))
+    order = numpy.lexsort((-rows, severities, codes))
+    sortedCodes = codes[order]
+    firstOfCode = numpy.concatenate(([True], sortedCodes[1:] != sortedCodes[:-1]))
+    return order[firstOfCode]
+
+
+def processVEPTable(vepFilePath:str):
+    vepColumns = readVEPColumns(vepFilePath)
+    lines = vepColumns["line"]
+    vepTable = {}
+    for row in selectMostSevereRows(vepColumns["code"], vepColumns["severity"]):
+        variantEffect = VariantEffect.fromVEPLine(lines[row].decode())
+        vepTable[variantEffect.identifier] = variantEffect
+    return vepTable
+
+
+def parseCSQHeader(headerLine:str):
+    description = headerLine.split("Format:", 1)
+    if not len(description) == 2:
+        raise ValueError("Unable to find the CSQ field layout in header line %s" %headerLine.strip())
+    return description[1].strip().rstrip(">").rstrip("\"").strip().split("|")
+
+
+def getCSQLayout(csqFields:typing.List[str]):
+    csqFields = tuple(csqFields)
+    if not csqFields in csqLayouts:
+        missingColumns = [column for column in csqColumns if not column in csqFields]
+        if missingColumns:
+            raise ValueError("CSQ annotations are missing required fields: %s" %", ".join(missingColumns))
+        columnIndices = [csqFields.index(column) for column in csqColumns]
+        extraIndices = [(index, field) for index, field in enumerate(csqFields) if not field in csqColumns and not field == "ALLELE_NUM"]
+        alleleNumberIndex = csqFields.index("ALLELE_NUM") if "ALLELE_NUM" in csqFields else None
+        csqLayouts[csqFields] = (columnIndices, extraIndices, alleleNumberIndex)
+    return csqLayouts[csqFields]
+
+
+def getVEPLocation(identifier:str):
+    identifierSplit = identifier.split("_")
+    contig = "_".join(identifierSplit[:-2])
+    position = int(identifierSplit[-2])
+    ref = identifierSplit[-1].split("/")[0]
+    if ref == "-":
+        return "%s:%s-%s" %(contig, position - 1, position)
+    if len(ref) == 1:
+        return "%s:%s" %(contig, position)
+    return "%s:%s-%s" %(contig, position, position + len(ref) - 1)
+
+
+def selectCSQEntry(csqValue:str, csqLayout:tuple, allele:str, alleleNumber:int=1):
+    columnIndices, extraIndices, alleleNumberIndex = csqLayout
+    alleleIndex = columnIndices[0]
+    consequenceIndex = columnIndices[4]
+    selectedValues = None
+    selectedRank = None
+    for csqEntry in csqValue.split(","):
+        csqValues = csqEntry.split("|")
+        if alleleNumberIndex is not None:
+            if not csqValues[alleleNumberIndex] == str(alleleNumber):
+                continue
+        elif not csqValues[alleleIndex] == allele:
+            continue
+        rank = getConsequenceRank(csqValues[consequenceIndex].replace("&", ","))
+        if selectedRank is None or rank <= selectedRank:
+            selectedValues = csqValues
+            selectedRank = rank
+    return selectedValues
+
+
+def variantEffectFromCSQ(identifier:str, csqValues:typing.List[str], csqLayout:tuple):
+    columnIndices, extraIndices, alleleNumberIndex = csqLayout
+    fields = [csqValues[index] or "-" for index in columnIndices]
+    allele, gene, feature, featureType, consequence, cDNAPosition, cdsPosition, proteinPosition, aminoAcid, codons, existingVariation = fields
+    notes = ";".join(["%s=%s" %(field, csqValues[index]) for index, field in extraIndices if csqValues[index]])
+    return VariantEffect(identifier, getVEPLocation(identifier), allele, gene, feature, featureType, consequence.replace("&", ","), cDNAPosition, cdsPosition, proteinPosition, aminoAcid, codons, existingVariation, notes)
+
+
+def selectMostSevereEffects(variantEffects:typing.Iterable[VariantEffect]):
+    vepTable = {}
+    for variantEffect in variantEffects:
+        if variantEffect.identifier in vepTable and getConsequenceRank(vepTable[variantEffect.identifier].consequence) < getConsequenceRank(variantEffect.consequence):
+            continue
+        vepTable[variantEffect.identifier] = variantEffect
+    return vepTable
+
+
 if __name__ == "__main__":
-    variantEffects = processVEPFile("/opt/vep/ronavep/references/in2442-23.vep.txt")
-    print("something")
\ No newline at end of file
+    import timeit
+    vepPath = "/opt/vep/ronavep/references/in2442-23.vep.txt"
+    if len(sys.argv) > 1:
+        vepPath = sys.argv[1]
+    objectTable = selectMostSevereEffects(processVEPFile(vepPath))
+    columnarTable = processVEPTable(vepPath)
+    if [effect.toVEPLine() for effect in objectTable.values()] != [effect.toVEPLine() for effect in columnarTable.values()]:
+        raise RuntimeError("Columnar VEP table did not match the object parser for %s" % vepPath)
+    repeats = 20
+    objectTime = timeit.timeit(lambda: selectMostSevereEffects(processVEPFile(vepPath)), number=repeats) / repeats
+    columnarTime = timeit.timeit(lambda: processVEPTable(vepPath), number=repeats) / repeats
+    print("%s variants matched between parsers" % len(columnarTable))
+    print("    object parser:   %.2f ms per file" % (objectTime * 1000))
+    print("    columnar parser: %.2f ms per file (%.1fx)" % (columnarTime * 1000, objectTime / columnarTime))
\ No newline at end of file
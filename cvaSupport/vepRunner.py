@@ -1,31 +1,457 @@
 import os
+import time
+import queue
+import signal
+import typing
+import threading
+import subprocess
+import concurrent.futures
 from shlex import quote as shlex_quote
+try:
+    import fileHandling
+    import vcfHandler
+    import vepCache
+except ImportError:
+    from . import fileHandling
+    from . import vcfHandler
+    from . import vepCache
 
 vepPath = "/opt/vep/src/ensembl-vep/vep"
 gtfPath = "/opt/vep/ronavep/references/Sars_cov_2.ASM985889v3.101.gtf.named.bgzipSort.gz"
 synonymsPath = "/opt/vep/ronavep/references/sars_cov_2_ASM985889v3_chr_synonyms.txt"
 fastaPath = "/opt/vep/ronavep/references/Sars_cov_2.ASM985889v3.dna_sm.toplevel.fa.gz"
 geneRadius = 1
+annotationCacheFileName = "vepAnnotationCache.sqlite"
+maxLogBytes = 1048576
+persistentBufferSize = 64
+persistentTimeout = 600
+chunkMarkerPrefix = "cvaChunkEnd"
+markerIDLength = 256
+vepOutputBufferBytes = 16384
+vepOutputFormats = ["tab", "vcf"]
+vepOutputExtensions = {"tab": ".vep.txt", "vcf": ".vep.vcf"}
+sitesVCFHeaderLines = ["##fileformat=VCFv4.2", "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"])]
 
 
-def runVEP(vcfPath:str, outputFolder:str=""):
+def getVCFName(vcfPath:str):
     vcfName = os.path.split(vcfPath)[1]
     if vcfName.lower().endswith(".vcf.gz"):
         vcfName = ".".join(vcfName.split(".")[:-2])
     if vcfName.lower().endswith(".vcf"):
         vcfName = ".".join(vcfName.split(".")[:-1])
-    outputFileName = vcfName + ".vep.txt"
-    outputFilePath = os.path.join(outputFolder, outputFileName)
+    return vcfName
+
+
+def referenceFingerprint():
+    return fileHandling.hashFiles([gtfPath, fastaPath, synonymsPath, vepPath], [geneRadius])
+
+
+def openAnnotationCache(outputFolder:str=""):
     if not os.path.isdir(outputFolder):
         os.mkdir(outputFolder)
-    vepCommand = "%s -i %s  -gtf %s  -fasta %s  -synonyms %s  -distance %s  -o %s  --force_overwrite" %(vepPath, vcfPath, gtfPath, fastaPath, synonymsPath, geneRadius, outputFilePath)
-    print("RUN: %s" %vepCommand)
-    exitStatus = os.system(vepCommand)
-    if exitStatus == 0:
-        print("VEP Successful")
+    return vepCache.AnnotationCache(os.path.join(outputFolder, annotationCacheFileName), referenceFingerprint())
+
+
+def makeVEPCommand(inputPath:str, outputPath:str, outputFormat:str="tab"):
+    if not outputFormat in vepOutputFormats:
+        raise ValueError("VEP output format must be one of %s. Got %s" %(", ".join(vepOutputFormats), outputFormat))
+    command = [vepPath, "-i", inputPath, "-gtf", gtfPath, "-fasta", fastaPath, "-synonyms", synonymsPath, "-distance", str(geneRadius), "-o", outputPath, "--force_overwrite"]
+    if outputFormat == "vcf":
+        command.extend(["--vcf", "--allele_number"])
+    return command
+
+
+def trimLog(logPath:str, logLimit:int=maxLogBytes):
+    logSize = os.path.getsize(logPath)
+    if logSize <= logLimit:
+        logFile = open(logPath, 'rb')
+        logContents = logFile.read()
+        logFile.close()
+        return logContents.decode(errors="replace")
+    logFile = open(logPath, 'rb')
+    logFile.seek(logSize - logLimit)
+    logContents = logFile.read()
+    logFile.close()
+    logContents = ("[%s earlier bytes of output were discarded]\n" %(logSize - logLimit)).encode() + logContents
+    logFile = open(logPath, 'wb')
+    logFile.write(logContents)
+    logFile.close()
+    return logContents.decode(errors="replace")
+
+
+class VEPJob:
+
+    def __init__(self, name:str, command:typing.List[str], outputPath:str, logPath:str):
+        self.name = name
+        self.command = command
+        self.outputPath = outputPath
+        self.logPath = logPath
+        self.returnCode = None
+        self.timedOut = False
+        self.elapsed = None
+        self.log = ""
+        self.result = ""
+
+    @property
+    def commandLine(self):
+        return " ".join(shlex_quote(argument) for argument in self.command)
+
+    @property
+    def succeeded(self):
+        return self.returnCode == 0 and not self.timedOut and os.path.isfile(self.outputPath)
+
+    def run(self, timeout:float=None, logLimit:int=maxLogBytes):
+        print("RUN: %s" %self.commandLine)
+        logFile = open(self.logPath, 'wb')
+        startTime = time.perf_counter()
+        try:
+            process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=logFile, stderr=subprocess.STDOUT, start_new_session=True)
+        except OSError as error:
+            logFile.write(("Unable to start VEP: %s\n" %error).encode())
+            logFile.close()
+            self.returnCode = -1
+            self.elapsed = time.perf_counter() - startTime
+            self.log = trimLog(self.logPath, logLimit)
+            print("WARNING: VEP COULD NOT BE STARTED FOR %s: %s" %(self.name, error))
+            return self
+        try:
+            self.returnCode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.timedOut = True
+            os.killpg(process.pid, signal.SIGKILL)
+            self.returnCode = process.wait()
+        finally:
+            logFile.close()
+        self.elapsed = time.perf_counter() - startTime
+        self.log = trimLog(self.logPath, logLimit)
+        if self.timedOut:
+            print("WARNING: VEP FOR %s WAS STOPPED AFTER EXCEEDING ITS %s SECOND TIMEOUT. See %s" %(self.name, timeout, self.logPath))
+        elif self.returnCode == 0:
+            print("VEP Successful")
+        else:
+            print("WARNING: VEP EXITED WITH A NON-ZERO STATUS OF %s. See %s" %(self.returnCode, self.logPath))
+        return self
+
+
+def runVEPCommand(inputPath:str, outputFolder:str="", name:str=None, timeout:float=None, outputFormat:str="tab"):
+    if not os.path.isdir(outputFolder):
+        os.mkdir(outputFolder)
+    if name is None:
+        name = getVCFName(inputPath)
+    outputFilePath = os.path.join(outputFolder, name + vepOutputExtensions[outputFormat])
+    vepJob = VEPJob(name, makeVEPCommand(inputPath, outputFilePath, outputFormat), outputFilePath, os.path.join(outputFolder, name + ".vep.log"))
+    return vepJob.run(timeout)
+
+
+def runVEP(vcfPath:str, outputFolder:str="", cache:vepCache.AnnotationCache=None, timeout:float=None, workerPool:"PersistentVEPPool"=None):
+    if cache is not None:
+        return runCachedVEP(list(vcfHandler.iterVCF(vcfPath)), getVCFName(vcfPath), outputFolder, cache, timeout, workerPool)
+    if workerPool is not None:
+        vepOutput = runPersistentVEP(vcfHandler.iterVCF(vcfPath), getVCFName(vcfPath), outputFolder, workerPool)
+        if vepOutput:
+            return vepOutput
+    vepJob = runVEPCommand(vcfPath, outputFolder, timeout=timeout)
+    if vepJob.succeeded:
+        return vepJob.outputPath
     else:
-        print("WARNING: VEP EXITED WITH A NON-ZERO STATUS OF %s" %exitStatus)
-    if os.path.isfile(outputFilePath):
-        return outputFilePath
+        return ""
+
+
+def runCSQVEP(vcfPath:str, outputFolder:str="", timeout:float=None):
+    vepJob = runVEPCommand(vcfPath, outputFolder, timeout=timeout, outputFormat="vcf")
+    if vepJob.succeeded:
+        return vepJob.outputPath
     else:
-        return ""
\ No newline at end of file
+        return ""
+
+
+class VEPRunPool:
+
+    def __init__(self, maxJobs:int=1, outputFolder:str="", useCache:bool=False, timeout:float=None, workerPool:"PersistentVEPPool"=None):
+        if maxJobs < 1:
+            raise ValueError("A VEP run pool needs at least one job slot. Got %s" %maxJobs)
+        self.maxJobs = maxJobs
+        self.outputFolder = outputFolder
+        self.useCache = useCache
+        self.timeout = timeout
+        self.workerPool = workerPool
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxJobs, thread_name_prefix="vep")
+
+    def openCache(self):
+        if self.useCache:
+            return openAnnotationCache(self.outputFolder)
+        return None
+
+    def runSample(self, vcfPath:str, callback:typing.Callable=None):
+        startTime = time.perf_counter()
+        vepOutput = runVEP(vcfPath, self.outputFolder, self.openCache(), self.timeout, self.workerPool)
+        if callback is not None:
+            callback(vcfPath, vepOutput, time.perf_counter() - startTime)
+        return vepOutput
+
+    def runIngestedSample(self, ingested, callback:typing.Callable=None):
+        startTime = time.perf_counter()
+        ingested.vepOutput = runVEPForRecords(ingested.variantRecords, getVCFName(ingested.vcfPath), self.outputFolder, self.openCache(), self.timeout, self.workerPool)
+        if callback is not None:
+            callback(ingested.vcfPath, ingested.vepOutput, time.perf_counter() - startTime)
+        return ingested
+
+    def submit(self, vcfPath:str, callback:typing.Callable=None):
+        return self.executor.submit(self.runSample, vcfPath, callback)
+
+    def submitIngested(self, ingested, callback:typing.Callable=None):
+        return self.executor.submit(self.runIngestedSample, ingested, callback)
+
+    def submitAll(self, vcfPaths:typing.List[str], callback:typing.Callable=None):
+        return {vcfPath: self.submit(vcfPath, callback) for vcfPath in vcfPaths}
+
+    def shutdown(self, cancelPending:bool=True):
+        self.executor.shutdown(wait=True, cancel_futures=cancelPending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.shutdown()
+
+
+def makeSiteLines(variantRecords:typing.Iterable[vcfHandler.VariantRecord]):
+    sites = {}
+    for variantRecord in variantRecords:
+        siteKey = (variantRecord.contig, variantRecord.position, variantRecord.ref, str(variantRecord.alt))
+        sites[siteKey] = variantRecord
+    return ["\t".join([contig, str(position), ".", ref, alt, ".", ".", "."]) for contig, position, ref, alt in sorted(sites)]
+
+
+def writeSitesVCF(variantRecords:typing.Iterable[vcfHandler.VariantRecord], outputPath:str):
+    siteLines = makeSiteLines(variantRecords)
+    outputFile = open(outputPath, 'w')
+    for headerLine in sitesVCFHeaderLines:
+        print(headerLine, file=outputFile)
+    for siteLine in siteLines:
+        print(siteLine, file=outputFile)
+    outputFile.close()
+    return len(siteLines)
+
+
+def makePersistentVEPCommand(bufferSize:int=persistentBufferSize):
+    return [vepPath, "--format", "vcf", "-gtf", gtfPath, "-fasta", fastaPath, "-synonyms", synonymsPath, "-distance", str(geneRadius), "-o", "STDOUT", "--force_overwrite", "--no_stats", "--buffer_size", str(bufferSize)]
+
+
+class PersistentVEPWorker:
+
+    def __init__(self, logPath:str, bufferSize:int=persistentBufferSize):
+        self.logPath = logPath
+        self.bufferSize = bufferSize
+        self.requestCount = 0
+        self.logFile = open(logPath, 'ab')
+        try:
+            self.process = subprocess.Popen(makePersistentVEPCommand(bufferSize), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.logFile, text=True, bufsize=1, start_new_session=True)
+        except OSError:
+            self.logFile.close()
+            raise
+        self.outputLines = queue.Queue()
+        self.reader = threading.Thread(target=self.readOutput, daemon=True)
+        self.reader.start()
+        self.writeLines(sitesVCFHeaderLines)
+
+    def readOutput(self):
+        for line in self.process.stdout:
+            self.outputLines.put(line)
+        self.outputLines.put(None)
+
+    def writeLines(self, lines:typing.List[str]):
+        try:
+            self.process.stdin.write("".join(line + "\n" for line in lines))
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def annotate(self, siteLines:typing.List[str], timeout:float=persistentTimeout):
+        vepLineTable = {}
+        if not siteLines:
+            return vepLineTable
+        self.requestCount += 1
+        marker = ("%s.%s." %(chunkMarkerPrefix, self.requestCount)).ljust(markerIDLength, "x")
+        contig = siteLines[0].split("\t", 1)[0]
+        # VEP only annotates full input buffers and block-buffers its piped output, so send a full buffer of markers plus enough marker output to push the first marker through the output buffer
+        markerCount = self.bufferSize + -(-vepOutputBufferBytes // markerIDLength)
+        markerLines = ["\t".join([contig, "1", marker, "N", "A", ".", ".", "."])] * markerCount
+        writer = threading.Thread(target=self.writeLines, args=(siteLines + markerLines,), daemon=True)
+        writer.start()
+        deadline = None
+        if timeout:
+            deadline = time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            try:
+                line = self.outputLines.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError("VEP worker did not finish a request within %s seconds. See %s" %(timeout, self.logPath))
+            if line is None:
+                raise RuntimeError("VEP worker exited with a status of %s. See %s" %(self.process.wait(), self.logPath))
+            if line.startswith("#"):
+                continue
+            identifier = line.split("\t", 1)[0]
+            if identifier.startswith(chunkMarkerPrefix):
+                if identifier == marker:
+                    return vepLineTable
+                continue
+            vepLineTable.setdefault(identifier, []).append(line.rstrip("\n"))
+
+    def close(self, kill:bool=False, timeout:float=5):
+        if not kill:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            try:
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                kill = True
+        if kill and self.alive:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        self.logFile.close()
+
+
+class PersistentVEPPool:
+
+    def __init__(self, workers:int=1, logFolder:str="", timeout:float=None, bufferSize:int=persistentBufferSize):
+        if workers < 1:
+            raise ValueError("A persistent VEP pool needs at least one worker. Got %s" %workers)
+        if logFolder and not os.path.isdir(logFolder):
+            os.mkdir(logFolder)
+        self.workers = workers
+        self.logFolder = logFolder
+        self.timeout = timeout or persistentTimeout
+        self.bufferSize = bufferSize
+        self.idleWorkers = queue.Queue()
+        self.startedWorkers = 0
+        self.workerNumber = 0
+        self.lock = threading.Lock()
+
+    def acquireWorker(self):
+        try:
+            return self.idleWorkers.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            startWorker = self.startedWorkers < self.workers
+            if startWorker:
+                self.startedWorkers += 1
+                self.workerNumber += 1
+                logPath = os.path.join(self.logFolder, "vepWorker%s.log" %self.workerNumber)
+        if not startWorker:
+            return self.idleWorkers.get()
+        try:
+            return PersistentVEPWorker(logPath, self.bufferSize)
+        except OSError:
+            with self.lock:
+                self.startedWorkers -= 1
+            raise
+
+    def discardWorker(self, worker:PersistentVEPWorker):
+        worker.close(kill=True)
+        with self.lock:
+            self.startedWorkers -= 1
+
+    def annotateRecords(self, variantRecords:typing.Iterable[vcfHandler.VariantRecord]):
+        siteLines = makeSiteLines(variantRecords)
+        worker = self.acquireWorker()
+        try:
+            vepLineTable = worker.annotate(siteLines, self.timeout)
+        except BaseException:
+            self.discardWorker(worker)
+            raise
+        self.idleWorkers.put(worker)
+        return vepLineTable
+
+    def close(self):
+        while True:
+            try:
+                worker = self.idleWorkers.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+            with self.lock:
+                self.startedWorkers -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def runPersistentVEP(variantRecords:typing.Iterable[vcfHandler.VariantRecord], name:str, outputFolder:str, workerPool:PersistentVEPPool):
+    if not os.path.isdir(outputFolder):
+        os.mkdir(outputFolder)
+    try:
+        vepLineTable = workerPool.annotateRecords(variantRecords)
+    except (OSError, RuntimeError, TimeoutError) as error:
+        print("WARNING: VEP WORKERS WERE UNABLE TO ANNOTATE %s: %s. Falling back to a one-shot VEP run." %(name, error))
+        return ""
+    print("VEP workers annotated %s variants from %s" %(len(vepLineTable), name))
+    return vepCache.writeVEPFile(vepLineTable, os.path.join(outputFolder, name + ".vep.txt"))
+
+
+def runSitesVEP(variantRecords:typing.List[vcfHandler.VariantRecord], name:str, outputFolder:str, timeout:float=None, workerPool:PersistentVEPPool=None):
+    if workerPool is not None:
+        vepOutput = runPersistentVEP(variantRecords, name, outputFolder, workerPool)
+        if vepOutput:
+            return vepOutput
+    sitesVCFPath = os.path.join(outputFolder, name + ".vcf")
+    writeSitesVCF(variantRecords, sitesVCFPath)
+    return runVEP(sitesVCFPath, outputFolder, timeout=timeout)
+
+
+def runVEPForRecords(variantRecords:typing.List[vcfHandler.VariantRecord], name:str, outputFolder:str="", cache:vepCache.AnnotationCache=None, timeout:float=None, workerPool:PersistentVEPPool=None):
+    if not os.path.isdir(outputFolder):
+        os.mkdir(outputFolder)
+    if cache is not None:
+        return runCachedVEP(variantRecords, name, outputFolder, cache, timeout, workerPool)
+    return runSitesVEP(variantRecords, name + ".sites", outputFolder, timeout, workerPool)
+
+
+def runCachedVEP(variantRecords:typing.List[vcfHandler.VariantRecord], name:str, outputFolder:str, cache:vepCache.AnnotationCache, timeout:float=None, workerPool:PersistentVEPPool=None):
+    if not os.path.isdir(outputFolder):
+        os.mkdir(outputFolder)
+    identifiers = list(dict.fromkeys(variantRecord.vepIdentifier for variantRecord in variantRecords))
+    vepLineTable = cache.getVEPLines(identifiers)
+    uncachedRecords = [variantRecord for variantRecord in variantRecords if not variantRecord.vepIdentifier in vepLineTable]
+    print("Found %s of %s VEP annotations for %s in the annotation cache" %(len(vepLineTable), len(identifiers), name))
+    if uncachedRecords:
+        uncachedVEPOutput = runSitesVEP(uncachedRecords, name + ".uncached", outputFolder, timeout, workerPool)
+        if not uncachedVEPOutput:
+            return ""
+        newVEPLines = cache.storeVEPFile(uncachedVEPOutput)
+        vepLineTable.update(newVEPLines)
+    orderedVEPLineTable = {}
+    for identifier in identifiers:
+        orderedVEPLineTable[identifier] = vepLineTable.get(identifier, [])
+    return vepCache.writeVEPFile(orderedVEPLineTable, os.path.join(outputFolder, name + ".vep.txt"))
+
+
+def runBatchVEP(vcfPaths:typing.List[str], outputFolder:str="", batchName:str="batch", cache:vepCache.AnnotationCache=None, timeout:float=None, workerPool:PersistentVEPPool=None, sampleIdentifiers:typing.Dict[str, typing.List[str]]=None):
+    if not os.path.isdir(outputFolder):
+        os.mkdir(outputFolder)
+    sites = {}
+    for vcfPath in vcfPaths:
+        identifiers = []
+        for variantRecord in vcfHandler.iterVCF(vcfPath):
+            sites.setdefault(variantRecord.vepIdentifier, variantRecord)
+            identifiers.append(variantRecord.vepIdentifier)
+        if sampleIdentifiers is not None:
+            sampleIdentifiers[vcfPath] = identifiers
+    variantRecords = list(sites.values())
+    if cache is not None:
+        return runCachedVEP(variantRecords, batchName + ".sites", outputFolder, cache, timeout, workerPool)
+    print("Batching %s distinct sites from %s samples into a single VEP run" %(len(variantRecords), len(vcfPaths)))
+    return runSitesVEP(variantRecords, batchName + ".sites", outputFolder, timeout, workerPool)
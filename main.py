@@ -3,9 +3,14 @@ import cvaSupport
 import operator
 import typing
 import json
-import scipy.stats
 import math
 import re
+import concurrent.futures
+import collections
+import itertools
+import glob
+import time
+import signal
 
 workingFolderEnv = os.environ.setdefault("WORKINGFOLDER", "/data")
 if not os.path.isdir(workingFolderEnv):
@@ -25,6 +30,99 @@ if not os.path.isdir(resultsFolderEnv):
 freyjaOutputFolderEnv = os.environ.setdefault("FREYJAOUTPUTFOLDER", os.path.join(workingFolderEnv, "freyjaOutput"))
 if not os.path.isdir(freyjaOutputFolderEnv):
     os.mkdir(freyjaOutputFolderEnv)
+freyjaFormatEnv = os.environ.setdefault("FREYJAFORMAT", "vcf").lower()
+if freyjaFormatEnv not in cvaSupport.freyjaVCFModder.outputFormats:
+    raise ValueError("FREYJAFORMAT must be one of %s. Got %s" %(", ".join(cvaSupport.freyjaVCFModder.outputFormats), freyjaFormatEnv))
+freyjaIndexEnv = os.environ.setdefault("FREYJAINDEX", "false").lower()
+if freyjaIndexEnv not in ["true", "false"]:
+    raise ValueError("FREYJAINDEX must be either true or false. Got %s" %freyjaIndexEnv)
+freyjaIndexEnv = freyjaIndexEnv == "true"
+if freyjaIndexEnv and freyjaFormatEnv != "bgzf":
+    raise ValueError("FREYJAINDEX requires FREYJAFORMAT to be bgzf")
+vepModeEnv = os.environ.setdefault("VEPMODE", "sample").lower()
+if vepModeEnv not in ["sample", "batch", "native", "csq"]:
+    raise ValueError("VEPMODE must be one of sample, batch, native, or csq. Got %s" %vepModeEnv)
+vepCacheEnv = os.environ.setdefault("VEPCACHE", "true").lower()
+if vepCacheEnv not in ["true", "false"]:
+    raise ValueError("VEPCACHE must be either true or false. Got %s" %vepCacheEnv)
+vepCacheEnv = vepCacheEnv == "true"
+referenceCacheFolderEnv = os.environ.setdefault("REFERENCECACHEFOLDER", cvaSupport.referenceGenomeHandler.defaultReferenceCacheFolder)
+variantsOfConcernFileEnv = os.environ.setdefault("VARIANTSOFCONCERN", cvaSupport.variantsOfConcernHandler.variantsOfConcernFile)
+if not os.path.isfile(variantsOfConcernFileEnv):
+    raise FileNotFoundError("Unable to find variants of concern file at %s" %variantsOfConcernFileEnv)
+siteMasksEnv = cvaSupport.annotationTracks.parseMaskSpecs(os.environ.setdefault("SITEMASKS", "ProblemSite=%s" %cvaSupport.problematicSites.problematicSitesFile))
+workersEnv = os.environ.setdefault("WORKERS", "1")
+try:
+    workersEnv = int(workersEnv)
+except ValueError:
+    raise ValueError("WORKERS must be an integer value. Got %s" %workersEnv)
+if workersEnv < 1:
+    raise ValueError("WORKERS must be at least 1. Got %s" %workersEnv)
+vepJobsEnv = os.environ.setdefault("VEPJOBS", str(workersEnv))
+try:
+    vepJobsEnv = int(vepJobsEnv)
+except ValueError:
+    raise ValueError("VEPJOBS must be an integer value. Got %s" %vepJobsEnv)
+if vepJobsEnv < 1:
+    raise ValueError("VEPJOBS must be at least 1. Got %s" %vepJobsEnv)
+vepTimeoutEnv = os.environ.setdefault("VEPTIMEOUT", "0")
+try:
+    vepTimeoutEnv = float(vepTimeoutEnv)
+except ValueError:
+    raise ValueError("VEPTIMEOUT must be a number of seconds. Got %s" %vepTimeoutEnv)
+if vepTimeoutEnv < 0:
+    raise ValueError("VEPTIMEOUT cannot be negative. Got %s" %vepTimeoutEnv)
+vepTimeoutEnv = vepTimeoutEnv or None
+vepWorkersEnv = os.environ.setdefault("VEPWORKERS", "0")
+try:
+    vepWorkersEnv = int(vepWorkersEnv)
+except ValueError:
+    raise ValueError("VEPWORKERS must be an integer value. Got %s" %vepWorkersEnv)
+if vepWorkersEnv < 0:
+    raise ValueError("VEPWORKERS cannot be negative. Got %s" %vepWorkersEnv)
+resumeEnv = os.environ.setdefault("RESUME", "true").lower()
+if resumeEnv not in ["true", "false"]:
+    raise ValueError("RESUME must be either true or false. Got %s" %resumeEnv)
+resumeEnv = resumeEnv == "true"
+checkpointFolderEnv = os.environ.setdefault("CHECKPOINTFOLDER", os.path.join(workingFolderEnv, "sampleCheckpoints"))
+if not os.path.isdir(checkpointFolderEnv):
+    os.mkdir(checkpointFolderEnv)
+betaFitEnv = os.environ.setdefault("BETAFIT", "legacy").lower()
+if betaFitEnv not in cvaSupport.betaFitting.fitMethods:
+    raise ValueError("BETAFIT must be one of %s. Got %s" %(", ".join(cvaSupport.betaFitting.fitMethods), betaFitEnv))
+cohortExportEnv = os.environ.setdefault("COHORTEXPORT", "none").lower()
+if cohortExportEnv not in ["none"] + cvaSupport.cohortExport.exportFormats:
+    raise ValueError("COHORTEXPORT must be one of none, %s. Got %s" %(", ".join(cvaSupport.cohortExport.exportFormats), cohortExportEnv))
+profileEnv = os.environ.setdefault("PROFILE", "none").lower()
+if profileEnv not in cvaSupport.instrumentation.profilingModes:
+    raise ValueError("PROFILE must be one of %s. Got %s" %(", ".join(cvaSupport.instrumentation.profilingModes), profileEnv))
+daemonEnv = os.environ.setdefault("DAEMON", "false").lower()
+if daemonEnv not in ["true", "false"]:
+    raise ValueError("DAEMON must be either true or false. Got %s" %daemonEnv)
+daemonEnv = daemonEnv == "true"
+pollIntervalEnv = os.environ.setdefault("POLLINTERVAL", "10")
+try:
+    pollIntervalEnv = float(pollIntervalEnv)
+except ValueError:
+    raise ValueError("POLLINTERVAL must be a number of seconds. Got %s" %pollIntervalEnv)
+if pollIntervalEnv <= 0:
+    raise ValueError("POLLINTERVAL must be greater than 0. Got %s" %pollIntervalEnv)
+settleTimeEnv = os.environ.setdefault("SETTLETIME", "30")
+try:
+    settleTimeEnv = float(settleTimeEnv)
+except ValueError:
+    raise ValueError("SETTLETIME must be a number of seconds. Got %s" %settleTimeEnv)
+if settleTimeEnv < 0:
+    raise ValueError("SETTLETIME cannot be negative. Got %s" %settleTimeEnv)
+
+
+nativeAnnotator = None
+siteAnnotationTrack = None
+variantsOfConcernMatcher = None
+vepWorkerPool = None
+stopRequested = False
+runInstrumentation = cvaSupport.instrumentation.RunInstrumentation()
+mainProcessID = os.getpid()
 
 
 def getVCFList(folder:str=inputFolderEnv):
@@ -36,27 +134,95 @@ def getVCFList(folder:str=inputFolderEnv):
             continue
         if item.endswith(".vcf") or item.endswith(".vcf.gz"):
             folderFilesFiltered.append(item)
+    folderFilesFiltered.sort()
     return folderFilesFiltered
 
 
+def getAnnotationCache(useCache:bool=vepCacheEnv):
+    if not useCache:
+        return None
+    return cvaSupport.vepRunner.openAnnotationCache(vepIntermediatesFolderEnv)
+
+
+def getVEPWorkerPool(workers:int=vepWorkersEnv):
+    global vepWorkerPool
+    if not workers or os.getpid() != mainProcessID:
+        return None
+    if vepWorkerPool is None:
+        vepWorkerPool = cvaSupport.vepRunner.PersistentVEPPool(workers, vepIntermediatesFolderEnv, vepTimeoutEnv)
+    return vepWorkerPool
+
+
+def closeVEPWorkerPool():
+    global vepWorkerPool
+    if vepWorkerPool is not None:
+        vepWorkerPool.close()
+        vepWorkerPool = None
+
+
+def checkVEPOutput(vcfPath:str, vepOutput:str):
+    if vepOutput:
+        return vepOutput
+    else:
+        raise RuntimeError("VEP appears to have had a failed run on sample %s" %vcfPath)
+
+
 def runVEP(vcfPath:str):
     if not os.path.isfile(vcfPath):
         raise FileNotFoundError("Unable to find a VCF at %s" %vcfPath)
-    vepOutput = cvaSupport.vepRunner.runVEP(vcfPath, vepIntermediatesFolderEnv)
+    return checkVEPOutput(vcfPath, cvaSupport.vepRunner.runVEP(vcfPath, vepIntermediatesFolderEnv, getAnnotationCache(), vepTimeoutEnv, getVEPWorkerPool()))
+
+
+def runIngestedVEP(ingested:cvaSupport.vcfIngestion.IngestedVCF):
+    vepOutput = cvaSupport.vepRunner.runVEPForRecords(ingested.variantRecords, cvaSupport.vepRunner.getVCFName(ingested.vcfPath), vepIntermediatesFolderEnv, getAnnotationCache(), vepTimeoutEnv, getVEPWorkerPool())
+    ingested.vepOutput = checkVEPOutput(ingested.vcfPath, vepOutput)
+    return ingested.vepOutput
+
+
+def runCSQVEP(vcfPath:str):
+    if not os.path.isfile(vcfPath):
+        raise FileNotFoundError("Unable to find a VCF at %s" %vcfPath)
+    return checkVEPOutput(vcfPath, cvaSupport.vepRunner.runCSQVEP(vcfPath, vepIntermediatesFolderEnv, vepTimeoutEnv))
+
+
+def recordVEPRun(vcfPath:str, vepOutput:str, runTime:float):
+    runInstrumentation.addStageRecord("runVEP", wallSeconds=runTime)
+
+
+def startVEPRun(vepPool:cvaSupport.vepRunner.VEPRunPool, vcfPath:str):
+    if not os.path.isfile(vcfPath):
+        raise FileNotFoundError("Unable to find a VCF at %s" %vcfPath)
+    with runInstrumentation.measure("ingestVCF") as stageRecord:
+        ingested = ingestSample(vcfPath)
+        stageRecord["sampleID"] = ingested.sampleID
+        stageRecord["records"] = len(ingested.variantTable)
+    return vepPool.submitIngested(ingested, recordVEPRun)
+
+
+def runBatchVEP(vcfPaths:typing.List[str], sampleIdentifiers:typing.Dict[str, typing.List[str]]=None):
+    for vcfPath in vcfPaths:
+        if not os.path.isfile(vcfPath):
+            raise FileNotFoundError("Unable to find a VCF at %s" %vcfPath)
+    vepOutput = cvaSupport.vepRunner.runBatchVEP(vcfPaths, vepIntermediatesFolderEnv, cache=getAnnotationCache(), timeout=vepTimeoutEnv, workerPool=getVEPWorkerPool(), sampleIdentifiers=sampleIdentifiers)
     if vepOutput:
         return vepOutput
     else:
-        raise RuntimeError("VEP appears to have had a failed run on sample %s" %vcfPath)
+        raise RuntimeError("VEP appears to have had a failed run on the batched sites from %s samples" %len(vcfPaths))
 
 
-def makeVCFJoiningTable(vcfPath:str, returnSampleID:bool=False):
+def makeVCFJoiningTable(vcfPath:str, returnSampleID:bool=False, computeStatistics:bool=True):
     if not os.path.isfile(vcfPath):
         raise FileNotFoundError("Unable to find a VCF at %s" %vcfPath)
-    processedRecords = cvaSupport.vcfHandler.processVCF(vcfPath)
-    sampleID = processedRecords[0].sampleID
+    sampleID = None
     joiningTable = {}
-    for mutation in processedRecords:
+    for mutation in cvaSupport.vcfHandler.iterVCF(vcfPath):
+        if sampleID is None:
+            sampleID = mutation.sampleID
         joiningTable[mutation.vepIdentifier] = mutation
+    if sampleID is None:
+        raise ValueError("No variant records were found in %s" %vcfPath)
+    if computeStatistics:
+        cvaSupport.vcfHandler.computeBiasStatistics(joiningTable.values())
     if returnSampleID:
         return joiningTable, sampleID
     return joiningTable
@@ -65,11 +231,7 @@ def makeVCFJoiningTable(vcfPath:str, returnSampleID:bool=False):
 def makeVEPJoiningTable(vepOutputPath:str):
     if not os.path.isfile(vepOutputPath):
         raise ValueError("Unable to find VEP output file at %s" %vepOutputPath)
-    mutationEffects = cvaSupport.vepHandler.processVEPFile(vepOutputPath)
-    joiningTable = {}
-    for mutation in mutationEffects:
-        joiningTable[mutation.identifier] = mutation
-    return joiningTable
+    return cvaSupport.vepHandler.processVEPTable(vepOutputPath)
 
 
 # def findStringentFilteredVCF(originalVCFPath:str, stringentFilteredVCFFolder:str=stringentFilteredVCFFolderEnv):
@@ -132,106 +294,537 @@ def calculateAndApplyConfidenceScoreToMergedMutation(mergedMutation:cvaSupport.m
 #     return mergedMutationList
 
 
-def makeFreyjaVCFMods(vcfPath:str, outputFolder:str=freyjaOutputFolderEnv):
-    outputVCFPath = os.path.join(outputFolder, os.path.split(vcfPath[:-3])[1] + "freyjaMod.vcf")
-    cvaSupport.freyjaVCFModder.processVCF(vcfPath, outputVCFPath)
+def getFreyjaOutputPaths(vcfPath:str, outputFolder:str=freyjaOutputFolderEnv, outputFormat:str=freyjaFormatEnv, writeIndex:bool=freyjaIndexEnv):
+    outputVCFPath = os.path.join(outputFolder, cvaSupport.vepRunner.getVCFName(vcfPath) + ".freyjaMod.vcf")
+    if outputFormat == "bgzf":
+        outputVCFPath += ".gz"
+    temporaryPath = "%s.%s.tmp" %(outputVCFPath, os.getpid())
+    temporaryIndexPath = None
+    if writeIndex:
+        temporaryIndexPath = "%s.tbi.%s.tmp" %(outputVCFPath, os.getpid())
+    return outputVCFPath, temporaryPath, temporaryIndexPath
+
+
+def publishFreyjaOutputs(outputVCFPath:str, temporaryPath:str, temporaryIndexPath:str=None):
+    os.replace(temporaryPath, outputVCFPath)
+    if temporaryIndexPath:
+        os.replace(temporaryIndexPath, outputVCFPath + ".tbi")
     return outputVCFPath
 
 
-def makeResultsTables():
-    vcfList = getVCFList()
+def makeFreyjaVCFMods(vcfPath:str, outputFolder:str=freyjaOutputFolderEnv, outputFormat:str=freyjaFormatEnv, writeIndex:bool=freyjaIndexEnv):
+    outputVCFPath, temporaryPath, temporaryIndexPath = getFreyjaOutputPaths(vcfPath, outputFolder, outputFormat, writeIndex)
+    cvaSupport.freyjaVCFModder.processVCF(vcfPath, temporaryPath, outputFormat, temporaryIndexPath)
+    return publishFreyjaOutputs(outputVCFPath, temporaryPath, temporaryIndexPath)
+
+
+def ingestSample(vcfPath:str, outputFolder:str=freyjaOutputFolderEnv, outputFormat:str=freyjaFormatEnv, writeIndex:bool=freyjaIndexEnv):
+    outputVCFPath, temporaryPath, temporaryIndexPath = getFreyjaOutputPaths(vcfPath, outputFolder, outputFormat, writeIndex)
+    ingested = cvaSupport.vcfIngestion.ingestVCF(vcfPath, temporaryPath, outputFormat, temporaryIndexPath)
+    ingested.freyjaOutput = publishFreyjaOutputs(outputVCFPath, temporaryPath, temporaryIndexPath)
+    return ingested
+
+
+def getNativeAnnotator():
+    global nativeAnnotator
+    if nativeAnnotator is None:
+        referenceGenome = cvaSupport.referenceGenomeHandler.ReferenceGenome(cvaSupport.nativeAnnotator.nativeReferenceGenomePath, referenceCacheFolderEnv)
+        nativeAnnotator = cvaSupport.nativeAnnotator.NativeAnnotator(referenceGenome)
+    return nativeAnnotator
+
+
+def getSiteAnnotationTrack():
+    global siteAnnotationTrack
+    if siteAnnotationTrack is None:
+        siteAnnotationTrack = cvaSupport.problematicSites.getProblematicSitesTrack(vepIntermediatesFolderEnv, siteMasksEnv)
+    return siteAnnotationTrack
+
+
+def getVariantsOfConcernMatcher():
+    global variantsOfConcernMatcher
+    if variantsOfConcernMatcher is None:
+        variantsOfConcernMatcher = cvaSupport.variantsOfConcernHandler.loadVariantsOfConcernMatcher(variantsOfConcernFileEnv, vepIntermediatesFolderEnv)
+    return variantsOfConcernMatcher
+
+
+def makeNativeVEPJoiningTable(vcfTable:typing.Dict[str, cvaSupport.vcfHandler.VariantRecord]):
+    annotator = getNativeAnnotator()
+    return cvaSupport.vepHandler.selectMostSevereEffects(annotator.annotateVariantRecords(vcfTable.values()))
+
+
+def getDependencies(vepMode:str=vepModeEnv):
+    codeFolder = os.path.dirname(os.path.abspath(__file__))
+    dependencies = {
+        "vep": cvaSupport.vepRunner.vepPath,
+        "gtf": cvaSupport.vepRunner.gtfPath,
+        "fasta": cvaSupport.vepRunner.fastaPath,
+        "synonyms": cvaSupport.vepRunner.synonymsPath,
+        "variantsOfConcern": variantsOfConcernFileEnv
+    }
+    for prefix, maskPath in siteMasksEnv:
+        dependencies["siteMask:%s" %prefix] = maskPath
+    if vepMode == "native":
+        dependencies["nativeReference"] = cvaSupport.nativeAnnotator.nativeReferenceGenomePath
+    dependencies["code:main.py"] = os.path.join(codeFolder, "main.py")
+    for codePath in sorted(glob.glob(os.path.join(codeFolder, "cvaSupport", "*.py"))):
+        dependencies["code:%s" %os.path.basename(codePath)] = codePath
+    return dependencies
+
+
+def openRunManifest(vepMode:str=vepModeEnv, checkpointFolder:str=checkpointFolderEnv, betaFitMethod:str=betaFitEnv):
+    dependencies = getDependencies(vepMode)
+    dependencyNames = sorted(dependencies)
+    fingerprint = cvaSupport.fileHandling.hashFiles([dependencies[name] for name in dependencyNames], dependencyNames + [vepMode, cvaSupport.vepRunner.geneRadius, betaFitMethod])
+    return cvaSupport.runManifest.RunManifest(os.path.join(checkpointFolder, "runManifest.json"), fingerprint, dependencies)
+
+
+def splitVEPJoiningTable(vepTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect], vcfTable:typing.Iterable[str]):
+    sampleVEPTable = {}
+    for identifier in vcfTable:
+        if identifier in vepTable:
+            sampleVEPTable[identifier] = vepTable[identifier]
+    return sampleVEPTable
+
+
+def analyzeSample(vcfPath:str, batchVEPTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect]=None, vepMode:str=vepModeEnv, betaFitMethod:str=betaFitEnv, ingested:cvaSupport.vcfIngestion.IngestedVCF=None, profileMode:str=profileEnv):
+    if os.getpid() == mainProcessID:
+        profileMode = "none"
+    with cvaSupport.instrumentation.profiled(profileMode, os.path.join(resultsFolderEnv, "profiles", cvaSupport.vepRunner.getVCFName(vcfPath))):
+        return analyzeSampleStages(vcfPath, batchVEPTable, vepMode, betaFitMethod, ingested)
+
+
+def mergeCSQSample(vcfPath:str, sampleInstrumentation:cvaSupport.instrumentation.RunInstrumentation, artifacts:dict):
+    with sampleInstrumentation.measure("freyjaVCFMod"):
+        artifacts["freyjaOutput"] = makeFreyjaVCFMods(vcfPath)
+    with sampleInstrumentation.measure("runVEP"):
+        artifacts["vepOutput"] = runCSQVEP(vcfPath)
+    with sampleInstrumentation.measure("ingestCSQVCF") as stageRecord:
+        annotated = cvaSupport.csqIngestion.ingestCSQVCF(artifacts["vepOutput"])
+        stageRecord["records"] = len(annotated.annotationTable)
+    variantRecords = annotated.variantRecords
+    print("Analyzing %s" %annotated.sampleID)
+    with sampleInstrumentation.measure("biasStatistics", records=len(variantRecords)):
+        cvaSupport.vcfHandler.computeBiasStatistics(variantRecords)
+    with sampleInstrumentation.measure("mergeCSQRecords", records=len(variantRecords)):
+        mergedResults = annotated.makeCombinedMutantData()
+        mergedResults.sort(key=operator.attrgetter("locus"))
+    return annotated.sampleID, mergedResults
+
+
+def mergeSample(vcfPath:str, batchVEPTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect], vepMode:str, ingested:cvaSupport.vcfIngestion.IngestedVCF, sampleInstrumentation:cvaSupport.instrumentation.RunInstrumentation, artifacts:dict):
+    if ingested is None:
+        with sampleInstrumentation.measure("ingestVCF") as stageRecord:
+            ingested = ingestSample(vcfPath)
+            stageRecord["records"] = len(ingested.variantTable)
+    vcfTable = ingested.variantTable
+    sampleID = ingested.sampleID
+    artifacts["freyjaOutput"] = ingested.freyjaOutput
+    if batchVEPTable is None and vepMode != "native":
+        if ingested.vepOutput is None:
+            with sampleInstrumentation.measure("runVEP", records=len(vcfTable)):
+                runIngestedVEP(ingested)
+        artifacts["vepOutput"] = ingested.vepOutput
+    print("Analyzing %s" %sampleID)
+    with sampleInstrumentation.measure("biasStatistics", records=len(vcfTable)):
+        cvaSupport.vcfHandler.computeBiasStatistics(vcfTable.values())
+    with sampleInstrumentation.measure("vepJoiningTable") as stageRecord:
+        if batchVEPTable is not None:
+            vepTable = splitVEPJoiningTable(batchVEPTable, vcfTable)
+        elif vepMode == "native":
+            vepTable = makeNativeVEPJoiningTable(vcfTable)
+        else:
+            vepTable = makeVEPJoiningTable(ingested.vepOutput)
+        stageRecord["records"] = len(vepTable)
+    with sampleInstrumentation.measure("mergeVCFandVEPTables", records=len(vcfTable)):
+        mergedResults = cvaSupport.mutationDataMerge.mergeVCFandVEPTables(vcfTable, vepTable)
+        mergedResults.sort(key=operator.attrgetter("locus"))
+    return sampleID, mergedResults
+
+
+def analyzeSampleStages(vcfPath:str, batchVEPTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect]=None, vepMode:str=vepModeEnv, betaFitMethod:str=betaFitEnv, ingested:cvaSupport.vcfIngestion.IngestedVCF=None):
+    sampleInstrumentation = cvaSupport.instrumentation.RunInstrumentation()
+    artifacts = {}
+    if vepMode == "csq" and ingested is None:
+        sampleID, mergedResults = mergeCSQSample(vcfPath, sampleInstrumentation, artifacts)
+    else:
+        sampleID, mergedResults = mergeSample(vcfPath, batchVEPTable, vepMode, ingested, sampleInstrumentation, artifacts)
+    with sampleInstrumentation.measure("applySiteWarnings", records=len(mergedResults)):
+        cvaSupport.problematicSites.applySiteWarnings(mergedResults, annotationTrack=getSiteAnnotationTrack())
+    with sampleInstrumentation.measure("applyVariantsOfConcern", records=len(mergedResults)):
+        strainObservations = cvaSupport.variantsOfConcernHandler.applyVariantsOfConcern(mergedResults, matcher=getVariantsOfConcernMatcher())
+    #applyConfidenceScoresToMergedMutationList(vcfPath, mergedResults)
+    with sampleInstrumentation.measure("betaFit", records=len(mergedResults)):
+        betaTableLine = makeBetaTableLine(sampleID, mergedResults, betaFitMethod)
+    for stageRecord in sampleInstrumentation.stageRecords:
+        stageRecord["sampleID"] = sampleID
+    print("%s analysis completed." %sampleID)
+    return sampleID, mergedResults, strainObservations, betaTableLine, artifacts, sampleInstrumentation.stageRecords
+
+
+def submitAnalysis(executor:concurrent.futures.Executor, vcfPath:str, batchVEPTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect]=None, vepMode:str=vepModeEnv, sampleIdentifiers:typing.Dict[str, typing.List[str]]=None):
+    if batchVEPTable is not None:
+        batchVEPTable = splitVEPJoiningTable(batchVEPTable, sampleIdentifiers.pop(vcfPath))
+    return executor.submit(analyzeSample, vcfPath, batchVEPTable, vepMode)
+
+
+def iterBoundedAnalyses(pendingVCFs:typing.List[str], executor:concurrent.futures.Executor, maxInFlight:int, batchVEPTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect]=None, vepMode:str=vepModeEnv, sampleIdentifiers:typing.Dict[str, typing.List[str]]=None):
+    vcfIterator = iter(pendingVCFs)
+    analyses = collections.deque()
+    try:
+        for vcfPath in itertools.islice(vcfIterator, max(1, maxInFlight)):
+            analyses.append(submitAnalysis(executor, vcfPath, batchVEPTable, vepMode, sampleIdentifiers))
+        while analyses:
+            sampleResult = analyses.popleft().result()
+            for vcfPath in itertools.islice(vcfIterator, 1):
+                analyses.append(submitAnalysis(executor, vcfPath, batchVEPTable, vepMode, sampleIdentifiers))
+            yield sampleResult
+    finally:
+        for analysis in analyses:
+            analysis.cancel()
+
+
+def iterOverlappedVEPAnalyses(pendingVCFs:typing.List[str], vepMode:str=vepModeEnv, vepJobs:int=vepJobsEnv):
+    vepJobs = max(1, min(vepJobs, len(pendingVCFs)))
+    vcfIterator = iter(pendingVCFs)
+    vepRuns = collections.deque()
+    vepPool = cvaSupport.vepRunner.VEPRunPool(vepJobs, vepIntermediatesFolderEnv, vepCacheEnv, vepTimeoutEnv, getVEPWorkerPool())
+    try:
+        for vcfPath in itertools.islice(vcfIterator, vepJobs):
+            vepRuns.append((vcfPath, startVEPRun(vepPool, vcfPath)))
+        while vepRuns:
+            vcfPath, vepRun = vepRuns.popleft()
+            ingested = vepRun.result()
+            checkVEPOutput(vcfPath, ingested.vepOutput)
+            for nextVCFPath in itertools.islice(vcfIterator, 1):
+                vepRuns.append((nextVCFPath, startVEPRun(vepPool, nextVCFPath)))
+            yield analyzeSample(vcfPath, None, vepMode, ingested=ingested)
+    finally:
+        vepRuns.clear()
+        vepPool.shutdown()
+
+
+def iterPendingAnalyses(pendingVCFs:typing.List[str], batchVEPTable:typing.Dict[str, cvaSupport.vepHandler.VariantEffect]=None, vepMode:str=vepModeEnv, executor:concurrent.futures.Executor=None, maxInFlight:int=vepJobsEnv, sampleIdentifiers:typing.Dict[str, typing.List[str]]=None):
+    if executor is not None:
+        yield from iterBoundedAnalyses(pendingVCFs, executor, maxInFlight, batchVEPTable, vepMode, sampleIdentifiers)
+    elif vepMode == "sample" and pendingVCFs:
+        yield from iterOverlappedVEPAnalyses(pendingVCFs, vepMode, maxInFlight)
+    else:
+        for vcfPath in pendingVCFs:
+            yield analyzeSample(vcfPath, batchVEPTable, vepMode)
+
+
+def iterSampleResults(workers:int=workersEnv, vepMode:str=vepModeEnv, resume:bool=resumeEnv, checkpointFolder:str=checkpointFolderEnv, vcfList:typing.List[str]=None, executor:concurrent.futures.Executor=None):
+    if vcfList is None:
+        vcfList = getVCFList()
+    manifest = openRunManifest(vepMode, checkpointFolder)
+    inputHashes = {}
+    resumableVCFs = set()
+    pendingVCFs = []
+    for vcfPath in vcfList:
+        with runInstrumentation.measure("hashInput"):
+            inputHashes[vcfPath] = cvaSupport.runManifest.hashInput(vcfPath)
+        if resume and manifest.isCurrent(os.path.basename(vcfPath), inputHashes[vcfPath]):
+            resumableVCFs.add(vcfPath)
+        else:
+            pendingVCFs.append(vcfPath)
+    sampleIdentifiers = {}
+    if vepMode == "batch" and pendingVCFs:
+        with runInstrumentation.measure("runBatchVEP") as stageRecord:
+            batchVEPTable = makeVEPJoiningTable(runBatchVEP(pendingVCFs, sampleIdentifiers))
+            stageRecord["records"] = len(batchVEPTable)
+    else:
+        batchVEPTable = None
+    ownExecutor = None
+    if len(pendingVCFs) < 2:
+        executor = None
+    elif executor is None and workers > 1:
+        ownExecutor = executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(pendingVCFs)))
+    sampleAnalyses = iterPendingAnalyses(pendingVCFs, batchVEPTable, vepMode, executor, max(workers, vepJobsEnv), sampleIdentifiers)
+    try:
+        for vcfPath in vcfList:
+            inputName = os.path.basename(vcfPath)
+            if vcfPath in resumableVCFs:
+                with runInstrumentation.measure("loadCheckpoint") as stageRecord:
+                    completedSample = manifest.loadSampleCheckpoint(inputName)
+                    if completedSample is not None:
+                        stageRecord["sampleID"] = completedSample[0]
+                if completedSample is not None:
+                    print("Skipping %s, which is unchanged since its last completed analysis." %inputName)
+                    yield completedSample
+                    continue
+                sampleID, mergedResults, strainObservations, betaTableLine, artifacts, stageRecords = analyzeSample(vcfPath, None, vepMode)
+            else:
+                sampleID, mergedResults, strainObservations, betaTableLine, artifacts, stageRecords = next(sampleAnalyses)
+            runInstrumentation.extend(stageRecords)
+            completedSample = (sampleID, mergedResults, strainObservations, betaTableLine)
+            with runInstrumentation.measure("saveCheckpoint", sampleID):
+                manifest.recordSample(inputName, inputHashes[vcfPath], completedSample, artifacts)
+            yield completedSample
+    finally:
+        sampleAnalyses.close()
+        if ownExecutor:
+            ownExecutor.shutdown()
+
+
+def makeResultsTables(workers:int=workersEnv, vepMode:str=vepModeEnv, resume:bool=resumeEnv, checkpointFolder:str=checkpointFolderEnv, vcfList:typing.List[str]=None, executor:concurrent.futures.Executor=None):
     results = {}
     strainObservationsTable = {}
-    for vcfPath in vcfList:
-        vepOutput = runVEP(vcfPath)
-        freyjaModVCF = makeFreyjaVCFMods(vcfPath)
-        vcfTable, sampleID = makeVCFJoiningTable(vcfPath, returnSampleID=True)
-        print("Analyzing %s" %sampleID)
-        vepTable = makeVEPJoiningTable(vepOutput)
-        mergedResults = cvaSupport.mutationDataMerge.mergeVCFandVEPTables(vcfTable, vepTable)
+    for sampleID, mergedResults, strainObservations, betaTableLine in iterSampleResults(workers, vepMode, resume, checkpointFolder, vcfList, executor):
         results[sampleID] = mergedResults
-        results[sampleID].sort(key=operator.attrgetter("locus"))
-        cvaSupport.problematicSites.applySiteWarnings(results[sampleID])
-        strainObservations = cvaSupport.variantsOfConcernHandler.applyVariantsOfConcern(results[sampleID])
-        #applyConfidenceScoresToMergedMutationList(vcfPath, results[sampleID])
         strainObservationsTable[sampleID] = strainObservations
-        print("%s analysis completed." %sampleID)
     return results, strainObservationsTable
 
 
-def writeBetaTable(mutationRecordTable:typing.Dict[str, typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]]):
+def summarizeVariantFractions(variantRecords:typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]):
+    percentAlts = []
+    partialVariants = 0
+    partialVariantsUnflagged = 0
+    for variantRecord in variantRecords:
+        variantPercent = variantRecord.percentAlt
+        if math.isnan(variantPercent):
+            continue
+        if variantPercent < 0:
+            variantPercent = 0
+        if 0.10 < variantPercent < 0.90:
+            partialVariants += 1
+            if not variantRecord.flags:
+                partialVariantsUnflagged += 1
+        percentAlts.append(variantPercent)
+    return percentAlts, partialVariants, partialVariantsUnflagged
+
+
+def formatBetaTableLine(sampleID:str, betaFit:tuple, partialVariants:int, partialVariantsUnflagged:int):
+    alpha, beta, lowerLimit, scale, method = betaFit
+    outputList = [sampleID, alpha, beta, lowerLimit, scale, partialVariants, partialVariantsUnflagged, method]
+    outputList = [str(item) for item in outputList]
+    return "\t".join(outputList)
+
+
+def makeBetaTableLine(sampleID:str, variantRecords:typing.List[cvaSupport.mutationDataMerge.CombinedMutantData], betaFitMethod:str=betaFitEnv):
+    percentAlts, partialVariants, partialVariantsUnflagged = summarizeVariantFractions(variantRecords)
+    betaFit = cvaSupport.betaFitting.fitBeta(percentAlts, betaFitMethod)
+    return formatBetaTableLine(sampleID, betaFit, partialVariants, partialVariantsUnflagged)
+
+
+def startBetaTable(betaTableLines:typing.Iterable[str]=()):
     outputFileName = "betaTable.txt"
     outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
-    outputFile = open(outputFilePath, 'w')
-    columns = "\t".join(["#Sample", "Alpha", "Beta", "LowerLimit", "Scale", "PartialVariants", "PartialVariantsUnflagged"])
+    temporaryPath = "%s.%s.tmp" %(outputFilePath, os.getpid())
+    outputFile = open(temporaryPath, 'w')
+    columns = "\t".join(["#Sample", "Alpha", "Beta", "LowerLimit", "Scale", "PartialVariants", "PartialVariantsUnflagged", "Method"])
     print(columns, file=outputFile)
-    for sampleID, variantRecords in mutationRecordTable.items():
-        percentAlts = []
-        partialVariants = 0
-        partialVariantsUnflagged = 0
-        for variantRecord in variantRecords:
-            variantPercent = variantRecord.percentAlt
-            if math.isnan(variantPercent):
-                continue
-            if variantPercent < 0:
-                variantPercent = 0
-            if 0.10 < variantPercent < 0.90:
-                partialVariants += 1
-                if not variantRecord.flags:
-                    partialVariantsUnflagged += 1
-            percentAlts.append(variantPercent)
-        alpha, beta, lowerLimit, scale = scipy.stats.beta.fit(percentAlts)
-        outputList = [sampleID, alpha, beta, lowerLimit, scale, partialVariants, partialVariantsUnflagged]
-        outputList = [str(item) for item in outputList]
-        outputString = "\t".join(outputList)
+    for outputString in betaTableLines:
         print(outputString, file=outputFile)
     outputFile.close()
+    os.replace(temporaryPath, outputFilePath)
+    return outputFilePath
 
 
-def writeVariantTables(mutationRecordTable:typing.Dict[str, typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]]):
+def appendBetaTableLine(outputString:str):
+    outputFileName = "betaTable.txt"
+    outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
+    outputFile = open(outputFilePath, 'a')
+    print(outputString, file=outputFile)
+    outputFile.close()
+
+
+def writeBetaTable(mutationRecordTable:typing.Dict[str, typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]], betaFitMethod:str=betaFitEnv, workers:int=workersEnv):
+    summaries = [summarizeVariantFractions(variantRecords) for variantRecords in mutationRecordTable.values()]
+    betaFits = cvaSupport.betaFitting.fitMany([percentAlts for percentAlts, partialVariants, partialVariantsUnflagged in summaries], betaFitMethod, workers)
+    betaTableLines = []
+    for sampleID, betaFit, (percentAlts, partialVariants, partialVariantsUnflagged) in zip(mutationRecordTable, betaFits, summaries):
+        betaTableLines.append(formatBetaTableLine(sampleID, betaFit, partialVariants, partialVariantsUnflagged))
+    startBetaTable(betaTableLines)
+
+
+def writeVariantTable(sampleID:str, variantRecords:typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]):
     columns = "\t".join(["#Sequence", "Consequence", "Protein", "PercentPrevalence", "ReadDepth", "InvLogMateBias", "InvLogStrandBias", "Flag/Filter", "Alert", "Confidence"])
+    sanitizedSampleID = re.sub("\W", "_", sampleID)
+    outputFileName = "%s.variants.txt" %sanitizedSampleID
+    outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
+    temporaryPath = "%s.%s.tmp" %(outputFilePath, os.getpid())
+    outputFile = open(temporaryPath, 'w')
+    print(columns, file=outputFile)
+    for variantRecord in variantRecords:
+        print(variantRecord, file=outputFile)
+    outputFile.close()
+    os.replace(temporaryPath, outputFilePath)
+
+
+def writeVariantTables(mutationRecordTable:typing.Dict[str, typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]]):
     for sampleID, variantRecords in mutationRecordTable.items():
-        sanitizedSampleID = re.sub("\W", "_", sampleID)
-        outputFileName = "%s.variants.txt" %sanitizedSampleID
-        outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
-        outputFile = open(outputFilePath, 'w')
-        print(columns, file=outputFile)
-        for variantRecord in variantRecords:
-            print(variantRecord, file=outputFile)
-        outputFile.close()
+        writeVariantTable(sampleID, variantRecords)
+
+
+def writeStrainObservationTable(sampleID:str, strainObservation:typing.Dict[str, typing.Dict[str, float]]):
+    sanitizedSampleID = re.sub("\W", "_", sampleID)
+    outputFileName = "%s.strainObservations.json" %sanitizedSampleID
+    outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
+    temporaryPath = "%s.%s.tmp" %(outputFilePath, os.getpid())
+    outputFile = open(temporaryPath, 'w')
+    json.dump(strainObservation, outputFile, indent=4)
+    outputFile.close()
+    os.replace(temporaryPath, outputFilePath)
 
 
 def writeStrainObservationTables(strainObservationTables:typing.Dict[str, typing.Dict[str, typing.Dict[str, float]]]):
     for sampleID, strainObservation in strainObservationTables.items():
-        sanitizedSampleID = re.sub("\W", "_", sampleID)
-        outputFileName = "%s.strainObservations.json" %sanitizedSampleID
-        outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
-        outputFile = open(outputFilePath, 'w')
-        json.dump(strainObservation, outputFile, indent=4)
-        outputFile.close()
+        writeStrainObservationTable(sampleID, strainObservation)
+
+
+def writeSampleVarShare(sampleID:str, variantRecords:typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]):
+    sanitizedSampleID = re.sub("\W", "_", sampleID)
+    outputFileName = "%s.variants.json" %sanitizedSampleID
+    outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
+    finalOutput = {sampleID: {}}
+    variantDict = finalOutput[sampleID]
+    for variantRecord in variantRecords:
+        variantID = variantRecord.vepDNANotation
+        variantDict[variantID] = variantRecord.sharingDict
+    temporaryPath = "%s.%s.tmp" %(outputFilePath, os.getpid())
+    outputFile = open(temporaryPath, 'w')
+    json.dump(finalOutput, outputFile, indent=4)
+    outputFile.close()
+    os.replace(temporaryPath, outputFilePath)
 
 
 def writeVarShare(mutationRecordTable:typing.Dict[str, typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]]):
     for sampleID, variantRecords in mutationRecordTable.items():
-        sanitizedSampleID = re.sub("\W", "_", sampleID)
-        outputFileName = "%s.variants.json" %sanitizedSampleID
-        outputFilePath = os.path.join(resultsFolderEnv, outputFileName)
-        finalOutput = {sampleID: {}}
-        variantDict = finalOutput[sampleID]
-        for variantRecord in variantRecords:
-            variantID = variantRecord.vepDNANotation
-            variantDict[variantID] = variantRecord.sharingDict
-        outputFile = open(outputFilePath, 'w')
-        json.dump(finalOutput, outputFile, indent=4)
-        outputFile.close()
+        writeSampleVarShare(sampleID, variantRecords)
+
+
+def writeSampleOutputs(sampleID:str, mergedResults:typing.List[cvaSupport.mutationDataMerge.CombinedMutantData], strainObservations:typing.Dict[str, typing.Dict[str, float]]):
+    with runInstrumentation.measure("writeVariantTable", sampleID, len(mergedResults)):
+        writeVariantTable(sampleID, mergedResults)
+    with runInstrumentation.measure("writeStrainObservationTable", sampleID, len(strainObservations)):
+        writeStrainObservationTable(sampleID, strainObservations)
+    with runInstrumentation.measure("writeSampleVarShare", sampleID, len(mergedResults)):
+        writeSampleVarShare(sampleID, mergedResults)
+
+
+def writeCohortExport(mutationRecordTable:typing.Dict[str, typing.List[cvaSupport.mutationDataMerge.CombinedMutantData]], exportFormat:str=cohortExportEnv):
+    if exportFormat == "none":
+        return None
+    return cvaSupport.cohortExport.writeCohortExport(mutationRecordTable, resultsFolderEnv, exportFormat)
+
+
+def writeCohortRows(cohortRows:typing.Dict[str, typing.List[tuple]], exportFormat:str=cohortExportEnv):
+    if exportFormat == "none":
+        return None
+    rows = [row for sampleRows in cohortRows.values() for row in sampleRows]
+    with runInstrumentation.measure("writeCohortExport", records=len(rows)):
+        return cvaSupport.cohortExport.writeCohortRows(rows, resultsFolderEnv, exportFormat)
+
+
+def getRunSettings():
+    settingNames = ["WORKINGFOLDER", "INPUTFOLDER", "VEPINTERMEDIATESFOLDER", "RESULTSFOLDER", "FREYJAOUTPUTFOLDER", "FREYJAFORMAT", "FREYJAINDEX", "VEPMODE", "VEPCACHE", "REFERENCECACHEFOLDER", "VARIANTSOFCONCERN", "SITEMASKS", "WORKERS", "VEPJOBS", "VEPTIMEOUT", "VEPWORKERS", "RESUME", "CHECKPOINTFOLDER", "BETAFIT", "COHORTEXPORT", "PROFILE", "DAEMON"]
+    return {settingName: os.environ.get(settingName) for settingName in settingNames}
+
+
+def writeRunReport(instrumentation:cvaSupport.instrumentation.RunInstrumentation=runInstrumentation):
+    return instrumentation.writeReport(os.path.join(resultsFolderEnv, "runReport.json"), getRunSettings())
+
+
+def requestStop(signalNumber, frame):
+    global stopRequested
+    stopRequested = True
+    print("Received signal %s, stopping after the current samples complete." %signalNumber)
+
+
+def getSettledVCFs(fileStates:typing.Dict[str, tuple], settleTime:float=settleTimeEnv, folder:str=inputFolderEnv):
+    settledVCFs = []
+    currentStates = {}
+    now = time.time()
+    for vcfPath in getVCFList(folder):
+        try:
+            fileStat = os.stat(vcfPath)
+        except FileNotFoundError:
+            continue
+        currentStates[vcfPath] = (fileStat.st_size, fileStat.st_mtime)
+        if fileStates.get(vcfPath) == currentStates[vcfPath] and now - fileStat.st_mtime >= settleTime:
+            settledVCFs.append(vcfPath)
+    fileStates.clear()
+    fileStates.update(currentStates)
+    return settledVCFs
+
+
+def analyzeArrivals(vcfPaths:typing.List[str], handleSample:typing.Callable, executor:concurrent.futures.Executor=None):
+    try:
+        for sampleID, mergedResults, strainObservations, betaTableLine in iterSampleResults(vcfList=vcfPaths, executor=executor):
+            handleSample(sampleID, mergedResults, strainObservations, betaTableLine)
+        return
+    except Exception as error:
+        if len(vcfPaths) == 1:
+            print("WARNING: Unable to analyze %s: %s. It will be retried if the file changes." %(vcfPaths[0], error))
+            return
+    for vcfPath in vcfPaths:
+        analyzeArrivals([vcfPath], handleSample, executor)
+
+
+def runDaemon(pollInterval:float=pollIntervalEnv, settleTime:float=settleTimeEnv, workers:int=workersEnv, vepMode:str=vepModeEnv, exportFormat:str=cohortExportEnv):
+    signal.signal(signal.SIGTERM, requestStop)
+    signal.signal(signal.SIGINT, requestStop)
+    getSiteAnnotationTrack()
+    getVariantsOfConcernMatcher()
+    if vepMode == "native":
+        getNativeAnnotator()
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = None
+    betaTableLines = {}
+    cohortRows = {}
+    updatedSamples = []
+    fileStates = {}
+    analyzedStates = {}
+    def handleSample(sampleID:str, mergedResults:typing.List[cvaSupport.mutationDataMerge.CombinedMutantData], strainObservations:typing.Dict[str, typing.Dict[str, float]], betaTableLine:str):
+        writeSampleOutputs(sampleID, mergedResults, strainObservations)
+        betaTableLines[sampleID] = betaTableLine
+        if exportFormat != "none":
+            cohortRows[sampleID] = cvaSupport.cohortExport.makeSampleCohortRows(sampleID, mergedResults)
+        updatedSamples.append(sampleID)
+    print("Watching %s for new VCF files" %inputFolderEnv)
+    try:
+        while not stopRequested:
+            arrivals = [vcfPath for vcfPath in getSettledVCFs(fileStates, settleTime) if analyzedStates.get(vcfPath) != fileStates[vcfPath]]
+            if arrivals:
+                updatedSamples.clear()
+                analyzeArrivals(arrivals, handleSample, executor)
+                for vcfPath in arrivals:
+                    analyzedStates[vcfPath] = fileStates[vcfPath]
+                if updatedSamples:
+                    with runInstrumentation.measure("writeBetaTable", records=len(betaTableLines)):
+                        startBetaTable(betaTableLines.values())
+                    writeCohortRows(cohortRows, exportFormat)
+                    writeRunReport()
+                    print("Cohort outputs updated with %s sample(s), %s total" %(len(updatedSamples), len(betaTableLines)))
+            if not stopRequested:
+                time.sleep(pollInterval)
+    finally:
+        if executor:
+            executor.shutdown()
+        closeVEPWorkerPool()
+    print("DONE")
 
 
 def main():
-    results, strainObservationsTable = makeResultsTables()
-    writeBetaTable(results)
-    writeVariantTables(results)
-    writeStrainObservationTables(strainObservationsTable)
-    writeVarShare(results)
+    if daemonEnv:
+        runDaemon()
+        return
+    with cvaSupport.instrumentation.profiled(profileEnv, os.path.join(resultsFolderEnv, "profiles", "main")):
+        cohortRows = {}
+        startBetaTable()
+        try:
+            for sampleID, mergedResults, strainObservations, betaTableLine in iterSampleResults():
+                writeSampleOutputs(sampleID, mergedResults, strainObservations)
+                with runInstrumentation.measure("appendBetaTableLine", sampleID):
+                    appendBetaTableLine(betaTableLine)
+                if cohortExportEnv != "none":
+                    cohortRows[sampleID] = cvaSupport.cohortExport.makeSampleCohortRows(sampleID, mergedResults)
+        finally:
+            closeVEPWorkerPool()
+        writeCohortRows(cohortRows)
+    writeRunReport()
     print("DONE")
 
 
@@ -0,0 +1,30 @@
+import math
+import scipy.stats
+from cvaSupport import betaFitting
+
+
+def raiseFitError(values):
+    raise scipy.stats.FitError("Optimization converged to parameters that are outside the range allowed by the distribution.")
+
+
+def test_zeroVarianceSampleDoesNotRaise():
+    for value in [0.0, 0.5, 1.0]:
+        for method in betaFitting.fitMethods:
+            fit = betaFitting.fitBeta([value] * 50, method)
+            assert len(fit) == 5
+            assert fit[-1] in betaFitting.fitMethods + ["failed"]
+
+
+def test_failedLegacyFitReturnsNaN(monkeypatch):
+    monkeypatch.setattr(betaFitting, "fitLegacy", raiseFitError)
+    for method in betaFitting.fitMethods:
+        alpha, beta, lowerLimit, scale, usedMethod = betaFitting.fitBeta([0.5] * 50, method)
+        assert usedMethod == "failed"
+        assert all(math.isnan(value) for value in [alpha, beta, lowerLimit, scale])
+
+
+def test_fitManyKeepsFailedRows(monkeypatch):
+    monkeypatch.setattr(betaFitting, "fitLegacy", raiseFitError)
+    fits = betaFitting.fitMany([[0.5] * 50, [0.2, 0.4, 0.6, 0.8]], "moments")
+    assert fits[0][-1] == "failed"
+    assert fits[1][-1] == "moments"
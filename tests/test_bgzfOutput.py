@@ -0,0 +1,68 @@
+import os
+import gzip
+import pytest
+from cvaSupport import fileHandling
+from cvaSupport import freyjaVCFModder
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sampleVCFPath = os.path.join(repoFolder, "references", "in2442-23.hard-filtered.vcf.gz")
+contigs = ["NC_045512.2", "MN908947.3"]
+
+
+def makeRecordLines():
+    recordLines = []
+    for contig in contigs:
+        for position in range(1, 29900, 7):
+            ref = "ACGT"[position % 4] * (1 + position % 3)
+            recordLines.append("\t".join([contig, str(position), ".", ref, "T", ".", "PASS", "DP=%s;PAD=%s" %(position, "x" * 40)]))
+    return recordLines
+
+
+def writeIndexedFile(recordLines:list, outputPath:str, indexPath:str):
+    indexBuilder = fileHandling.TabixIndexBuilder()
+    with fileHandling.BGZFWriter(outputPath) as bgzfFile:
+        bgzfFile.write(b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for line in recordLines:
+            startOffset = bgzfFile.tell()
+            bgzfFile.write((line + "\n").encode())
+            contig, start, end = freyjaVCFModder.getRecordSpan(line)
+            indexBuilder.addRecord(contig, start, end, startOffset, bgzfFile.tell())
+    indexBuilder.write(indexPath)
+
+
+def test_bgzfRoundTripsThroughGzip(tmp_path):
+    recordLines = makeRecordLines()
+    outputPath = str(tmp_path / "records.vcf.gz")
+    writeIndexedFile(recordLines, outputPath, outputPath + ".tbi")
+    expected = ("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" + "".join(line + "\n" for line in recordLines)).encode()
+    assert len(expected) > 4 * fileHandling.bgzfBlockSize
+    assert fileHandling.sniffFormat(outputPath) == "bgzf"
+    assert gzip.open(outputPath, 'rb').read() == expected
+    assert fileHandling.readBytes(outputPath) == expected
+    assert gzip.open(outputPath + ".tbi", 'rb').read(4) == b"TBI\1"
+
+
+def test_freyjaBGZFOutputMatchesPlainOutput(tmp_path):
+    plainPath = freyjaVCFModder.processVCF(sampleVCFPath, str(tmp_path / "plain.vcf"))
+    bgzfPath = freyjaVCFModder.processVCF(sampleVCFPath, str(tmp_path / "sample.vcf.gz"), "bgzf", str(tmp_path / "sample.vcf.gz.tbi"))
+    plainFile = open(plainPath, 'rb')
+    assert gzip.open(bgzfPath, 'rb').read() == plainFile.read()
+    plainFile.close()
+
+
+def test_tabixIndexLookup(tmp_path):
+    pysam = pytest.importorskip("pysam")
+    recordLines = makeRecordLines()
+    outputPath = str(tmp_path / "records.vcf.gz")
+    writeIndexedFile(recordLines, outputPath, outputPath + ".tbi")
+    tabixFile = pysam.TabixFile(outputPath, index=outputPath + ".tbi")
+    assert list(tabixFile.contigs) == contigs
+    for contig in contigs:
+        for start, end in [(0, 50), (16380, 16400), (20000, 25000), (29800, 30000)]:
+            expected = []
+            for line in recordLines:
+                recordContig, recordStart, recordEnd = freyjaVCFModder.getRecordSpan(line)
+                if recordContig == contig and recordStart < end and recordEnd > start:
+                    expected.append(line)
+            assert list(tabixFile.fetch(contig, start, end)) == expected
+    tabixFile.close()
@@ -0,0 +1,59 @@
+import os
+import math
+import random
+import scipy.stats
+from cvaSupport import biasStatistics
+from cvaSupport import vcfHandler
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sampleVCFPath = os.path.join(repoFolder, "references", "in2442-23.hard-filtered.vcf.gz")
+
+
+def scipyFisherExact(table:tuple):
+    forwardRef, reverseRef, forwardAlt, reverseAlt = table
+    oddsRatio, pValue = scipy.stats.fisher_exact([[forwardRef, reverseRef], [forwardAlt, reverseAlt]])
+    return float(oddsRatio), float(pValue)
+
+
+def assertSameStatistics(result:tuple, expected:tuple, table:tuple):
+    oddsRatio, pValue = result
+    expectedOddsRatio, expectedPValue = expected
+    if math.isnan(expectedOddsRatio):
+        assert math.isnan(oddsRatio), table
+    else:
+        assert math.isclose(oddsRatio, expectedOddsRatio, rel_tol=1e-9), table
+    assert math.isclose(pValue, expectedPValue, rel_tol=1e-6, abs_tol=1e-12), table
+
+
+def makeTables():
+    randomGenerator = random.Random(20211018)
+    tables = [(0, 0, 0, 0), (5, 0, 0, 0), (0, 0, 3, 4), (3, 0, 4, 0), (0, 7, 0, 2), (10, 10, 10, 10), (1000, 0, 0, 1000), (0, 1, 1, 0)]
+    for _ in range(500):
+        tables.append(tuple(randomGenerator.randint(0, 30) for _ in range(4)))
+    for _ in range(200):
+        tables.append((randomGenerator.randint(0, 2000), randomGenerator.randint(0, 2000), randomGenerator.randint(0, 40), randomGenerator.randint(0, 40)))
+    for variantRecord in vcfHandler.iterVCF(sampleVCFPath):
+        for biasTable in [variantRecord.strandBias, variantRecord.mateBias]:
+            if biasTable is not None:
+                tables.append(biasTable.counts)
+    return tables
+
+
+def test_vectorizedFisherMatchesScipy():
+    tables = makeTables()
+    oddsRatios, pValues = biasStatistics.fisherExactArray(biasStatistics.tablesToArray(tables))
+    for table, oddsRatio, pValue in zip(tables, oddsRatios, pValues):
+        assertSameStatistics((float(oddsRatio), float(pValue)), scipyFisherExact(table), table)
+
+
+def test_memoizedEngineMatchesScipy():
+    tables = makeTables()
+    engine = biasStatistics.FisherExactEngine(maxSize=100)
+    firstPass = engine.fisherExactMany(tables)
+    secondPass = engine.fisherExactMany(tables)
+    assert len(engine.memo) == 100
+    for table, first, second in zip(tables, firstPass, secondPass):
+        expected = scipyFisherExact(table)
+        assertSameStatistics(first, expected, table)
+        assertSameStatistics(second, expected, table)
+        assertSameStatistics(engine.fisherExact(table), expected, table)
@@ -0,0 +1,76 @@
+import os
+import sys
+import pytest
+from cvaSupport import vepRunner
+from cvaSupport import vepHandler
+from cvaSupport import vcfHandler
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+standInPath = os.path.join(repoFolder, "vepStandIn.py")
+sampleVCFPath = os.path.join(repoFolder, "references", "in2442-23.hard-filtered.vcf.gz")
+
+
+@pytest.fixture(autouse=True)
+def useStandIn(monkeypatch):
+    monkeypatch.setattr(vepRunner, "vepPath", standInPath)
+
+
+def readVariantEffects(vepOutputPath:str):
+    variantEffects = {}
+    for variantEffect in vepHandler.processVEPFile(vepOutputPath):
+        variantEffects.setdefault(variantEffect.identifier, []).append(variantEffect.toVEPLine())
+    return variantEffects
+
+
+def runOneShot(outputFolder:str):
+    return readVariantEffects(vepRunner.runVEP(sampleVCFPath, str(outputFolder)))
+
+
+def runPersistent(workerPool:vepRunner.PersistentVEPPool, outputFolder:str):
+    return readVariantEffects(vepRunner.runVEP(sampleVCFPath, str(outputFolder), workerPool=workerPool))
+
+
+def test_persistentWorkersMatchOneShotVEP(tmp_path):
+    oneShot = runOneShot(tmp_path / "oneShot")
+    with vepRunner.PersistentVEPPool(1, str(tmp_path / "logs")) as workerPool:
+        assert runPersistent(workerPool, tmp_path / "first") == oneShot
+        assert runPersistent(workerPool, tmp_path / "second") == oneShot
+        assert workerPool.startedWorkers == 1
+
+
+def test_leftoverMarkerRowsAreSkipped(tmp_path):
+    oneShot = runOneShot(tmp_path / "oneShot")
+    with vepRunner.PersistentVEPPool(1, str(tmp_path / "logs")) as workerPool:
+        worker = workerPool.acquireWorker()
+        staleMarker = ("%s.0." %vepRunner.chunkMarkerPrefix).ljust(vepRunner.markerIDLength, "x")
+        for _ in range(3):
+            worker.outputLines.put("%s\tNC_045512.2:1\tA\t-\t-\t-\tintergenic_variant\t-\t-\t-\t-\t-\t-\t-\n" %staleMarker)
+        workerPool.idleWorkers.put(worker)
+        assert runPersistent(workerPool, tmp_path / "persistent") == oneShot
+
+
+def test_workerThatDiesFallsBackToOneShot(tmp_path, monkeypatch):
+    oneShot = runOneShot(tmp_path / "oneShot")
+    monkeypatch.setattr(vepRunner, "makePersistentVEPCommand", lambda bufferSize: [sys.executable, "-c", "import sys; sys.stdin.readline()"])
+    variantRecords = list(vcfHandler.iterVCF(sampleVCFPath))
+    with vepRunner.PersistentVEPPool(1, str(tmp_path / "logs")) as workerPool:
+        with pytest.raises(RuntimeError):
+            workerPool.annotateRecords(variantRecords)
+        assert workerPool.startedWorkers == 0
+        assert runPersistent(workerPool, tmp_path / "persistent") == oneShot
+
+
+def test_workerThatStallsTimesOutAndFallsBackToOneShot(tmp_path, monkeypatch):
+    oneShot = runOneShot(tmp_path / "oneShot")
+    monkeypatch.setattr(vepRunner, "makePersistentVEPCommand", lambda bufferSize: [sys.executable, "-c", "import time; time.sleep(60)"])
+    variantRecords = list(vcfHandler.iterVCF(sampleVCFPath))
+    with vepRunner.PersistentVEPPool(1, str(tmp_path / "logs"), timeout=1) as workerPool:
+        with pytest.raises(TimeoutError):
+            workerPool.annotateRecords(variantRecords)
+        assert workerPool.startedWorkers == 0
+        assert runPersistent(workerPool, tmp_path / "persistent") == oneShot
+
+
+def test_persistentPoolAlwaysHasADeadline(tmp_path):
+    workerPool = vepRunner.PersistentVEPPool(1, str(tmp_path / "logs"))
+    assert workerPool.timeout == vepRunner.persistentTimeout
@@ -0,0 +1,31 @@
+import os
+from cvaSupport import variantsOfConcernHandler
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+variantsOfConcernPath = os.path.join(repoFolder, "references", "variantsOfConcern.json")
+
+
+def test_vepDeletionsMatchCuratedNotation():
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("S:IHV68-70I") == ("S", "del", 69, 70)
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("S:del69-70 HV") == ("S", "del", 69, 70)
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("ORF1ab:SGF3675-3677-") == ("ORF1ab", "del", 3675, 3677)
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("ORF1ab:del3675-3677 SGF") == ("ORF1ab", "del", 3675, 3677)
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("S:Y144-") == variantsOfConcernHandler.normalizeProteinChangeNotation("S:del144 Y")
+
+
+def test_otherChangesNormalize():
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("S:N501Y") == ("S", "sub", 501, "Y")
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("ORF8:Q27*") == ("ORF8", "sub", 27, "*")
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("S:ins214 EPE") == ("S", "ins", 214, "EPE")
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("S:D614D") is None
+    assert variantsOfConcernHandler.normalizeProteinChangeNotation("not a protein change") is None
+
+
+def test_matcherFindsVEPNotationForCuratedVariants(tmp_path):
+    matcher = variantsOfConcernHandler.loadVariantsOfConcernMatcher(variantsOfConcernPath, str(tmp_path))
+    assert os.path.isfile(tmp_path / "variantsOfConcernMatcher.pickle")
+    cachedMatcher = variantsOfConcernHandler.loadVariantsOfConcernMatcher(variantsOfConcernPath, str(tmp_path))
+    for vepNotation in ["S:IHV68-70I", "ORF1ab:SGF3675-3677-", "S:N501Y"]:
+        key = matcher.makeKey(vepNotation)
+        assert "B.1.1.7" in matcher.strainsByKey[key]
+        assert cachedMatcher.strainsByKey[key] == matcher.strainsByKey[key]
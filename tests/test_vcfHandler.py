@@ -0,0 +1,49 @@
+import os
+from cvaSupport import vcfHandler
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sampleVCFPath = os.path.join(repoFolder, "references", "in2442-23.hard-filtered.vcf.gz")
+
+
+def getBiasCounts(biasTable:vcfHandler.BiasTable):
+    if biasTable is None:
+        return None
+    return biasTable.counts
+
+
+def describeRecord(variantRecord:vcfHandler.VariantRecord):
+    return (variantRecord.contig, variantRecord.position, variantRecord.ref, str(variantRecord.alt), variantRecord.filter, variantRecord.isDeletion, variantRecord.isIndel, variantRecord.isSNV, getBiasCounts(variantRecord.strandBias), getBiasCounts(variantRecord.mateBias), variantRecord.sampleID, variantRecord.vepIdentifier)
+
+
+def test_fastParserMatchesPyVCF():
+    fastRecords = [describeRecord(variantRecord) for variantRecord in vcfHandler.iterVCF(sampleVCFPath, fastParser=True)]
+    pyvcfRecords = [describeRecord(variantRecord) for variantRecord in vcfHandler.iterVCF(sampleVCFPath, fastParser=False)]
+    assert len(fastRecords) == 125
+    assert fastRecords == pyvcfRecords
+
+
+edgeCaseVCFLines = [
+    "##fileformat=VCFv4.2",
+    "##INFO=<ID=DP4,Number=4,Type=Integer,Description=\"Strand read counts\">",
+    "##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">",
+    "##FORMAT=<ID=SB,Number=4,Type=Integer,Description=\"Strand bias\">",
+    "##FORMAT=<ID=MB,Number=4,Type=Integer,Description=\"Mate bias\">",
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tedgeCases",
+    "NC_045512.2\t241\t.\tC\tT\t.\tPASS\t.\tGT:SB:MB\t0/1:10,11,9,10:12,9,8,11",
+    "NC_045512.2\t11287\t.\tGTCTGGTTTT\tG\t.\tweak_evidence;strand_bias\t.\tGT:SB\t0/1:40,41,3,1",
+    "NC_045512.2\t22204\t.\tT\tTGAGCCAGAA\t.\t.\tDP4=30,31,2,2\tGT\t0/1",
+    "NC_045512.2\t23012\t.\tG\tA,C\t.\tPASS\tDP4=5,6,7,8\tGT:MB\t1/2:1,2,3,4",
+    "NC_045512.2\t28280\t.\tGAT\tCTA\t.\tPASS\t.\tGT:SB:MB\t0/1:1,0,20,22:1,0,21,21",
+]
+
+
+def test_fastParserMatchesPyVCFOnEdgeCases(tmp_path):
+    vcfPath = str(tmp_path / "edgeCases.vcf")
+    vcfFile = open(vcfPath, 'w')
+    for line in edgeCaseVCFLines:
+        print(line, file=vcfFile)
+    vcfFile.close()
+    fastRecords = [describeRecord(variantRecord) for variantRecord in vcfHandler.iterVCF(vcfPath, fastParser=True)]
+    pyvcfRecords = [describeRecord(variantRecord) for variantRecord in vcfHandler.iterVCF(vcfPath, fastParser=False)]
+    assert len(fastRecords) == 5
+    assert fastRecords == pyvcfRecords
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cvaSupport
+
+csqFields = ["Allele", "Consequence", "IMPACT", "SYMBOL", "Gene", "Feature_type", "Feature", "BIOTYPE", "EXON", "INTRON", "HGVSc", "HGVSp", "cDNA_position", "CDS_position", "Protein_position", "Amino_acids", "Codons", "Existing_variation", "ALLELE_NUM", "DISTANCE", "STRAND", "FLAGS"]
+perlOutputBufferBytes = 8192
+csqHeaderLine = "##INFO=<ID=CSQ,Number=.,Type=String,Description=\"Consequence annotations from Ensembl VEP. Format: %s\">" %"|".join(csqFields)
+
+
+def parseVEPArguments(arguments:list):
+    inputPath = None
+    outputPath = None
+    distance = cvaSupport.vepRunner.geneRadius
+    bufferSize = 5000
+    vcfOutput = False
+    argumentIterator = iter(arguments)
+    for argument in argumentIterator:
+        if argument == "-i":
+            inputPath = next(argumentIterator)
+        elif argument == "-o":
+            outputPath = next(argumentIterator)
+        elif argument == "-distance":
+            distance = int(next(argumentIterator))
+        elif argument == "--buffer_size":
+            bufferSize = int(next(argumentIterator))
+        elif argument == "--vcf":
+            vcfOutput = True
+        elif argument in ["-gtf", "-fasta", "-synonyms", "--format"]:
+            next(argumentIterator)
+    if not outputPath:
+        raise ValueError("The VEP stand-in needs an -o argument")
+    return inputPath, outputPath, distance, bufferSize, vcfOutput
+
+
+def annotateLines(vcfLines:list, annotator:cvaSupport.nativeAnnotator.NativeAnnotator, outputFile):
+    for vcfLine in vcfLines:
+        contig, position, recordID, ref, alts = vcfLine.rstrip("\n").split("\t")[:5]
+        alts = alts.split(",")
+        for altAlleleNumber in range(len(alts)):
+            variantRecord = cvaSupport.vcfHandler.VariantRecord.fromVCFFields(contig, int(position), ref, alts, [], altAlleleNumber=altAlleleNumber)
+            for variantEffect in annotator.annotateVariantRecord(variantRecord):
+                if recordID != ".":
+                    variantEffect.identifier = recordID
+                print(variantEffect.toVEPLine(), file=outputFile)
+
+
+def makeCSQEntry(variantEffect:cvaSupport.vepHandler.VariantEffect, alleleNumber:int):
+    extraFields = dict(note.split("=", 1) for note in variantEffect.notes.split(";") if "=" in note)
+    values = {
+        "Allele": variantEffect.allele,
+        "Consequence": variantEffect.consequence.replace(",", "&"),
+        "SYMBOL": variantEffect.gene,
+        "Gene": variantEffect.gene,
+        "Feature_type": variantEffect.featureType,
+        "Feature": variantEffect.feature,
+        "cDNA_position": variantEffect.cDNAPosition,
+        "CDS_position": variantEffect.cdsPosition,
+        "Protein_position": variantEffect.proteinPosition,
+        "Amino_acids": variantEffect.aminoAcid,
+        "Codons": variantEffect.codons,
+        "Existing_variation": variantEffect.existingVariation,
+        "ALLELE_NUM": str(alleleNumber)
+    }
+    values.update(extraFields)
+    return "|".join(["" if values.get(field) in [None, "-"] else str(values[field]) for field in csqFields])
+
+
+def annotateVCFWithCSQ(inputPath:str, outputPath:str, annotator:cvaSupport.nativeAnnotator.NativeAnnotator):
+    outputFile = open(outputPath, 'w')
+    for line in cvaSupport.fileHandling.iterLines(inputPath):
+        line = line.decode().rstrip("\r\n")
+        if line.startswith("#CHROM"):
+            print(csqHeaderLine, file=outputFile)
+        if line.startswith("#") or not line.strip():
+            print(line, file=outputFile)
+            continue
+        columns = line.split("\t")
+        contig, position, recordID, ref, alts = columns[:5]
+        alts = alts.split(",")
+        csqEntries = []
+        for altAlleleNumber in range(len(alts)):
+            variantRecord = cvaSupport.vcfHandler.VariantRecord.fromVCFFields(contig, int(position), ref, alts, [], altAlleleNumber=altAlleleNumber)
+            for variantEffect in annotator.annotateVariantRecord(variantRecord):
+                csqEntries.append(makeCSQEntry(variantEffect, altAlleleNumber + 1))
+        if csqEntries:
+            if columns[7] in [".", ""]:
+                columns[7] = "CSQ=" + ",".join(csqEntries)
+            else:
+                columns[7] += ";CSQ=" + ",".join(csqEntries)
+        print("\t".join(columns), file=outputFile)
+    outputFile.close()
+    return outputPath
+
+
+def streamAnnotations(inputFile, outputFile, annotator:cvaSupport.nativeAnnotator.NativeAnnotator, bufferSize:int):
+    print("\t".join(cvaSupport.vepCache.vepOutputColumns), file=outputFile)
+    buffer = []
+    for line in inputFile:
+        if line.startswith("#") or not line.strip():
+            continue
+        buffer.append(line)
+        if len(buffer) >= bufferSize:
+            annotateLines(buffer, annotator, outputFile)
+            buffer = []
+    annotateLines(buffer, annotator, outputFile)
+
+
+def main(arguments:list):
+    inputPath, outputPath, distance, bufferSize, vcfOutput = parseVEPArguments(arguments)
+    referenceGenome = cvaSupport.referenceGenomeHandler.ReferenceGenome(cvaSupport.syntheticCohort.localReferenceGenomePath)
+    annotator = cvaSupport.nativeAnnotator.NativeAnnotator(referenceGenome, distance)
+    if inputPath and vcfOutput:
+        annotateVCFWithCSQ(inputPath, outputPath, annotator)
+        return
+    if inputPath and outputPath != "STDOUT":
+        cvaSupport.syntheticCohort.annotateVCF(inputPath, outputPath, annotator)
+        return
+    if inputPath:
+        inputFile = open(inputPath)
+    else:
+        inputFile = sys.stdin
+    if outputPath == "STDOUT":
+        outputFile = open(sys.stdout.fileno(), 'w', buffering=perlOutputBufferBytes, closefd=False)
+    else:
+        outputFile = open(outputPath, 'w')
+    streamAnnotations(inputFile, outputFile, annotator, bufferSize)
+    outputFile.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])